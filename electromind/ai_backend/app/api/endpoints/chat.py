@@ -1,13 +1,71 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from app.schemas import ChatRequest, ChatResponse
-from app.services.llm_service import generate_ai_response
-from app.services.rag_service import search_knowledge
+from app.services.llm_service import generate_ai_response, stream_ai_response
+from app.services.rag_service import search_knowledge_matches, embed_query
+from app.services.context_builder import build_context, CONTEXT_CANDIDATES
+from app.services.answer_cache import answer_cache, context_hash, ANSWER_CACHE_ENABLED
+from app.services.conversation_store import conversation_store
+from app.services import metrics
+import json
+import uuid
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+async def _build_context(request: ChatRequest):
+    """Busca en la base de conocimientos y arma el contexto completo. Devuelve (contexto, nº de docs)."""
+    # 1. Buscar candidatos en la base de conocimientos y empaquetarlos al presupuesto de tokens
+    filters = request.filters.model_dump(exclude_none=True) if request.filters else None
+    relevant_docs = await search_knowledge_matches(request.message, match_count=CONTEXT_CANDIDATES, filters=filters)
+
+    context_text = ""
+    if relevant_docs:
+        with metrics.stage_seconds.time(stage="context_build"):
+            context_text = build_context(relevant_docs)
+        logger.info(f"Found {len(relevant_docs)} relevant docs for query")
+
+    # 2. Combinar contexto explícito (si viene del request) con el encontrado
+    full_context = ""
+    if request.context:
+        full_context += f"Contexto de la App:\n{request.context}\n\n"
+
+    if context_text:
+        full_context += f"Información de Manuales/Base de Conocimiento:\n{context_text}"
+
+    return full_context, len(relevant_docs)
+
+def _conversation(request: ChatRequest):
+    """Devuelve (conversation_id, historial compactado) del turno; sin id se abre una conversación nueva."""
+    conversation_id = request.conversation_id or uuid.uuid4().hex
+    return conversation_id, conversation_store.history(conversation_id, request.history)
+
+async def _cached_answer(request: ChatRequest, full_context: str, history: str = ""):
+    """
+    Busca una respuesta previa a una pregunta casi idéntica con el mismo contexto.
+    Devuelve (respuesta o None, embedding de la pregunta o None).
+    A mitad de una conversación no se usa: la misma pregunta depende de lo ya hablado.
+    """
+    if not ANSWER_CACHE_ENABLED or history:
+        return None, None
+    try:
+        # Ya está en el caché de embeddings por la búsqueda RAG: no gasta cuota
+        query_vector = await embed_query(request.message)
+    except Exception as e:
+        logger.warning(f"Answer cache skipped (no query embedding): {e}")
+        return None, None
+    cached = answer_cache.get(query_vector, context_hash(full_context))
+    metrics.record_cache("answer", hits=int(bool(cached)), misses=int(not cached))
+    if cached:
+        logger.info("Answer served from semantic cache")
+    return cached, query_vector
+
+def _remember_answer(query_vector, full_context: str, ai_result):
+    if query_vector is not None and isinstance(ai_result, dict) and ai_result.get("cacheable"):
+        answer_cache.put(query_vector, context_hash(full_context), ai_result)
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
     """
@@ -15,37 +73,73 @@ async def chat_endpoint(request: ChatRequest):
     Ahora busca info en la base de conocimientos (RAG).
     """
     try:
-        # 1. Buscar contexto relevante en la base de conocimientos
-        relevant_docs = await search_knowledge(request.message)
-        
-        context_text = ""
-        if relevant_docs:
-            context_text = "\n\n".join(relevant_docs)
-            logger.info(f"Found {len(relevant_docs)} relevant docs for query")
-        
-        # 2. Combinar contexto explícito (si viene del request) con el encontrado
-        full_context = ""
-        if request.context:
-            full_context += f"Contexto de la App:\n{request.context}\n\n"
-        
-        if context_text:
-            full_context += f"Información de Manuales/Base de Conocimiento:\n{context_text}"
-
-        # 3. Generar respuesta
-        ai_result = await generate_ai_response(request.message, context=full_context)
-        
-        reply_text = ""
-        action = None
-        action_data = None
-        
-        if isinstance(ai_result, dict):
-            reply_text = ai_result.get("text", "")
-            action = ai_result.get("action")
-            action_data = ai_result.get("action_data")
-        else:
-            reply_text = str(ai_result)
-
-        return ChatResponse(reply=reply_text, action=action, action_data=action_data)
+        full_context, _ = await _build_context(request)
+        conversation_id, history = _conversation(request)
+
+        # 3. Generar respuesta (o reutilizar una cacheada)
+        ai_result, query_vector = await _cached_answer(request, full_context, history)
+        if ai_result is None:
+            ai_result = await generate_ai_response(request.message, context=full_context, history=history)
+            _remember_answer(query_vector, full_context, ai_result)
+
+        reply_text = ai_result.get("text", "")
+        action = ai_result.get("action")
+        action_data = ai_result.get("action_data")
+
+        conversation_store.append(conversation_id, request.message, reply_text)
+        return ChatResponse(reply=reply_text, action=action, action_data=action_data, conversation_id=conversation_id)
     except Exception as e:
         logger.error(f"Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Igual que /chat pero responde con Server-Sent Events:
+    - retrieval: la búsqueda RAG terminó (incluye cuántos documentos se usaron)
+    - token: fragmento de texto a medida que Gemini lo genera
+    - action: el modelo pidió una acción (p. ej. register_ticket) con sus datos
+    - done: respuesta final con el mismo formato que ChatResponse
+    - error: fallo interno
+    """
+    async def event_stream():
+        try:
+            full_context, docs_found = await _build_context(request)
+            conversation_id, history = _conversation(request)
+            yield _sse("retrieval", {"documents": docs_found})
+
+            cached, query_vector = await _cached_answer(request, full_context, history)
+            if cached:
+                conversation_store.append(conversation_id, request.message, cached.get("text", ""))
+                yield _sse("token", {"text": cached.get("text", "")})
+                yield _sse("done", ChatResponse(reply=cached.get("text", ""), conversation_id=conversation_id).model_dump())
+                return
+
+            async for event in stream_ai_response(request.message, context=full_context, history=history):
+                event_type = event.pop("type")
+                if event_type == "done":
+                    _remember_answer(query_vector, full_context, event)
+                    conversation_store.append(conversation_id, request.message, event.get("text", ""))
+                if event_type in ("done", "action"):
+                    payload = ChatResponse(
+                        reply=event.get("text", ""),
+                        action=event.get("action"),
+                        action_data=event.get("action_data"),
+                        conversation_id=conversation_id
+                    ).model_dump()
+                    yield _sse(event_type, payload)
+                else:
+                    yield _sse(event_type, event)
+        except Exception as e:
+            logger.error(f"Error in chat stream endpoint: {e}")
+            yield _sse("error", {"text": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Evita que proxies (nginx) acumulen la respuesta antes de enviarla
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,65 +1,69 @@
-import asyncio
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from app.services.pdf_parser import extract_text_from_pdf, chunk_text
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from typing import Optional
+from app.schemas import IngestJobStatus
 from app.services.rag_service import store_knowledge
+from app.services.ingest_jobs import submit_pdf_job, get_job, resume_job
+from app.services.executor import run_blocking
 import logging
+import uuid
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-@router.post("/ingest/pdf")
-async def ingest_pdf(file: UploadFile = File(...)):
+@router.post("/ingest/pdf", response_model=IngestJobStatus, status_code=202)
+async def ingest_pdf(
+    file: UploadFile = File(...),
+    device_brand: Optional[str] = Form(None),
+    device_model: Optional[str] = Form(None),
+    document_id: Optional[str] = Form(None)
+):
     """
-    Sube un PDF, extrae el texto, lo divide en chunks y genera embeddings.
+    Sube un PDF y encola su ingesta (extraer, dividir en chunks, generar embeddings)
+    como job en segundo plano. El progreso se consulta en /ingest/jobs/{job_id}.
+    Marca y modelo opcionales permiten filtrar la búsqueda por dispositivo y, junto con el
+    nombre, identifican el manual al re-subirlo. `document_id` fija explícitamente qué
+    documento se reemplaza.
     """
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="File must be a PDF")
 
-    try:
-        content = await file.read()
-        text = extract_text_from_pdf(content)
-        
-        if not text:
-            raise HTTPException(status_code=400, detail="Could not extract text from PDF")
-
-        chunks = chunk_text(text)
-        
-        saved_count = 0
-        for i, chunk in enumerate(chunks):
-            metadata = {
-                "source": file.filename,
-                "chunk_index": i,
-                "total_chunks": len(chunks)
-            }
-            try:
-                await store_knowledge(chunk, metadata, source_type="manual")
-                saved_count += 1
-                
-                # Rate Limiting: Pausa de 4 segundos para respetar el límite de 15 RPM (Free Tier)
-                if i < len(chunks) - 1: # No esperar en el último
-                    await asyncio.sleep(4)
-                    
-            except Exception as e:
-                logger.error(f"Error storing chunk {i}: {e}")
-                # Continue preventing total failure if one chunk fails
-                continue
-                
-        return {
-            "message": f"Successfully processed {file.filename}",
-            "chunks_created": len(chunks),
-            "chunks_stored": saved_count
-        }
+    if document_id:
+        try:
+            document_id = str(uuid.UUID(document_id))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid document_id")
 
+    try:
+        job_id = await submit_pdf_job(file.file, file.filename, device_brand, device_model, document_id)
+        return await run_blocking(get_job, job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error during ingestion: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/ingest/jobs/{job_id}", response_model=IngestJobStatus)
+async def get_ingest_job(job_id: str):
+    """Estado y progreso (chunks procesados, omitidos y fallidos) de un job de ingesta."""
+    job = await run_blocking(get_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/ingest/jobs/{job_id}/resume", response_model=IngestJobStatus)
+async def resume_ingest_job(job_id: str):
+    """Reanuda un job pausado (cuota agotada) o fallido desde el último chunk confirmado."""
+    if not await resume_job(job_id):
+        raise HTTPException(status_code=409, detail="Job cannot be resumed")
+    return await run_blocking(get_job, job_id)
+
 @router.post("/ingest/solution")
 async def ingest_solution(
     solution_text: str,
     ticket_id: str,
     device_model: str,
-    category: str = "repair_guide"
+    category: str = "repair_guide",
+    device_brand: Optional[str] = None
 ):
     """
     Ingesta una solución técnica de un ticket cerrado manualmente.
@@ -77,6 +81,8 @@ async def ingest_solution(
             "device_model": device_model,
             "type": "ticket_solution"
         }
+        if device_brand:
+            metadata["device_brand"] = device_brand
 
         # Guardar en knowledge base
         await store_knowledge(content, metadata, source_type="ticket_solution")
@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+from typing import List
+from app.schemas import QuotaStatus
+from app.services.rate_limiter import embedding_limiter, generation_limiter
+
+router = APIRouter()
+
+@router.get("/quota", response_model=List[QuotaStatus])
+async def quota_status():
+    """Presupuesto diario restante de cada modelo de Gemini y requests en cola por prioridad."""
+    return [limiter.status() for limiter in (embedding_limiter, generation_limiter)]
@@ -0,0 +1,25 @@
+import os
+from fastapi import APIRouter, Header, HTTPException
+from app.services.tickets_service import invalidate_tickets_cache
+import logging
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Secreto compartido con el Database Webhook de Supabase (header X-Webhook-Secret)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
+@router.post("/webhooks/tickets")
+async def tickets_changed(payload: dict, x_webhook_secret: str = Header(None)):
+    """
+    Recibe el Database Webhook de Supabase para INSERT/UPDATE/DELETE en 'tickets' y 'clients'
+    e invalida los resultados cacheados de list_tickets.
+    El caché es por proceso: solo se limpia en el worker que recibe el webhook; en los demás
+    los resultados expiran a los TICKETS_CACHE_TTL_SECONDS.
+    """
+    if WEBHOOK_SECRET and x_webhook_secret != WEBHOOK_SECRET:
+        raise HTTPException(status_code=401, detail="Invalid webhook secret")
+
+    invalidate_tickets_cache()
+    logger.info(f"Tickets cache invalidated ({payload.get('type')} on {payload.get('table')})")
+    return {"status": "ok"}
@@ -1,10 +1,61 @@
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+
+# Antes de importar la app: los módulos leen su configuración del entorno al cargarse
+load_dotenv()
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.api.endpoints import chat, ingest, webhooks, quota
+from app.services.ingest_jobs import resume_pending_jobs
+from app.services.rag_service import init_vector_index, get_supabase_client
+from app.services.model_registry import get_chat_model
+from app.services.executor import run_blocking
+from app.services.metrics import render_metrics
+
+logger = logging.getLogger(__name__)
+
+# Importar los SDK (Gemini, Supabase) y crear el modelo del chat antes de marcar /ready.
+# Con false se crean en la primera request que los necesite.
+APP_WARMUP = os.getenv("APP_WARMUP", "true").lower() in ("1", "true", "yes")
+
+
+async def _startup(app: FastAPI):
+    """Arranque en segundo plano: /health responde enseguida y /ready cuando esto termina."""
+    try:
+        # Retomar ingestas que quedaron a medias antes de un reinicio
+        await resume_pending_jobs()
+        if APP_WARMUP:
+            await run_blocking(get_supabase_client)
+            # Crear una sola vez el modelo del chat (y su context cache si está habilitado)
+            await run_blocking(get_chat_model)
+        # Espejo en memoria de knowledge_base (opcional, VECTOR_INDEX_ENABLED)
+        await init_vector_index()
+    except Exception as e:
+        # Sin warm-up la app sigue funcionando: los clientes se crean en la primera request
+        logger.error(f"Error durante el arranque: {e}")
+    app.state.ready = True
+    logger.info("Backend listo para recibir tráfico")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    startup = asyncio.create_task(_startup(app))
+    yield
+    startup.cancel()
+
+
 app = FastAPI(
     title="ElectroMind AI Backend",
     description="Microservice for AI/RAG operations using Gemini Pro",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -15,10 +66,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-from app.api.endpoints import chat, ingest
-
 app.include_router(chat.router, prefix="/api/v1", tags=["chat"])
 app.include_router(ingest.router, prefix="/api/v1", tags=["ingest"])
+app.include_router(webhooks.router, prefix="/api/v1", tags=["webhooks"])
+app.include_router(quota.router, prefix="/api/v1", tags=["quota"])
 
 @app.get("/")
 def read_root():
@@ -26,4 +77,17 @@ def read_root():
 
 @app.get("/health")
 def health_check():
+    # Liveness: el proceso responde (no depende de Gemini ni de Supabase)
     return {"status": "healthy"}
+
+@app.get("/ready")
+def readiness_check():
+    # Readiness: 503 hasta que terminó el arranque (clientes, modelo del chat, índice en memoria)
+    if not getattr(app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    # Formato de texto de Prometheus (latencia por etapa, cachés, cuotas)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,15 +1,26 @@
 from pydantic import BaseModel
 from typing import Optional, List, Dict
 
+class SearchFilters(BaseModel):
+    """Restringe la búsqueda RAG a una porción de la base de conocimientos."""
+    source_type: Optional[str] = None # "manual" | "ticket_solution"
+    device_brand: Optional[str] = None
+    device_model: Optional[str] = None
+    document_id: Optional[str] = None # Fila de documents (un manual concreto)
+
 class ChatRequest(BaseModel):
     message: str
     context: Optional[str] = None
     history: Optional[List[Dict[str, str]]] = [] # List of {"role": "user"|"model", "content": "..."}
+    filters: Optional[SearchFilters] = None
+    # Conversación guardada en el servidor; sin id se crea una nueva (ver ChatResponse)
+    conversation_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     reply: str
     action: Optional[str] = None # Ejemplo: "register_ticket"
     action_data: Optional[Dict] = None # Datos para la acción
+    conversation_id: Optional[str] = None # Enviarlo en el siguiente turno en lugar del historial
 
 class TicketRegistration(BaseModel):
     client_name: str
@@ -18,3 +29,26 @@ class TicketRegistration(BaseModel):
     brand: str
     model: str
     problem_description: str
+
+class IngestJobStatus(BaseModel):
+    id: str
+    filename: str
+    status: str # queued | running | paused | completed | failed
+    chunks_done: int = 0
+    chunks_stored: int = 0
+    chunks_skipped: int = 0
+    chunks_failed: int = 0
+    chunks_removed: int = 0
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+class QuotaStatus(BaseModel):
+    name: str
+    rpm: int
+    rpd: Optional[int] = None
+    used_today: int
+    remaining_today: Optional[int] = None
+    interactive_reserve: int = 0 # requests diarias que la ingesta no puede usar
+    seconds_until_reset: int
+    waiting: Dict[str, int] # requests en cola: {"interactive": n, "bulk": n}
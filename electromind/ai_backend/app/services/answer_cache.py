@@ -0,0 +1,107 @@
+import os
+import math
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Caché semántico de respuestas: preguntas casi idénticas con el mismo contexto
+# recuperado se responden sin llamar al LLM (cuota de 20 RPD).
+# El caché es de cada proceso. invalidate_answer_cache limpia el del worker que guardó los
+# chunks; en los demás solo lo limpia la sincronización del índice en memoria
+# (VECTOR_INDEX_ENABLED, apagado por defecto). Sin ella una respuesta vive hasta
+# ANSWER_CACHE_TTL_SECONDS después de una re-ingesta en otro worker. Como la clave incluye
+# el hash del contexto, eso solo pasa si los chunks recuperados para la pregunta no cambiaron.
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+
+
+def context_hash(context: str) -> str:
+    return hashlib.sha256((context or "").encode("utf-8")).hexdigest()
+
+
+def _normalize(vector):
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class AnswerCache:
+    """
+    Entradas agrupadas por hash del contexto: solo se compara la similitud del
+    embedding de la pregunta contra respuestas generadas con el mismo contexto.
+    Expira por TTL y se vacía cuando cambia knowledge_base.
+    """
+
+    def __init__(self, ttl: int, similarity: float, max_entries: int):
+        self.ttl = ttl
+        self.similarity = similarity
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # context_hash -> OrderedDict(entry_id -> (vector, response, created_at))
+        self._buckets = {}
+        # Orden global de inserción para la evicción por tamaño
+        self._order = OrderedDict()
+        self._next_id = 0
+
+    def get(self, query_vector, ctx_hash: str):
+        query = _normalize(query_vector)
+        now = time.time()
+        with self._lock:
+            bucket = self._buckets.get(ctx_hash)
+            if not bucket:
+                return None
+            best, best_score = None, self.similarity
+            for entry_id, (vector, response, created_at) in list(bucket.items()):
+                if now - created_at > self.ttl:
+                    self._remove(entry_id, ctx_hash)
+                    continue
+                score = sum(a * b for a, b in zip(query, vector))
+                if score >= best_score:
+                    best, best_score = response, score
+            return dict(best) if best else None
+
+    def put(self, query_vector, ctx_hash: str, response: dict):
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._buckets.setdefault(ctx_hash, OrderedDict())[entry_id] = (
+                _normalize(query_vector), dict(response), time.time()
+            )
+            self._order[entry_id] = ctx_hash
+            while len(self._order) > self.max_entries:
+                oldest_id, oldest_hash = next(iter(self._order.items()))
+                self._remove(oldest_id, oldest_hash)
+
+    def _remove(self, entry_id, ctx_hash):
+        bucket = self._buckets.get(ctx_hash)
+        if bucket is not None:
+            bucket.pop(entry_id, None)
+            if not bucket:
+                del self._buckets[ctx_hash]
+        self._order.pop(entry_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._order.clear()
+
+    def __len__(self):
+        return len(self._order)
+
+
+answer_cache = AnswerCache(ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_SIMILARITY, ANSWER_CACHE_MAX_ENTRIES)
+
+
+def invalidate_answer_cache():
+    """
+    Llamar cuando cambia knowledge_base: las respuestas pueden haber quedado obsoletas.
+    Solo limpia el caché de este proceso (los otros workers expiran por TTL).
+    """
+    if len(answer_cache):
+        logger.info("Knowledge base changed, clearing answer cache")
+    answer_cache.clear()
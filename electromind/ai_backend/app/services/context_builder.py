@@ -0,0 +1,162 @@
+import os
+import re
+import logging
+
+from app.services.pdf_parser import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Presupuesto fijo de tokens para el contexto RAG que se envía al LLM
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Candidatos que se piden a la búsqueda antes de seleccionar
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "12"))
+# MMR: 1.0 = solo relevancia, 0.0 = solo diversidad
+MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+# Dos chunks con esta similitud léxica (Jaccard de shingles) se consideran el mismo texto
+NEAR_DUPLICATE_JACCARD = 0.8
+MIN_OVERLAP_CHARS = 20
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _merge_overlapping(first: str, second: str) -> str:
+    """Une dos chunks contiguos quitando el texto que el segundo repite del primero."""
+    first_lines = first.split("\n", 1)
+    second_lines = second.split("\n", 1)
+    # Chunks de la misma sección repiten el título en la primera línea
+    if len(second_lines) == 2 and second_lines[0] == first_lines[0]:
+        second = second_lines[1]
+
+    max_k = min(len(first), len(second))
+    for k in range(max_k, MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:k]):
+            return first + second[k:]
+    return f"{first}\n{second}"
+
+
+def _document_key(item: dict):
+    """
+    Documento del chunk: el nombre del archivo no alcanza (dos "manual.pdf" de equipos
+    distintos), se agrega el dispositivo y el source_id cuando la búsqueda lo devuelve.
+    """
+    metadata = item.get("metadata") or {}
+    return (metadata.get("source"), metadata.get("device_brand"), metadata.get("device_model"), item.get("source_id"))
+
+
+def _source_label(item: dict) -> str:
+    metadata = item.get("metadata") or {}
+    source = metadata.get("source")
+    device = " ".join(str(metadata[key]) for key in ("device_brand", "device_model") if metadata.get(key))
+    if source and device:
+        return f"{source} ({device})"
+    return source
+
+
+def _relevance(item: dict) -> float:
+    # Búsqueda híbrida: score RRF normalizado; solo vectorial: similitud coseno
+    value = item.get("score")
+    if value is None:
+        value = item.get("similarity")
+    return value or 0.0
+
+
+def _select_mmr(candidates: list[dict], budget: int) -> list[dict]:
+    """
+    Selección greedy por Maximal Marginal Relevance dentro del presupuesto de tokens.
+    La redundancia se mide léxicamente (la RPC no devuelve los embeddings de los candidatos).
+    """
+    remaining = list(candidates)
+    selected = []
+    used = 0
+    while remaining:
+        best, best_score = None, None
+        for cand in remaining:
+            redundancy = max((_jaccard(cand["_shingles"], s["_shingles"]) for s in selected), default=0.0)
+            score = MMR_LAMBDA * _relevance(cand) - (1 - MMR_LAMBDA) * redundancy
+            if best_score is None or score > best_score:
+                best, best_score = cand, score
+        remaining.remove(best)
+        if used + best["_tokens"] > budget:
+            # No cabe: probar con los siguientes (pueden ser más cortos)
+            continue
+        selected.append(best)
+        used += best["_tokens"]
+    return selected
+
+
+def build_context(matches: list[dict], token_budget: int = None) -> str:
+    """
+    Arma el contexto RAG a partir de las filas de search_knowledge_matches:
+    descarta casi-duplicados, diversifica con MMR hasta el presupuesto de tokens
+    y une chunks contiguos del mismo documento.
+    """
+    if token_budget is None:
+        token_budget = CONTEXT_TOKEN_BUDGET
+    if not matches:
+        return ""
+
+    # 1. Descartar casi-duplicados (las filas vienen ordenadas por relevancia: gana la primera)
+    candidates = []
+    for match in matches:
+        text = match.get("content_chunk") or ""
+        if not text.strip():
+            continue
+        shingles = _shingles(text)
+        if any(_jaccard(shingles, c["_shingles"]) >= NEAR_DUPLICATE_JACCARD for c in candidates):
+            continue
+        candidates.append({**match, "_shingles": shingles, "_tokens": estimate_tokens(text)})
+
+    # 2. MMR dentro del presupuesto
+    selected = _select_mmr(candidates, token_budget)
+
+    # 3. Agrupar por documento y unir chunks con chunk_index consecutivo
+    groups = []
+    by_document = {}
+    for item in selected:
+        metadata = item.get("metadata") or {}
+        if metadata.get("source") is None or metadata.get("chunk_index") is None:
+            groups.append([item])
+            continue
+        by_document.setdefault(_document_key(item), []).append(item)
+
+    for items in by_document.values():
+        items.sort(key=lambda it: it["metadata"]["chunk_index"])
+        run = [items[0]]
+        for item in items[1:]:
+            if item["metadata"]["chunk_index"] == run[-1]["metadata"]["chunk_index"] + 1:
+                run.append(item)
+            else:
+                groups.append(run)
+                run = [item]
+        groups.append(run)
+
+    # Los bloques más relevantes primero
+    groups.sort(key=lambda run: max(_relevance(it) for it in run), reverse=True)
+
+    blocks = []
+    for run in groups:
+        text = run[0]["content_chunk"]
+        for item in run[1:]:
+            text = _merge_overlapping(text, item["content_chunk"])
+        source = _source_label(run[0])
+        blocks.append(f"[Fuente: {source}]\n{text}" if source else text)
+
+    context = "\n\n".join(blocks)
+    logger.info(
+        f"Context built: {len(matches)} candidates -> {len(selected)} chunks in {len(blocks)} blocks "
+        f"(~{estimate_tokens(context)} tokens)"
+    )
+    return context
@@ -0,0 +1,160 @@
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from app.services.pdf_parser import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Conversaciones del chat guardadas en el servidor (por conversation_id): la app ya no
+# necesita reenviar todo el historial en cada turno. Es memoria del proceso: con varios
+# workers hace falta afinidad de sesión, o la app reenvía `history` y se reconstruye.
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "1000"))
+CONVERSATION_TTL_SECONDS = int(os.getenv("CONVERSATION_TTL_SECONDS", "7200"))
+# Presupuesto fijo de tokens del historial que se envía al LLM (resumen + últimos turnos)
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "800"))
+# Parte del presupuesto reservada al resumen de los turnos antiguos
+CONVERSATION_SUMMARY_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "250"))
+# Cada turno compactado queda como una línea del resumen de como mucho estos tokens
+SUMMARY_LINE_TOKENS = 40
+
+ROLE_LABELS = {"user": "Técnico", "model": "Asistente"}
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def _clip(text: str, max_tokens: int, keep_end: bool = False) -> str:
+    """Recorta el texto a ~max_tokens (por el principio o por el final)."""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return "…" + text[-max_chars:] if keep_end else text[:max_chars] + "…"
+
+
+def _summarize_turn(role: str, content: str) -> str:
+    """
+    Resumen extractivo de un turno: sus primeras oraciones hasta SUMMARY_LINE_TOKENS.
+    No usa el LLM: resumir con Gemini gastaría la cuota diaria de generación.
+    """
+    text = " ".join(content.split())
+    summary = ""
+    for sentence in _SENTENCE_RE.split(text):
+        candidate = f"{summary} {sentence}".strip()
+        if summary and estimate_tokens(candidate) > SUMMARY_LINE_TOKENS:
+            break
+        summary = candidate
+    return f"{ROLE_LABELS.get(role, role)}: {_clip(summary, SUMMARY_LINE_TOKENS)}"
+
+
+class Conversation:
+    """Resumen de los turnos antiguos + los últimos turnos completos."""
+
+    def __init__(self):
+        self.summary = []
+        self.turns = []
+        self.updated_at = time.time()
+
+    def add(self, role: str, content: str):
+        if content:
+            self.turns.append({"role": role, "content": content})
+            self.updated_at = time.time()
+
+    def _summary_text(self) -> str:
+        return "\n".join(f"- {line}" for line in self.summary)
+
+    def _turns_text(self) -> str:
+        return "\n".join(f"{ROLE_LABELS.get(t['role'], t['role'])}: {t['content']}" for t in self.turns)
+
+    def compact(self, token_budget: int, summary_tokens: int):
+        """Pasa los turnos más antiguos al resumen hasta que todo entra en token_budget."""
+        while len(self.turns) > 1 and estimate_tokens(self.render()) > token_budget:
+            turn = self.turns.pop(0)
+            self.summary.append(_summarize_turn(turn["role"], turn["content"]))
+            # La primera línea suele describir el equipo y la falla: se conserva
+            while len(self.summary) > 2 and estimate_tokens(self._summary_text()) > summary_tokens:
+                del self.summary[1]
+        if self.turns and estimate_tokens(self.render()) > token_budget:
+            # Un solo turno que no entra: se conserva su final (lo más reciente)
+            available = max(1, token_budget - estimate_tokens(self._summary_text()))
+            self.turns[-1]["content"] = _clip(self.turns[-1]["content"], available, keep_end=True)
+
+    def render(self) -> str:
+        parts = []
+        if self.summary:
+            parts.append(f"Resumen de lo anterior:\n{self._summary_text()}")
+        if self.turns:
+            parts.append(f"Últimos mensajes:\n{self._turns_text()}")
+        return "\n\n".join(parts)
+
+
+class ConversationStore:
+    """
+    Conversaciones en memoria con evicción LRU (CONVERSATION_MAX_SESSIONS) y expiración
+    por inactividad (CONVERSATION_TTL_SECONDS). Cada conversación se compacta al
+    presupuesto de tokens al agregar turnos, así el prompt no crece con la charla.
+    """
+
+    def __init__(self, max_sessions: int, ttl: int, token_budget: int, summary_tokens: int):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    def _get(self, conversation_id: str):
+        conversation = self._sessions.get(conversation_id)
+        if conversation is None:
+            return None
+        if time.time() - conversation.updated_at > self.ttl:
+            del self._sessions[conversation_id]
+            return None
+        self._sessions.move_to_end(conversation_id)
+        return conversation
+
+    def _store(self, conversation_id: str, conversation: Conversation):
+        self._sessions[conversation_id] = conversation
+        self._sessions.move_to_end(conversation_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def history(self, conversation_id: str, fallback: list[dict] = None) -> str:
+        """
+        Historial compactado de la conversación para el prompt ("" si es nueva).
+        Si el servidor no la conoce (reinició, expiró u otro worker) y la app envía
+        `fallback` ({"role", "content"}), se reconstruye a partir de él.
+        """
+        with self._lock:
+            conversation = self._get(conversation_id)
+            if conversation is None and fallback:
+                conversation = Conversation()
+                for turn in fallback:
+                    conversation.add(turn.get("role", "user"), turn.get("content", ""))
+                conversation.compact(self.token_budget, self.summary_tokens)
+                self._store(conversation_id, conversation)
+                logger.info(f"Conversation {conversation_id} rebuilt from {len(fallback)} client turns")
+            return conversation.render() if conversation else ""
+
+    def append(self, conversation_id: str, message: str, reply: str):
+        """Registra un turno (pregunta del técnico + respuesta) y compacta."""
+        with self._lock:
+            conversation = self._get(conversation_id) or Conversation()
+            conversation.add("user", message)
+            conversation.add("model", reply)
+            conversation.compact(self.token_budget, self.summary_tokens)
+            self._store(conversation_id, conversation)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+conversation_store = ConversationStore(
+    CONVERSATION_MAX_SESSIONS, CONVERSATION_TTL_SECONDS, CONVERSATION_TOKEN_BUDGET, CONVERSATION_SUMMARY_TOKENS
+)
@@ -0,0 +1,120 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+
+logger = logging.getLogger(__name__)
+
+# Caché de embeddings en disco (SQLite en modo WAL): sobrevive reinicios y la
+# comparten todos los workers de uvicorn de la misma máquina.
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "20000"))
+
+
+def normalize_text(text: str) -> str:
+    """Colapsa espacios y saltos de línea; es el texto que se embebe y se hashea."""
+    return " ".join(text.split())
+
+
+def cache_key(text: str, model: str, task_type: str) -> str:
+    payload = f"{model}\x1f{task_type}\x1f{normalize_text(text)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Mapa hash(texto normalizado, modelo, task_type) -> vector float32.
+    Cuando supera max_entries elimina las entradas usadas hace más tiempo.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 no permite compartir conexiones entre hilos: una por hilo del pool
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys: list[str]) -> dict:
+        """Devuelve {key: vector} para las claves presentes."""
+        if not keys:
+            return {}
+        conn = self._conn()
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        # SQLite limita el número de parámetros por sentencia
+        for i in range(0, len(unique_keys), 500):
+            batch = unique_keys[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = array("f", blob).tolist()
+        if found:
+            now = time.time()
+            conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                [(now, key) for key in found]
+            )
+            conn.commit()
+        return found
+
+    def put_many(self, items: dict):
+        """Guarda {key: vector} y aplica la evicción por tamaño."""
+        if not items:
+            return
+        conn = self._conn()
+        now = time.time()
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+            [(key, array("f", vector).tobytes(), now) for key, vector in items.items()]
+        )
+        count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count > self.max_entries:
+            # Borrar un 10% extra para no evictar en cada escritura
+            excess = count - int(self.max_entries * 0.9)
+            conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (excess,)
+            )
+            logger.info(f"Embedding cache: evicted {excess} entries")
+        conn.commit()
+
+
+_cache = None
+
+
+def get_embedding_cache():
+    """Instancia compartida del caché; None si no se pudo abrir (se trabaja sin caché)."""
+    global _cache
+    if _cache is None:
+        try:
+            _cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES)
+        except Exception as e:
+            logger.error(f"Error abriendo el caché de embeddings: {e}")
+            return None
+    return _cache
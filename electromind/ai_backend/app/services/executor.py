@@ -0,0 +1,16 @@
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+# Pool acotado para las llamadas bloqueantes de I/O (SDK de Gemini, supabase-py).
+# Evita bloquear el event loop sin crear hilos sin límite bajo carga.
+IO_WORKERS = int(os.getenv("IO_WORKERS", "16"))
+
+_io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="electromind-io")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Ejecuta una función síncrona en el pool de I/O y espera su resultado sin bloquear el loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_io_executor, functools.partial(func, *args, **kwargs))
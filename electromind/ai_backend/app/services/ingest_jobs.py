@@ -0,0 +1,354 @@
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import logging
+import threading
+from itertools import islice
+
+from app.services.pdf_parser import spool_upload, count_pages, iter_pdf_pages, iter_chunks
+from app.services.rag_service import (
+    store_knowledge_batch, EMBED_BATCH_SIZE, content_hash,
+    ensure_document, document_chunk_hashes, sync_document_chunks
+)
+from app.services.rate_limiter import QuotaExceededError
+from app.services.executor import run_blocking
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Estado de los jobs en SQLite + PDFs en disco: sobreviven a un reinicio del worker
+INGEST_JOBS_DB = os.getenv("INGEST_JOBS_DB", ".cache/ingest_jobs.sqlite3")
+INGEST_JOBS_DIR = os.getenv("INGEST_JOBS_DIR", ".cache/ingest_jobs")
+# Un job 'running' sin heartbeat durante este tiempo se considera huérfano y se retoma
+JOB_STALE_SECONDS = int(os.getenv("INGEST_JOB_STALE_SECONDS", "120"))
+HEARTBEAT_SECONDS = 30
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+JOB_FIELDS = (
+    "id", "filename", "status", "chunks_done", "chunks_stored", "chunks_skipped",
+    "chunks_failed", "chunks_removed", "error", "created_at", "updated_at"
+)
+# Columnas agregadas después de la primera versión de la tabla (bases ya creadas)
+_ADDED_COLUMNS = {
+    "document_id": "TEXT",
+    "chunks_removed": "INTEGER NOT NULL DEFAULT 0",
+    "device_brand": "TEXT",
+    "device_model": "TEXT",
+}
+
+_local = threading.local()
+# job_id -> Task de los jobs que procesa este worker
+_running_jobs = {}
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        directory = os.path.dirname(INGEST_JOBS_DB)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(INGEST_JOBS_DB, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingest_jobs ("
+            " id TEXT PRIMARY KEY,"
+            " filename TEXT NOT NULL,"
+            " pdf_path TEXT NOT NULL,"
+            " status TEXT NOT NULL,"  # queued | running | paused | completed | failed
+            " chunks_done INTEGER NOT NULL DEFAULT 0,"  # siguiente chunk a procesar
+            " chunks_stored INTEGER NOT NULL DEFAULT 0,"
+            " chunks_skipped INTEGER NOT NULL DEFAULT 0,"
+            " chunks_failed INTEGER NOT NULL DEFAULT 0,"
+            " chunks_removed INTEGER NOT NULL DEFAULT 0,"  # chunks de la versión anterior borrados
+            " document_id TEXT,"  # fila de documents a la que se vinculan los chunks
+            " device_brand TEXT,"  # metadata de los chunks para filtrar la búsqueda
+            " device_model TEXT,"
+            " error TEXT,"
+            " owner TEXT,"
+            " heartbeat REAL,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(ingest_jobs)")}
+        for column, definition in _ADDED_COLUMNS.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE ingest_jobs ADD COLUMN {column} {definition}")
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+
+def _create_job(
+    fileobj,
+    filename: str,
+    device_brand: str = None,
+    device_model: str = None,
+    document_id: str = None
+) -> str:
+    os.makedirs(INGEST_JOBS_DIR, exist_ok=True)
+    # Temporal en el mismo directorio: el rename es atómico y no cruza sistemas de archivos
+    tmp_path = spool_upload(fileobj, directory=INGEST_JOBS_DIR)
+    job_id = uuid.uuid4().hex
+    pdf_path = os.path.join(INGEST_JOBS_DIR, f"{job_id}.pdf")
+    try:
+        try:
+            count_pages(tmp_path)
+        except Exception:
+            raise ValueError("Invalid or unreadable PDF")
+        os.replace(tmp_path, pdf_path)
+
+        now = time.time()
+        conn = _conn()
+        conn.execute(
+            "INSERT INTO ingest_jobs"
+            " (id, filename, pdf_path, status, device_brand, device_model, document_id, created_at, updated_at) "
+            "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?, ?)",
+            (job_id, filename, pdf_path, device_brand, device_model, document_id, now, now)
+        )
+        conn.commit()
+    except Exception:
+        # Sin job registrado no queda ningún PDF huérfano en disco
+        for path in (tmp_path, pdf_path):
+            if os.path.exists(path):
+                os.unlink(path)
+        raise
+    return job_id
+
+
+def get_job(job_id: str):
+    """Estado público del job (sin rutas internas), o None si no existe."""
+    row = _conn().execute("SELECT * FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+    if not row:
+        return None
+    return {field: row[field] for field in JOB_FIELDS}
+
+
+def _claim_job(job_id: str):
+    """Toma el job para este worker si nadie más lo está procesando. Devuelve la fila o None."""
+    now = time.time()
+    conn = _conn()
+    cursor = conn.execute(
+        "UPDATE ingest_jobs SET status = 'running', owner = ?, heartbeat = ?, updated_at = ? "
+        "WHERE id = ? AND status IN ('queued', 'running', 'paused') "
+        "AND (owner IS NULL OR owner = ? OR heartbeat < ?)",
+        (WORKER_ID, now, now, job_id, WORKER_ID, now - JOB_STALE_SECONDS)
+    )
+    conn.commit()
+    if cursor.rowcount == 0:
+        return None
+    return conn.execute("SELECT * FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def _update_job(job_id: str, **fields):
+    fields["updated_at"] = time.time()
+    fields["heartbeat"] = fields["updated_at"]
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    conn = _conn()
+    conn.execute(
+        f"UPDATE ingest_jobs SET {assignments} WHERE id = ? AND owner = ?",
+        (*fields.values(), job_id, WORKER_ID)
+    )
+    conn.commit()
+
+
+def _pending_job_ids(include_paused: bool) -> list[str]:
+    statuses = "('queued', 'running', 'paused')" if include_paused else "('queued', 'running')"
+    rows = _conn().execute(
+        f"SELECT id FROM ingest_jobs WHERE status IN {statuses} "
+        "AND (owner IS NULL OR heartbeat < ?) ORDER BY created_at",
+        (time.time() - JOB_STALE_SECONDS,)
+    ).fetchall()
+    return [row["id"] for row in rows]
+
+
+async def _heartbeat(job_id: str):
+    while True:
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+        await run_blocking(_update_job, job_id)
+
+
+async def run_job(job_id: str):
+    """
+    Procesa un job desde su último chunk confirmado (chunks_done).
+    Los chunks anteriores se vuelven a extraer del PDF pero no se re-embeben.
+    Re-subir un manual es incremental: los chunks cuyo hash ya está guardado para el
+    documento se saltan antes de embeber, y al completar se borran los que ya no existen.
+    """
+    job = await run_blocking(_claim_job, job_id)
+    if not job:
+        logger.info(f"Ingest job {job_id} already owned by another worker or finished")
+        return
+
+    filename = job["filename"]
+    done = job["chunks_done"]
+    stored = job["chunks_stored"]
+    skipped = job["chunks_skipped"]
+    # Al reanudar se reintenta el lote que falló: los fallos se cuentan de nuevo
+    failed = 0
+    if done:
+        logger.info(f"Resuming ingest job {job_id} ({filename}) from chunk {done}")
+
+    device = {key: job[key] for key in ("device_brand", "device_model") if job[key]}
+    heartbeat = asyncio.create_task(_heartbeat(job_id))
+    chunk_iter = iter_chunks(iter_pdf_pages(job["pdf_path"]), source_type="manual")
+    try:
+        document_id = job["document_id"]
+        if not document_id:
+            document_id = await ensure_document(filename, job["device_brand"], job["device_model"])
+            await run_blocking(_update_job, job_id, document_id=document_id)
+        known_hashes = await document_chunk_hashes(document_id, filename, job["device_brand"], job["device_model"])
+
+        # Saltar lo ya procesado antes del reinicio (sus hashes hacen falta para cerrar la versión)
+        hashes = await run_blocking(lambda: [content_hash(chunk) for chunk in islice(chunk_iter, done)])
+
+        while True:
+            # Extracción de texto + chunking del siguiente lote
+            with metrics.stage_seconds.time(stage="pdf_parse"):
+                batch = await run_blocking(lambda: list(islice(chunk_iter, EMBED_BATCH_SIZE)))
+            if not batch:
+                break
+
+            batch_hashes = [content_hash(chunk) for chunk in batch]
+            # Solo se embeben los chunks nuevos o editados
+            changed = [offset for offset, chunk_hash in enumerate(batch_hashes) if chunk_hash not in known_hashes]
+            metadatas = [{"source": filename, "chunk_index": done + offset, **device} for offset in changed]
+            try:
+                if changed:
+                    result = await store_knowledge_batch(
+                        [batch[offset] for offset in changed], metadatas,
+                        source_type="manual", source_id=document_id
+                    )
+                    stored += result["stored"]
+                    skipped += len(result["skipped"])
+                skipped += len(batch) - len(changed)
+                known_hashes.update(batch_hashes)
+            except QuotaExceededError as e:
+                # Se pausa sin avanzar: el lote se reintenta al reanudar
+                logger.warning(f"Ingest job {job_id} paused at chunk {done}: {e}")
+                await run_blocking(_update_job, job_id, status="paused", error=str(e), owner=None)
+                return
+            except Exception as e:
+                # Falla sin avanzar y conserva el PDF: /ingest/jobs/{id}/resume reintenta este lote.
+                # Completar salteándolo dejaría la versión nueva a medias junto a la anterior.
+                logger.error(f"Error storing chunks {done}-{done + len(batch) - 1} of job {job_id}: {e}")
+                failed += len(changed)
+                await run_blocking(
+                    _update_job, job_id, status="failed", chunks_failed=failed,
+                    error=f"Chunks {done}-{done + len(batch) - 1}: {e}", owner=None
+                )
+                return
+
+            hashes.extend(batch_hashes)
+            done += len(batch)
+            await run_blocking(
+                _update_job, job_id,
+                chunks_done=done, chunks_stored=stored, chunks_skipped=skipped, chunks_failed=failed
+            )
+
+        removed = 0
+        if done == 0:
+            await run_blocking(_update_job, job_id, status="failed", error="Could not extract text from PDF", owner=None)
+        else:
+            # Todos los chunks de la versión nueva están guardados: se borran los de la anterior
+            removed = await sync_document_chunks(document_id, hashes)
+            await run_blocking(
+                _update_job, job_id,
+                status="completed", chunks_removed=removed, chunks_failed=0, error=None, owner=None
+            )
+        os.unlink(job["pdf_path"])
+        logger.info(
+            f"Ingest job {job_id} finished: {stored} stored, {skipped} skipped, {failed} failed, {removed} removed"
+        )
+
+    except Exception as e:
+        logger.error(f"Ingest job {job_id} failed: {e}")
+        await run_blocking(_update_job, job_id, status="failed", error=str(e), owner=None)
+    finally:
+        heartbeat.cancel()
+        # Cierra el generador (y el pool de procesos si se usó)
+        await run_blocking(chunk_iter.close)
+
+
+def start_job(job_id: str):
+    """Lanza el job en segundo plano dentro del event loop actual (una sola vez por worker)."""
+    if job_id in _running_jobs:
+        return
+    task = asyncio.create_task(run_job(job_id))
+    _running_jobs[job_id] = task
+    task.add_done_callback(lambda _: _running_jobs.pop(job_id, None))
+
+
+async def submit_pdf_job(
+    fileobj,
+    filename: str,
+    device_brand: str = None,
+    device_model: str = None,
+    document_id: str = None
+) -> str:
+    """
+    Guarda el PDF en disco, registra el job y lo arranca. Devuelve el job_id.
+    Marca y modelo (opcionales) quedan en la metadata de los chunks para filtrar la búsqueda
+    y, con el nombre, identifican el documento que se re-ingesta (o document_id si se indica).
+    """
+    job_id = await run_blocking(_create_job, fileobj, filename, device_brand, device_model, document_id)
+    start_job(job_id)
+    return job_id
+
+
+def _requeue_job(job_id: str) -> bool:
+    row = _conn().execute("SELECT pdf_path FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+    if not row or not os.path.exists(row["pdf_path"]):
+        return False
+    conn = _conn()
+    cursor = conn.execute(
+        "UPDATE ingest_jobs SET status = 'queued', owner = NULL, error = NULL, updated_at = ? "
+        "WHERE id = ? AND status IN ('paused', 'failed')",
+        (time.time(), job_id)
+    )
+    conn.commit()
+    return cursor.rowcount > 0
+
+
+async def resume_job(job_id: str) -> bool:
+    """Reanuda manualmente un job pausado (p. ej. por cuota) o fallido."""
+    if not await run_blocking(_requeue_job, job_id):
+        return False
+    start_job(job_id)
+    return True
+
+
+async def _start_pending_jobs(include_paused: bool):
+    try:
+        job_ids = await run_blocking(_pending_job_ids, include_paused)
+    except Exception as e:
+        logger.error(f"Could not read ingest jobs: {e}")
+        return
+    job_ids = [job_id for job_id in job_ids if job_id not in _running_jobs]
+    for job_id in job_ids:
+        start_job(job_id)
+    if job_ids:
+        logger.info(f"Resuming {len(job_ids)} pending ingest jobs")
+
+
+async def _watch_orphaned_jobs():
+    # Los jobs de un worker caído se retoman cuando su heartbeat caduca.
+    # Los pausados por cuota no: se reanudan al arrancar o vía resume_job.
+    while True:
+        await asyncio.sleep(JOB_STALE_SECONDS)
+        await _start_pending_jobs(include_paused=False)
+
+
+_watcher_task = None
+
+
+async def resume_pending_jobs():
+    """Al arrancar: retoma jobs en cola, pausados o huérfanos de un worker caído."""
+    global _watcher_task
+    await _start_pending_jobs(include_paused=True)
+    if _watcher_task is None:
+        _watcher_task = asyncio.create_task(_watch_orphaned_jobs())
@@ -1,116 +1,98 @@
 import os
-import google.generativeai as genai
-from dotenv import load_dotenv
+import time
 import logging
-import asyncio
-from functools import wraps
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
-# Cargar variables de entorno
-load_dotenv()
-
+# El SDK de Gemini se importa y configura al primer uso (model_registry.get_genai)
 api_key = os.getenv("GOOGLE_API_KEY")
 
-if not api_key:
-    logger.warning("GOOGLE_API_KEY no encontrada en variables de entorno.")
-else:
-    genai.configure(api_key=api_key)
-
-def retry_with_backoff(retries=3, backoff_in_seconds=2):
-    def decorator(func):
-        @wraps(func)
-        async def wrapper(*args, **kwargs):
-            x = 0
-            while True:
-                try:
-                    # Si la funcion es sincrona, la envolvemos. Pero mejor hacerla async.
-                    if asyncio.iscoroutinefunction(func):
-                        return await func(*args, **kwargs)
-                    else:
-                        return func(*args, **kwargs)
-                except Exception as e:
-                    if "429" in str(e) and x < retries:
-                        sleep_time = (backoff_in_seconds * (2 ** x))
-                        logger.warning(f"Gemini LLM Rate Limit (429). Retrying in {sleep_time}s... (Attempt {x+1}/{retries})")
-                        await asyncio.sleep(sleep_time)
-                        x += 1
-                    else:
-                        raise e
-        return wrapper
-    return decorator
-
-from typing import Dict, Any
-
-@retry_with_backoff(retries=2)
-async def generate_ai_response(message: str, context: str = None) -> Dict[str, Any]:
+from app.services.rate_limiter import generation_limiter, QuotaExceededError
+from app.services.executor import run_blocking
+from app.services.tickets_service import list_tickets
+from app.services.model_registry import get_chat_model
+from app.services import metrics
+
+from typing import Dict, Any, AsyncIterator
+
+def _build_prompt(message: str, context: str = None, history: str = None) -> str:
     """
-    Genera una respuesta utilizando Gemini Pro.
+    Solo la parte variable de la consulta: la persona y las herramientas ya van
+    en el modelo (system instruction) desde el registro de modelos.
+    `history` es la conversación previa ya compactada al presupuesto de tokens.
     """
-    if not api_key:
-        return "Error de configuración: API Key de Google no encontrada. Por favor configura el backend."
+    prompt_parts = []
+    
+    if context:
+        prompt_parts.append(f"CONTEXTO DEL TICKET/SITUACIÓN:\n{context}\n")
 
-    try:
-        # Definir la personalidad del asistente
-        system_instruction = (
-            "Eres Electromind AI, un asistente experto y técnico especializado en reparación de dispositivos electrónicos "
-            "(celulares, tablets, laptops, consolas). "
-            "Tu objetivo es ayudar a los técnicos a diagnosticar fallas, sugerir soluciones, encontrar repuestos "
-            "y estimar tiempos o costos. "
-            "Sé preciso, técnico pero claro, y usa un tono profesional y amable. "
-            "Si te dan un contexto de un ticket, úsalo para dar una respuesta específica."
-        )
+    if history:
+        prompt_parts.append(f"CONVERSACIÓN PREVIA:\n{history}\n")
+        
+    prompt_parts.append(f"CONSULTA DEL TÉCNICO:\n{message}")
+    
+    return "\n".join(prompt_parts)
+
+async def _handle_function_call(fc) -> Dict[str, Any]:
+    """Ejecuta/traduce una llamada a función de Gemini al formato de respuesta del chat."""
+    with metrics.stage_seconds.time(stage=f"tool_{fc.name}"):
+        return await _run_function_call(fc)
+
+async def _run_function_call(fc) -> Dict[str, Any]:
+    if fc.name == "register_ticket":
+        return {
+            "text": "He capturado los datos. Por favor confirma el registro en la pantalla.",
+            "action": "register_ticket",
+            "action_data": {
+                "client_name": fc.args.get("client_name"),
+                "phone": fc.args.get("phone"),
+                "device_type": fc.args.get("device_type"),
+                "brand": fc.args.get("brand"),
+                "model": fc.args.get("model"),
+                "problem_description": fc.args.get("problem_description"),
+            }
+        }
+
+    if fc.name == "list_tickets":
+        # 1. Ejecutar la herramienta
+        tool_result = await _handle_list_tickets(fc.args)
+        tickets_info = tool_result["text"]
 
-        # Definir la herramienta de registro
-        register_ticket_tool = {
-            "function_declarations": [
-                {
-                    "name": "register_ticket",
-                    "description": "Registers a new repair ticket when the user provides all necessary device and client information.",
-                    "parameters": {
-                        "type": "OBJECT",
-                        "properties": {
-                            "client_name": {"type": "STRING", "description": "Full name of the client"},
-                            "phone": {"type": "STRING", "description": "Phone number or WhatsApp"},
-                            "device_type": {"type": "STRING", "description": "Type of device (Smartphone, Laptop, Tablet, TV, Consola, Otro)"},
-                            "brand": {"type": "STRING", "description": "Device brand"},
-                            "model": {"type": "STRING", "description": "Device model"},
-                            "problem_description": {"type": "STRING", "description": "Detailed description of the problem (minimum 10 chars)"}
-                        },
-                        "required": ["client_name", "phone", "device_type", "brand", "model", "problem_description"]
-                    }
-                },
-                {
-                    "name": "list_tickets",
-                    "description": "Search and list tickets from the database based on status, client name, or general filters.",
-                    "parameters": {
-                        "type": "OBJECT",
-                        "properties": {
-                            "status": {"type": "STRING", "description": "Filter by status: 'pendiente', 'revision', 'reparando', 'terminado', 'entregado'"},
-                            "client_name": {"type": "STRING", "description": "Filter by client name (partial match)"},
-                            "limit": {"type": "INTEGER", "description": "Max number of tickets to return (default 5)"}
-                        }
-                    }
-                }
-            ]
+        # 2. Optimización de Cuota (20 RPD Limit):
+        # Devolvemos el resultado directo sin re-procesar por la IA para ahorrar 1 llamada.
+        # El cliente recibirá el texto formateado por la función python.
+        logger.info("Herramienta list_tickets ejecutada. Retornando resultado directo para ahorrar cuota.")
+
+        return {"text": tickets_info, "action": None}
+
+    return None
+
+def _part_text(parts) -> str:
+    # response.text lanza excepción si algún part no es texto (p. ej. function_call)
+    return "".join(part.text for part in parts if getattr(part, "text", None))
+
+async def generate_ai_response(message: str, context: str = None, history: str = None) -> Dict[str, Any]:
+    """
+    Genera una respuesta utilizando Gemini Pro.
+    """
+    if not api_key:
+        logger.error("GOOGLE_API_KEY no configurada")
+        return {
+            "text": "Error de configuración: API Key de Google no encontrada. Por favor configura el backend.",
+            "action": None
         }
 
-        model = genai.GenerativeModel('gemini-2.5-flash', tools=[register_ticket_tool])
-        
-        # Construir el prompt completo
-        prompt_parts = [system_instruction]
-        
-        if context:
-            prompt_parts.append(f"\nCONTEXTO DEL TICKET/SITUACIÓN:\n{context}")
-            
-        prompt_parts.append(f"\nCONSULTA DEL TÉCNICO:\n{message}")
-        
-        full_prompt = "\n".join(prompt_parts)
+    try:
+        model = await run_blocking(get_chat_model)
+        full_prompt = _build_prompt(message, context, history)
         
         logger.info(f"Enviando prompt a Gemini: {full_prompt[:100]}...")
 
-        response = model.generate_content(full_prompt)
+        # Hace cola en el limitador compartido en lugar de reintentar tras un 429
+        await generation_limiter.acquire()
+        with metrics.stage_seconds.time(stage="generate_content"):
+            response = await run_blocking(model.generate_content, full_prompt)
         
         # Verificar bloqueo
         if response.prompt_feedback and response.prompt_feedback.block_reason:
@@ -120,75 +102,96 @@ async def generate_ai_response(message: str, context: str = None) -> Dict[str, A
         if response.parts:
             for part in response.parts:
                 if part.function_call:
-                    fc = part.function_call
-                    
-                    if fc.name == "register_ticket":
-                        return {
-                            "text": "He capturado los datos. Por favor confirma el registro en la pantalla.",
-                            "action": "register_ticket",
-                            "action_data": {
-                                "client_name": fc.args.get("client_name"),
-                                "phone": fc.args.get("phone"),
-                                "device_type": fc.args.get("device_type"),
-                                "brand": fc.args.get("brand"),
-                                "model": fc.args.get("model"),
-                                "problem_description": fc.args.get("problem_description"),
-                            }
-                        }
-                    
-                    elif fc.name == "list_tickets":
-                        # 1. Ejecutar la herramienta
-                        tool_result = await _handle_list_tickets(fc.args)
-                        tickets_info = tool_result["text"]
-                        
-                    elif fc.name == "list_tickets":
-                        # 1. Ejecutar la herramienta
-                        tool_result = await _handle_list_tickets(fc.args)
-                        tickets_info = tool_result["text"]
-                        
-                        # 2. Optimización de Cuota (20 RPD Limit):
-                        # Devolvemos el resultado directo sin re-procesar por la IA para ahorrar 1 llamada.
-                        # El cliente recibirá el texto formateado por la función python.
-                        logger.info("Herramienta list_tickets ejecutada. Retornando resultado directo para ahorrar cuota.")
-                        
-                        return {"text": tickets_info, "action": None}
-
-        return {"text": response.text, "action": None}
+                    result = await _handle_function_call(part.function_call)
+                    if result:
+                        return result
+
+        # Solo las respuestas de texto del modelo son reutilizables por el caché semántico
+        return {"text": _part_text(response.parts), "action": None, "cacheable": True}
                          
+    except QuotaExceededError as e:
+        logger.warning(f"Cuota de Gemini agotada: {e}")
+        return {"text": "Se agotó la cuota diaria de la IA. Intenta de nuevo más tarde.", "action": None}
     except Exception as e:
-        print(f"-------- CRITICAL AI ERROR --------: {e}") 
+        if metrics.is_upstream_rate_limit(e):
+            metrics.rate_limited.inc(limiter=generation_limiter.name, reason="upstream_429")
         logger.error(f"Error generando respuesta AI: {e}")
         return {"text": f"Error interno: {str(e)}", "action": None}
 
-# Helper para ejecutar la consulta de tickets
-from supabase import create_client
+async def stream_ai_response(message: str, context: str = None, history: str = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Versión en streaming de generate_ai_response. Emite eventos:
+    {"type": "token", "text"} a medida que Gemini genera,
+    {"type": "action", "text", "action", "action_data"} si el modelo llama una herramienta,
+    y un {"type": "done", "text", "action", "action_data"} final con la respuesta completa.
+    """
+    if not api_key:
+        text = "Error de configuración: API Key de Google no encontrada. Por favor configura el backend."
+        yield {"type": "done", "text": text, "action": None, "action_data": None}
+        return
 
-async def _handle_list_tickets(args):
     try:
-        url = os.environ.get("SUPABASE_URL")
-        key = os.environ.get("SUPABASE_KEY")
-        supabase = create_client(url, key)
-
-        query = supabase.table("tickets").select("id, human_id, device_type, brand, model, status, problem_description, clients(full_name)")
-        
-        if "status" in args:
-            query = query.eq("status", args["status"])
-        
-        if "client_name" in args:
-            # Busqueda en tabla relacionada es compleja en supabase-py simple, 
-            # hacemos filtro post-fetch o asumimos búsqueda exacta. 
-            # Por simplicidad en este MVP, filtraremos solo por status o traeremos los ultimos.
-            pass 
-
-        # Ordenar por fecha de creación descendente
-        query = query.order("created_at", desc=True)
-        
-        limit = args.get("limit", 5)
-        query = query.limit(limit)
+        model = await run_blocking(get_chat_model)
+        full_prompt = _build_prompt(message, context, history)
+        logger.info(f"Enviando prompt (stream) a Gemini: {full_prompt[:100]}...")
+
+        await generation_limiter.acquire()
+        started = time.perf_counter()
+        response = await run_blocking(model.generate_content, full_prompt, stream=True)
+        chunks = iter(response)
+
+        reply = []
+        while True:
+            # Cada next() bloquea hasta que llega el siguiente fragmento: se hace en el pool
+            chunk = await run_blocking(next, chunks, None)
+            if chunk is None:
+                # Duración completa del stream (hasta el último fragmento)
+                metrics.stage_seconds.observe(time.perf_counter() - started, stage="generate_content_stream")
+                break
+
+            if chunk.prompt_feedback and chunk.prompt_feedback.block_reason:
+                text = f"Bloqueado: {chunk.prompt_feedback.block_reason}"
+                yield {"type": "done", "text": text, "action": None, "action_data": None}
+                return
+
+            parts = chunk.parts if chunk.candidates else []
+            for part in parts:
+                if part.function_call:
+                    result = await _handle_function_call(part.function_call)
+                    if result:
+                        result.setdefault("action_data", None)
+                        yield {"type": "action", **result}
+                        yield {"type": "done", **result}
+                        return
+
+            text = _part_text(parts)
+            if text:
+                reply.append(text)
+                yield {"type": "token", "text": text}
+
+        yield {"type": "done", "text": "".join(reply), "action": None, "action_data": None, "cacheable": True}
+
+    except QuotaExceededError as e:
+        logger.warning(f"Cuota de Gemini agotada: {e}")
+        text = "Se agotó la cuota diaria de la IA. Intenta de nuevo más tarde."
+        yield {"type": "done", "text": text, "action": None, "action_data": None}
+    except Exception as e:
+        if metrics.is_upstream_rate_limit(e):
+            metrics.rate_limited.inc(limiter=generation_limiter.name, reason="upstream_429")
+        logger.error(f"Error generando respuesta AI (stream): {e}")
+        yield {"type": "error", "text": f"Error interno: {str(e)}"}
 
-        result = query.execute()
+# Helper para ejecutar la consulta de tickets
+async def _handle_list_tickets(args):
+    try:
+        result = await list_tickets(
+            status=args.get("status"),
+            client_name=args.get("client_name"),
+            limit=args.get("limit", 5),
+            cursor=args.get("cursor")
+        )
         
-        tickets = result.data
+        tickets = result["tickets"]
         if not tickets:
             return {"text": "No encontré tickets con esos criterios.", "action": None}
 
@@ -198,7 +201,7 @@ async def _handle_list_tickets(args):
         
         summary = "📋 **Resultados de la búsqueda:**\n\n"
         for t in tickets:
-            client_name = t.get('clients', {}).get('full_name', 'Sin Cliente')
+            client_name = (t.get('clients') or {}).get('full_name', 'Sin Cliente')
             summary += (
                 f"**Ticket #{t['human_id']}**\n"
                 f"- Dispositivo: {t['device_type']} {t['brand']} {t['model']}\n"
@@ -208,8 +211,12 @@ async def _handle_list_tickets(args):
             )
         
         summary += "\n*Nota: Mostrando los últimos resultados encontrados.*"
+        if result["next_cursor"]:
+            summary += f"\n*Hay más resultados (cursor: {result['next_cursor']}).*"
         return {"text": summary, "action": None}
 
+    except ValueError as e:
+        return {"text": f"No pude consultar los tickets: {e}", "action": None}
     except Exception as e:
         logger.error(f"Error listing tickets: {e}")
         return {"text": "Hubo un error consultando la base de datos.", "action": None}
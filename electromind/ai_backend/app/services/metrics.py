@@ -0,0 +1,229 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# Registro de métricas en proceso, exportado en formato de texto de Prometheus por /metrics.
+# Cada worker de uvicorn tiene su propio registro (Prometheus los distingue por instancia).
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self.samples().items())
+        ]
+
+
+class Gauge(_Metric):
+    """Valor instantáneo; con set_function se calcula en cada scrape."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._function = None
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function):
+        """function() -> lista de (labels: dict, valor)."""
+        self._function = function
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        if self._function:
+            for labels, value in self._function():
+                values[self._key(labels)] = value
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+            if value is not None
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # key -> [conteos por bucket, suma, total]
+        self._values = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Mide la duración del bloque (también si lanza excepción)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = {key: (list(entry[0]), entry[1], entry[2]) for key, entry in self._values.items()}
+        lines = []
+        for key, (counts, total_sum, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Etapas: embedding, knowledge_search, dedup_search, context_build, generate_content,
+# generate_content_stream, tool_<nombre>, pdf_parse, chunk_insert
+stage_seconds = registry.register(Histogram(
+    "electromind_stage_duration_seconds",
+    "Duración de cada etapa del chat y la ingesta.",
+    ["stage"]
+))
+cache_requests = registry.register(Counter(
+    "electromind_cache_requests_total",
+    "Consultas a cachés locales por resultado (hit/miss).",
+    ["cache", "result"]
+))
+cache_hit_ratio = registry.register(Gauge(
+    "electromind_cache_hit_ratio",
+    "Proporción de hits desde el arranque del proceso.",
+    ["cache"]
+))
+rate_limited = registry.register(Counter(
+    "electromind_rate_limited_total",
+    "Requests rechazadas por cuota: daily_quota (limitador local) o upstream_429 (Google).",
+    ["limiter", "reason"]
+))
+rate_limit_wait = registry.register(Counter(
+    "electromind_rate_limit_wait_seconds_total",
+    "Tiempo total esperando turno en los limitadores RPM.",
+    ["limiter"]
+))
+coalesced_calls = registry.register(Counter(
+    "electromind_coalesced_calls_total",
+    "Llamadas que reutilizaron una idéntica en curso (single-flight).",
+    ["flight"]
+))
+quota_remaining = registry.register(Gauge(
+    "electromind_quota_remaining",
+    "Requests diarias restantes según el limitador local.",
+    ["limiter"]
+))
+
+
+def record_cache(cache: str, hits: int = 0, misses: int = 0):
+    if hits:
+        cache_requests.inc(hits, cache=cache, result="hit")
+    if misses:
+        cache_requests.inc(misses, cache=cache, result="miss")
+
+
+def _hit_ratios():
+    totals = {}
+    for (cache, result), value in cache_requests.samples().items():
+        hits, count = totals.get(cache, (0.0, 0.0))
+        totals[cache] = (hits + (value if result == "hit" else 0.0), count + value)
+    return [({"cache": cache}, hits / count) for cache, (hits, count) in totals.items() if count]
+
+
+cache_hit_ratio.set_function(_hit_ratios)
+
+
+def is_upstream_rate_limit(error: Exception) -> bool:
+    """429 de la API de Google (google.api_core.exceptions.ResourceExhausted)."""
+    return type(error).__name__ == "ResourceExhausted" or getattr(error, "code", None) == 429
+
+
+def render_metrics() -> str:
+    return registry.render()
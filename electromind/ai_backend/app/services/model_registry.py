@@ -0,0 +1,137 @@
+import os
+import time
+import logging
+import threading
+from datetime import timedelta
+
+logger = logging.getLogger(__name__)
+
+# Modelos de Gemini de larga vida: se crean una vez al arrancar y se reutilizan en cada chat
+GEMINI_CHAT_MODEL = os.getenv("GEMINI_CHAT_MODEL", "gemini-2.5-flash")
+# Context caching del lado de Google para el prefijo fijo (persona + herramientas).
+# Requiere que el prefijo supere el mínimo de tokens del modelo; si la API lo rechaza se usa el modelo normal.
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "false").lower() in ("1", "true", "yes")
+GEMINI_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+
+# Definir la personalidad del asistente
+SYSTEM_INSTRUCTION = (
+    "Eres Electromind AI, un asistente experto y técnico especializado en reparación de dispositivos electrónicos "
+    "(celulares, tablets, laptops, consolas). "
+    "Tu objetivo es ayudar a los técnicos a diagnosticar fallas, sugerir soluciones, encontrar repuestos "
+    "y estimar tiempos o costos. "
+    "Sé preciso, técnico pero claro, y usa un tono profesional y amable. "
+    "Si te dan un contexto de un ticket, úsalo para dar una respuesta específica."
+)
+
+# Herramientas disponibles para el modelo (registro y consulta de tickets)
+CHAT_TOOLS = {
+    "function_declarations": [
+        {
+            "name": "register_ticket",
+            "description": "Registers a new repair ticket when the user provides all necessary device and client information.",
+            "parameters": {
+                "type": "OBJECT",
+                "properties": {
+                    "client_name": {"type": "STRING", "description": "Full name of the client"},
+                    "phone": {"type": "STRING", "description": "Phone number or WhatsApp"},
+                    "device_type": {"type": "STRING", "description": "Type of device (Smartphone, Laptop, Tablet, TV, Consola, Otro)"},
+                    "brand": {"type": "STRING", "description": "Device brand"},
+                    "model": {"type": "STRING", "description": "Device model"},
+                    "problem_description": {"type": "STRING", "description": "Detailed description of the problem (minimum 10 chars)"}
+                },
+                "required": ["client_name", "phone", "device_type", "brand", "model", "problem_description"]
+            }
+        },
+        {
+            "name": "list_tickets",
+            "description": "Search and list tickets from the database based on status, client name, or general filters.",
+            "parameters": {
+                "type": "OBJECT",
+                "properties": {
+                    "status": {"type": "STRING", "description": "Filter by status: 'pendiente', 'revision', 'reparando', 'terminado', 'entregado'"},
+                    "client_name": {"type": "STRING", "description": "Filter by client name (partial match)"},
+                    "limit": {"type": "INTEGER", "description": "Max number of tickets to return (default 5, max 20)"},
+                    "cursor": {"type": "STRING", "description": "Cursor from a previous list_tickets result to fetch the next (older) page"}
+                }
+            }
+        }
+    ]
+}
+
+
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def get_genai():
+    """
+    SDK de Gemini importado y configurado la primera vez que se usa: importarlo tarda
+    cientos de ms y no hace falta para arrancar el servidor ni para /health.
+    Llamarlo desde el pool (run_blocking) o después del warm-up, no en el event loop.
+    """
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                import google.generativeai as genai
+                api_key = os.getenv("GOOGLE_API_KEY")
+                if api_key:
+                    genai.configure(api_key=api_key)
+                else:
+                    logger.warning("GOOGLE_API_KEY no encontrada en variables de entorno.")
+                _genai = genai
+    return _genai
+
+
+class ModelRegistry:
+    """
+    Guarda los GenerativeModel ya configurados (system instruction + tools).
+    Con GEMINI_CONTEXT_CACHE el prefijo fijo vive en un CachedContent de Google
+    y se recrea poco antes de que expire.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._chat_model = None
+        self._cache_expires_at = None
+
+    def _build_chat_model(self):
+        genai = get_genai()
+        if GEMINI_CONTEXT_CACHE:
+            try:
+                from google.generativeai import caching
+                cached = caching.CachedContent.create(
+                    model=f"models/{GEMINI_CHAT_MODEL}",
+                    display_name="electromind-chat-prefix",
+                    system_instruction=SYSTEM_INSTRUCTION,
+                    tools=[CHAT_TOOLS],
+                    ttl=timedelta(seconds=GEMINI_CONTEXT_CACHE_TTL_SECONDS),
+                )
+                # Renovar un minuto antes de la expiración real
+                self._cache_expires_at = time.monotonic() + GEMINI_CONTEXT_CACHE_TTL_SECONDS - 60
+                logger.info(f"Gemini context cache created for {GEMINI_CHAT_MODEL}")
+                return genai.GenerativeModel.from_cached_content(cached_content=cached)
+            except Exception as e:
+                logger.warning(f"Context caching no disponible, se usa system instruction normal: {e}")
+
+        self._cache_expires_at = None
+        return genai.GenerativeModel(
+            GEMINI_CHAT_MODEL,
+            system_instruction=SYSTEM_INSTRUCTION,
+            tools=[CHAT_TOOLS],
+        )
+
+    def chat_model(self):
+        """Modelo del chat; se construye la primera vez (o al expirar el context cache)."""
+        with self._lock:
+            expired = self._cache_expires_at is not None and time.monotonic() >= self._cache_expires_at
+            if self._chat_model is None or expired:
+                self._chat_model = self._build_chat_model()
+            return self._chat_model
+
+
+model_registry = ModelRegistry()
+
+
+def get_chat_model():
+    return model_registry.chat_model()
@@ -1,32 +1,239 @@
-import pypdf
-import io
+import os
+import re
+import math
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator
 
-def extract_text_from_pdf(file_bytes: bytes) -> str:
-    """Extrae todo el texto de un PDF."""
+# A partir de cuántas páginas se reparte la extracción entre procesos
+PDF_PARALLEL_PAGE_THRESHOLD = int(os.getenv("PDF_PARALLEL_PAGE_THRESHOLD", "40"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+PAGES_PER_TASK = 8
+
+# Chunking por tokens: tamaño máximo por chunk y solapamiento según el tipo de fuente
+CHARS_PER_TOKEN = 4
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = {
+    "manual": int(os.getenv("CHUNK_OVERLAP_TOKENS_MANUAL", "48")),
+    "ticket_solution": int(os.getenv("CHUNK_OVERLAP_TOKENS_TICKET_SOLUTION", "0")),
+}
+
+# "3.2 Reemplazo del conector" (al menos dos niveles) o "CAPÍTULO 4 - DIAGNÓSTICO".
+# "1. Retire la tapa" no cuenta: suele ser un paso de un procedimiento.
+_NUMBERED_HEADING_RE = re.compile(r"^\d+(\.\d+)+\.?\s+\S")
+_CAPS_HEADING_RE = re.compile(r"^[A-ZÁÉÍÓÚÑÜ0-9][A-ZÁÉÍÓÚÑÜ0-9 \-/:()]{3,}$")
+# Columnas separadas por 2+ espacios o tabuladores
+_TABLE_ROW_RE = re.compile(r"\S(?: {2,}|\t)\S.*\S(?: {2,}|\t)\S")
+_SENTENCE_RE = re.compile(r"(?<=[.!?;:])\s+(?=[A-ZÁÉÍÓÚÑ¿¡0-9\-•])")
+
+def spool_upload(fileobj, suffix: str = ".pdf", directory: str = None) -> str:
+    """
+    Copia el upload a un archivo temporal en disco por bloques (sin cargarlo entero en RAM).
+    Con `directory` se crea ahí (mismo sistema de archivos que el destino final: os.replace
+    no puede mover entre dispositivos). Devuelve la ruta; quien llama es responsable de borrarla.
+    """
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=directory)
     try:
-        pdf = pypdf.PdfReader(io.BytesIO(file_bytes))
-        text = ""
-        for page in pdf.pages:
-            text += page.extract_text() + "\n"
-        return text
-    except Exception as e:
-        print(f"Error parsing PDF: {e}")
-        return ""
-
-def chunk_text(text: str, chunk_size: int = 1500, overlap: int = 200) -> list[str]:
-    """
-    Divide el texto en fragmentos (chunks) para que quepan en la ventana de contexto.
-    Simple sliding window.
-    """
-    chunks = []
-    start = 0
-    text_len = len(text)
-    
-    while start < text_len:
-        end = start + chunk_size
-        chunk = text[start:end]
-        chunks.append(chunk)
-        # Avanzar el inicio, retrocediendo por el overlap
-        start += chunk_size - overlap
-        
-    return chunks
+        fileobj.seek(0)
+        shutil.copyfileobj(fileobj, tmp, length=1024 * 1024)
+    except Exception:
+        tmp.close()
+        os.unlink(tmp.name)
+        raise
+    tmp.close()
+    return tmp.name
+
+def _pdf_reader(source):
+    # pypdf se importa al primer PDF: este módulo también se carga en el chat (estimate_tokens)
+    import pypdf
+    return pypdf.PdfReader(source)
+
+def count_pages(path: str) -> int:
+    """Número de páginas; lanza excepción si el archivo no es un PDF válido."""
+    return len(_pdf_reader(path).pages)
+
+def _extract_page_range(path: str, start: int, end: int) -> list[str]:
+    """Trabajo de un proceso: abre el PDF y extrae las páginas [start, end)."""
+    reader = _pdf_reader(path)
+    return [(reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+def iter_pdf_pages(path: str) -> Iterator[str]:
+    """
+    Genera el texto página a página, en orden.
+    Para PDFs grandes reparte rangos de páginas entre PDF_WORKERS procesos,
+    limitando las tareas en vuelo para que la memoria no crezca con el tamaño del archivo.
+    """
+    reader = _pdf_reader(path)
+    total = len(reader.pages)
+
+    if total < PDF_PARALLEL_PAGE_THRESHOLD or PDF_WORKERS <= 1:
+        for page in reader.pages:
+            yield page.extract_text() or ""
+        return
+
+    del reader
+    ranges = [(start, min(start + PAGES_PER_TASK, total)) for start in range(0, total, PAGES_PER_TASK)]
+    # spawn: hacer fork de un worker con hilos activos puede bloquearse
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=ctx) as pool:
+        pending = []
+        next_range = 0
+        max_in_flight = PDF_WORKERS * 2
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < max_in_flight:
+                start, end = ranges[next_range]
+                pending.append(pool.submit(_extract_page_range, path, start, end))
+                next_range += 1
+            # Se consume en orden para que los chunks respeten la secuencia del documento
+            for text in pending.pop(0).result():
+                yield text
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimación barata de tokens (~4 caracteres por token en español/inglés para Gemini).
+    Evita llamar a count_tokens de la API, que también consume cuota.
+    """
+    if not text:
+        return 0
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+def _is_heading(line: str) -> bool:
+    if len(line) > 80 or line.endswith((".", ",", ";")) or not any(c.isalpha() for c in line):
+        return False
+    return bool(_NUMBERED_HEADING_RE.match(line) or _CAPS_HEADING_RE.match(line))
+
+def _iter_lines(pages: Iterable[str]) -> Iterator[str]:
+    for page in pages:
+        yield from page.splitlines()
+        # El salto de página cierra el párrafo en curso
+        yield ""
+
+def _iter_blocks(lines: Iterable[str]) -> Iterator[tuple]:
+    """
+    Agrupa líneas en bloques ("heading" | "table" | "paragraph", texto).
+    Las líneas de un párrafo se unen con espacio (y se reparan cortes con guion);
+    las filas de tabla se mantienen en líneas separadas.
+    """
+    paragraph = []
+    table = []
+
+    def flush_paragraph():
+        if paragraph:
+            yield ("paragraph", " ".join(paragraph))
+            paragraph.clear()
+
+    def flush_table():
+        if table:
+            yield ("table", "\n".join(table))
+            table.clear()
+
+    for raw in lines:
+        line = raw.strip()
+        if not line:
+            yield from flush_paragraph()
+            yield from flush_table()
+        elif _is_heading(line):
+            yield from flush_paragraph()
+            yield from flush_table()
+            yield ("heading", line)
+        elif _TABLE_ROW_RE.search(line):
+            yield from flush_paragraph()
+            table.append(line)
+        else:
+            yield from flush_table()
+            if paragraph and paragraph[-1].endswith("-") and line[:1].islower():
+                paragraph[-1] = paragraph[-1][:-1] + line
+            else:
+                paragraph.append(line)
+
+    yield from flush_paragraph()
+    yield from flush_table()
+
+def _split_block(kind: str, text: str, max_tokens: int) -> list[str]:
+    """Parte un bloque que no cabe en un chunk: tablas por filas, párrafos por oraciones."""
+    pieces = text.split("\n") if kind == "table" else _SENTENCE_RE.split(text)
+    units = []
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    for piece in pieces:
+        if estimate_tokens(piece) <= max_tokens:
+            units.append(piece)
+            continue
+        # Oración/fila gigante: último recurso, cortar por palabras
+        current = ""
+        for word in piece.split():
+            if current and len(current) + 1 + len(word) > max_chars:
+                units.append(current)
+                current = word
+            else:
+                current = f"{current} {word}" if current else word
+        if current:
+            units.append(current)
+    return units
+
+def iter_chunks(
+    pages: Iterable[str],
+    max_tokens: int = None,
+    overlap_tokens: int = None,
+    source_type: str = "manual"
+) -> Iterator[str]:
+    """
+    Chunker en streaming que respeta la estructura del documento:
+    - un título nuevo cierra el chunk en curso y encabeza los chunks de su sección,
+    - los párrafos y tablas se agrupan enteros hasta max_tokens,
+    - solo se parte por oraciones (o filas de tabla) cuando un bloque no cabe.
+    El solapamiento se hace con oraciones completas y depende del tipo de fuente.
+    """
+    if max_tokens is None:
+        max_tokens = CHUNK_MAX_TOKENS
+    if overlap_tokens is None:
+        overlap_tokens = CHUNK_OVERLAP_TOKENS.get(source_type, 0)
+
+    heading = None
+    pieces = []  # (separador, texto) del cuerpo del chunk en curso
+    tokens = 0
+
+    def render():
+        body = "".join(sep + text for sep, text in pieces).strip()
+        return f"{heading}\n{body}" if heading else body
+
+    for kind, text in _iter_blocks(_iter_lines(pages)):
+        if kind == "heading":
+            if pieces:
+                yield render()
+            # Títulos seguidos (capítulo + sección): se conserva el padre inmediato
+            if heading and not pieces:
+                heading = f"{heading.splitlines()[-1]}\n{text}"
+            else:
+                heading = text
+            # Sin solapamiento entre secciones distintas
+            pieces = []
+            tokens = estimate_tokens(heading)
+            continue
+
+        units = [text] if estimate_tokens(text) <= max_tokens else _split_block(kind, text, max_tokens)
+        inner_sep = "\n" if kind == "table" else " "
+        for i, unit in enumerate(units):
+            unit_tokens = estimate_tokens(unit)
+            if pieces and tokens + unit_tokens > max_tokens:
+                yield render()
+                # Arrastrar las últimas oraciones como overlap (si caben junto a la nueva unidad)
+                carried = []
+                carried_tokens = 0
+                for sep, prev in reversed(pieces):
+                    prev_tokens = estimate_tokens(prev)
+                    if carried_tokens + prev_tokens > overlap_tokens:
+                        break
+                    carried.insert(0, (sep, prev))
+                    carried_tokens += prev_tokens
+                base = estimate_tokens(heading)
+                if base + carried_tokens + unit_tokens > max_tokens:
+                    carried, carried_tokens = [], 0
+                pieces = carried
+                tokens = base + carried_tokens
+            pieces.append(("\n\n" if i == 0 else inner_sep, unit))
+            tokens += unit_tokens
+
+    if pieces:
+        yield render()
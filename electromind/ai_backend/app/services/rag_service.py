@@ -1,24 +1,17 @@
 import os
-import google.generativeai as genai
-from supabase import create_client, Client
-from dotenv import load_dotenv
 import logging
 import time
 import asyncio
-from functools import wraps
-try:
-    from lru import LRU
-except ImportError:
-    # Fallback si lru-dict no esta bien instalado
-    class LRU(dict):
-        def __init__(self, size):
-            self.size = size
-        def __setitem__(self, key, value):
-            if len(self) >= self.size:
-                self.pop(next(iter(self)))
-            super().__setitem__(key, value)
-
-load_dotenv()
+import hashlib
+
+from app.services.rate_limiter import embedding_limiter, QuotaExceededError, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from app.services.executor import run_blocking
+from app.services.embedding_cache import get_embedding_cache, cache_key, normalize_text
+from app.services import vector_index as vindex
+from app.services.answer_cache import invalidate_answer_cache
+from app.services import metrics
+from app.services.singleflight import SingleFlight
+from app.services.model_registry import get_genai
 
 # Configurar logs
 logger = logging.getLogger(__name__)
@@ -26,7 +19,8 @@ logger = logging.getLogger(__name__)
 # Configurar Supabase globals
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = None
+# Cliente de supabase-py; se crea (e importa) en la primera llamada
+supabase = None
 
 def get_supabase_client():
     global supabase
@@ -41,60 +35,134 @@ def get_supabase_client():
         return None
         
     try:
+        from supabase import create_client
         supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
         return supabase
     except Exception as e:
         logger.error(f"Error initializing Supabase client: {e}")
         return None
 
-# Configurar Gemini
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if GOOGLE_API_KEY:
-    try:
-        genai.configure(api_key=GOOGLE_API_KEY)
-    except Exception as e:
-        logger.error(f"Error configuring Gemini: {e}")
-
-# Caché para embeddings de búsqueda (evita 429 en preguntas repetidas)
-query_cache = LRU(100)  # Guardar los últimos 100 queries
-
-def retry_with_backoff(retries=3, backoff_in_seconds=2):
-    def decorator(func):
-        @wraps(func)
-        async def wrapper(*args, **kwargs):
-            x = 0
-            while True:
-                try:
-                    return await func(*args, **kwargs)
-                except Exception as e:
-                    if "429" in str(e) and x < retries:
-                        sleep_time = (backoff_in_seconds * (2 ** x))
-                        logger.warning(f"Gemini Rate Limit (429). Retrying in {sleep_time}s... (Attempt {x+1}/{retries})")
-                        await asyncio.sleep(sleep_time)
-                        x += 1
-                    else:
-                        raise e
-        return wrapper
-    return decorator
-
 EMBEDDING_MODEL = "models/text-embedding-004"
+# Máximo de textos por petición batchEmbedContents (límite de la API)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+# Similitud a partir de la cual un chunk se considera ya guardado
+DUPLICATE_THRESHOLD = 0.95
+# Búsqueda híbrida (texto completo + vectores); sin embedding cae a solo texto completo
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() in ("1", "true", "yes")
+# Búsqueda en dos etapas: candidatos por el índice binario (1 bit/dimensión) y re-ranking
+# exacto con el embedding completo. Requiere la migración 006_quantized_search.sql
+QUANTIZED_SEARCH = os.getenv("QUANTIZED_SEARCH", "false").lower() in ("1", "true", "yes")
+# Perfiles de búsqueda: ef_search de HNSW por request (recall vs. latencia, medido con
+# benchmarks/hnsw_tuning.py). Un ef_search distinto del default de pgvector (40) se envía a
+# la RPC y requiere la migración 008_hnsw_ef_search.sql. Los valores por defecto (balanced y
+# accurate, que usa la dedup de la ingesta) la requieren; sin ella, poner los tres en 40
+HNSW_DEFAULT_EF_SEARCH = 40
+SEARCH_PROFILES = {
+    "fast": int(os.getenv("HNSW_EF_SEARCH_FAST", "40")),
+    "balanced": int(os.getenv("HNSW_EF_SEARCH_BALANCED", "100")),
+    "accurate": int(os.getenv("HNSW_EF_SEARCH_ACCURATE", "200")),
+}
+SEARCH_PROFILE = os.getenv("SEARCH_PROFILE", "balanced")
 
-@retry_with_backoff(retries=3)
 async def generate_embedding(text: str) -> list[float]:
     """Genera un embedding vectorial para el texto dado usando Gemini."""
+    embeddings = await embed_texts([text], task_type="retrieval_document")
+    return embeddings[0]
+
+# Preguntas idénticas simultáneas (p. ej. una falla que afecta a todo el taller) comparten
+# un solo embedding y una sola búsqueda
+_embed_flight = SingleFlight("embed_query")
+_search_flight = SingleFlight("search_knowledge")
+
+async def embed_query(query: str) -> list[float]:
+    """Embedding de una consulta (task_type retrieval_query es mejor para preguntas)."""
+    key = cache_key(query, EMBEDDING_MODEL, "retrieval_query")
+    embeddings = await _embed_flight.do(key, embed_texts, [query], task_type="retrieval_query")
+    return embeddings[0]
+
+async def embed_texts(texts: list[str], task_type: str = "retrieval_document", priority: int = None) -> list[list[float]]:
+    """
+    Embeddings para varios textos pasando primero por el caché en disco.
+    Solo los textos no cacheados llegan a Gemini, agrupados en lotes de EMBED_BATCH_SIZE.
+    Sin priority explícita, las consultas (retrieval_query) son interactivas y los documentos bulk.
+    """
+    cache = get_embedding_cache()
+    keys = [cache_key(text, EMBEDDING_MODEL, task_type) for text in texts]
+
+    cached = {}
+    if cache:
+        try:
+            cached = await run_blocking(cache.get_many, keys)
+        except Exception as e:
+            logger.warning(f"Embedding cache read failed: {e}")
+
+    # Textos únicos que faltan (dos chunks idénticos cuestan un solo embedding)
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cached and key not in missing:
+            missing[key] = text
+    if cache:
+        metrics.record_cache("embedding", hits=len(texts) - len(missing), misses=len(missing))
+
+    if missing:
+        missing_keys = list(missing)
+        fresh = {}
+        for start in range(0, len(missing_keys), EMBED_BATCH_SIZE):
+            batch_keys = missing_keys[start:start + EMBED_BATCH_SIZE]
+            vectors = await generate_embeddings_batch(
+                [missing[k] for k in batch_keys], task_type=task_type, priority=priority
+            )
+            fresh.update(zip(batch_keys, vectors))
+        if cache:
+            try:
+                await run_blocking(cache.put_many, fresh)
+            except Exception as e:
+                logger.warning(f"Embedding cache write failed: {e}")
+        cached.update(fresh)
+    else:
+        logger.info(f"All {len(texts)} embeddings served from cache")
+
+    return [cached[key] for key in keys]
+
+def _embed_content(**kwargs):
+    # En el pool: la primera llamada importa el SDK de Gemini
+    return get_genai().embed_content(**kwargs)
+
+async def generate_embeddings_batch(
+    texts: list[str],
+    task_type: str = "retrieval_document",
+    priority: int = None
+) -> list[list[float]]:
+    """
+    Genera embeddings para varios textos en una sola petición a Gemini (batchEmbedContents).
+    Cada llamada consume 1 request de la cuota, no uno por texto.
+    """
+    if len(texts) > EMBED_BATCH_SIZE:
+        raise ValueError(f"Batch demasiado grande ({len(texts)} > {EMBED_BATCH_SIZE})")
+
     try:
-        # Limpiar texto (saltos de línea excesivos, etc)
-        text = text.replace("\n", " ")
-        
-        result = genai.embed_content(
-            model=EMBEDDING_MODEL,
-            content=text,
-            task_type="retrieval_document",
-            title="Electromind Knowledge"
-        )
+        cleaned = [normalize_text(text) for text in texts]
+        kwargs = {}
+        if task_type == "retrieval_document":
+            kwargs["title"] = "Electromind Knowledge"
+
+        if priority is None:
+            priority = PRIORITY_INTERACTIVE if task_type == "retrieval_query" else PRIORITY_BULK
+        # Un batch es 1 request para la cuota RPM
+        await embedding_limiter.acquire(priority=priority)
+        with metrics.stage_seconds.time(stage="embedding"):
+            result = await run_blocking(
+                _embed_content,
+                model=EMBEDDING_MODEL,
+                content=cleaned,
+                task_type=task_type,
+                **kwargs
+            )
         return result['embedding']
     except Exception as e:
-        logger.error(f"Error generando embedding: {e}")
+        if metrics.is_upstream_rate_limit(e):
+            metrics.rate_limited.inc(limiter=embedding_limiter.name, reason="upstream_429")
+        logger.error(f"Error generando embeddings en batch: {e}")
         raise e
 
 
@@ -103,99 +171,351 @@ async def store_knowledge(content: str, metadata: dict, source_type: str = "manu
     Genera embedding y guarda el fragmento en Supabase 'knowledge_base'.
     Verifica duplicados antes de guardar (Similitud > 0.95).
     """
+    result = await store_knowledge_batch([content], [metadata], source_type=source_type)
+    if result["skipped"]:
+        return {
+            "status": "skipped",
+            "reason": "duplicate_detected",
+            "similar_id": result["skipped"][0]["similar_id"]
+        }
+    return result
+
+def content_hash(text: str) -> str:
+    """Hash del chunk normalizado (mismo cálculo que el backfill de la migración 005)."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+async def store_knowledge_batch(
+    contents: list[str],
+    metadatas: list[dict],
+    source_type: str = "manual",
+    source_id: str = None
+) -> dict:
+    """
+    Versión en lote de store_knowledge: un solo request de embeddings para todos los
+    fragmentos, una RPC de dedup (match_knowledge_batch) y un insert multi-fila
+    en 'knowledge_base'. N chunks cuestan 2 round trips a Supabase, no 2N.
+    Con source_id los chunks quedan vinculados a ese documento y el dedup por similitud
+    ignora sus propias versiones anteriores.
+    Devuelve {"stored": n, "skipped": [{"index", "similar_id"}, ...]}.
+    """
+    if len(contents) != len(metadatas):
+        raise ValueError("contents y metadatas deben tener el mismo tamaño")
+    if not contents:
+        return {"stored": 0, "skipped": []}
+
     client = get_supabase_client()
     if not client:
         # Intenta recargar .env por si acaso
+        from dotenv import load_dotenv
         load_dotenv()
         client = get_supabase_client()
         if not client:
             raise Exception("Supabase no está configurado (Error de cliente o faltan keys)")
 
     try:
-        # 1. Generar Embedding
-        embedding = await generate_embedding(content)
-        
+        # 1. Generar Embeddings (caché en disco + una petición por lote)
+        embeddings = await embed_texts(contents)
+
         # 2. Verificar Duplicados
-        # Usamos la misma función RPC pero con un umbral muy alto (0.95)
-        # para encontrar contenido prácticamente idéntico.
-        duplicate_check_params = {
-            "query_embedding": embedding,
-            "match_threshold": 0.95, 
-            "match_count": 1
+        # Una sola RPC para todo el lote con un umbral muy alto (0.95)
+        # para encontrar contenido prácticamente idéntico ya guardado.
+        dedup_params = {
+            "query_embeddings": embeddings,
+            "match_threshold": DUPLICATE_THRESHOLD
         }
-        
-        potential_dupes = client.rpc("match_knowledge", duplicate_check_params).execute()
-        
-        if potential_dupes.data and len(potential_dupes.data) > 0:
-            logger.info(f"Duplicate content detected (Similarity > 0.95). Skipping ingestion. Source: {metadata.get('source', 'unknown')}")
-            return {
-                "status": "skipped", 
-                "reason": "duplicate_detected",
-                "similar_id": potential_dupes.data[0]['id']
-            }
-
-        # 3. Guardar si no es duplicado
-        data = {
-            "content_chunk": content,
-            "metadata": metadata,
-            "source_type": source_type,
-            "embedding": embedding,
-            # source_id opcional si vinculamos con documents table
-        }
-        
-        response = client.table("knowledge_base").insert(data).execute()
-        return response
+        if source_id:
+            dedup_params["exclude_source_id"] = source_id
+        if QUANTIZED_SEARCH:
+            dedup_params["use_quantized"] = True
+        # Un duplicado no encontrado queda guardado dos veces: la dedup busca con más recall
+        dedup_params.update(_ef_search_params(SEARCH_PROFILES["accurate"]))
+        with metrics.stage_seconds.time(stage="dedup_search"):
+            potential_dupes = await _search_rpc(client, "match_knowledge_batch", dedup_params)
+        duplicates = {row['idx']: row['id'] for row in (potential_dupes.data or [])}
+
+        rows = []
+        skipped = []
+        seen_in_batch = set()
+        for i, (content, metadata, embedding) in enumerate(zip(contents, metadatas, embeddings)):
+            if i in duplicates:
+                logger.info(f"Duplicate content detected (Similarity > {DUPLICATE_THRESHOLD}). Skipping chunk. Source: {metadata.get('source', 'unknown')}")
+                skipped.append({"index": i, "similar_id": duplicates[i]})
+                continue
+
+            # Chunks idénticos dentro del mismo lote: solo se guarda el primero
+            normalized = normalize_text(content)
+            if normalized in seen_in_batch:
+                skipped.append({"index": i, "similar_id": None})
+                continue
+            seen_in_batch.add(normalized)
+
+            rows.append({
+                "content_chunk": content,
+                "metadata": metadata,
+                "source_type": source_type,
+                "embedding": embedding,
+                "content_hash": content_hash(content),
+                "source_id": source_id,
+            })
+
+        # 3. Guardar los no duplicados en un solo insert
+        if rows:
+            with metrics.stage_seconds.time(stage="chunk_insert"):
+                response = await run_blocking(client.table("knowledge_base").insert(rows).execute)
+            if vindex.index_available() and response.data:
+                # Mantener el índice en memoria al día sin esperar a la sincronización
+                vindex.vector_index.add_rows(response.data)
+            invalidate_answer_cache()
+
+        return {"stored": len(rows), "skipped": skipped}
     except Exception as e:
-        logger.error(f"Error guardando en vector DB: {e}")
+        logger.error(f"Error guardando lote en vector DB: {e}")
         raise e
 
-async def search_knowledge(query: str, match_threshold: float = 0.7, match_count: int = 5):
+def _require_client():
+    client = get_supabase_client()
+    if not client:
+        raise Exception("Supabase no está configurado (Error de cliente o faltan keys)")
+    return client
+
+async def ensure_document(filename: str, device_brand: str = None, device_model: str = None) -> str:
+    """
+    Id del documento para este archivo y dispositivo; lo crea en la primera ingesta.
+    El nombre solo no alcanza: dos "manual.pdf" de equipos distintos son documentos distintos
+    y re-ingestar uno no debe borrar los chunks del otro.
+    """
+    client = _require_client()
+    query = client.table("documents").select("id").eq("file_path", filename)
+    for column, value in (("device_brand", device_brand), ("device_model", device_model)):
+        query = query.eq(column, value) if value else query.is_(column, "null")
+    response = await run_blocking(query.order("created_at", desc=True).limit(1).execute)
+    if response.data:
+        return response.data[0]["id"]
+    document = {
+        "title": filename,
+        "file_path": filename,
+        "file_type": "pdf",
+        "device_brand": device_brand or None,
+        "device_model": device_model or None,
+    }
+    response = await run_blocking(client.table("documents").insert(document).execute)
+    return response.data[0]["id"]
+
+async def document_chunk_hashes(
+    document_id: str,
+    source: str,
+    device_brand: str = None,
+    device_model: str = None
+) -> set:
+    """
+    Hashes de los chunks ya guardados del documento (adopta chunks previos con el mismo
+    metadata.source y el mismo dispositivo).
+    """
+    client = _require_client()
+    params = {
+        "p_document_id": document_id,
+        "p_source": source,
+        "p_device_brand": device_brand or None,
+        "p_device_model": device_model or None,
+    }
+    response = await run_blocking(client.rpc("document_chunk_hashes", params).execute)
+    return set(response.data or [])
+
+async def sync_document_chunks(document_id: str, hashes: list[str]) -> int:
+    """
+    Cierra la versión del documento: borra los chunks que ya no están en `hashes`
+    y renumera chunk_index. Devuelve cuántos chunks se borraron.
+    """
+    client = _require_client()
+    params = {"p_document_id": document_id, "p_hashes": hashes}
+    response = await run_blocking(client.rpc("sync_document_chunks", params).execute)
+    deleted = response.data or []
+    if deleted:
+        if vindex.index_available():
+            vindex.vector_index.remove_ids(deleted)
+        invalidate_answer_cache()
+    return len(deleted)
+
+async def search_knowledge(
+    query: str,
+    match_threshold: float = 0.7,
+    match_count: int = 5,
+    filters: dict = None,
+    profile: str = None
+):
     """
     Busca contexto relevante para la query usando RPC 'match_knowledge'.
+    Devuelve solo los textos; ver search_knowledge_matches para las filas completas.
+    """
+    matches = await search_knowledge_matches(query, match_threshold, match_count, filters, profile)
+    return [item['content_chunk'] for item in matches]
+
+async def search_knowledge_matches(
+    query: str,
+    match_threshold: float = 0.7,
+    match_count: int = 5,
+    filters: dict = None,
+    profile: str = None
+) -> list[dict]:
     """
+    Como search_knowledge pero devuelve las filas completas
+    (id, content_chunk, source_type, metadata, similarity), ordenadas por relevancia.
+    Con HYBRID_SEARCH_ENABLED fusiona el ranking léxico y el vectorial (RRF, campo "score");
+    si no se puede embeber la consulta (cuota agotada, 429 u otra falla de Gemini) busca
+    solo por texto completo.
+    `filters` (source_type, device_brand, device_model, document_id) se aplica dentro de la
+    búsqueda, no sobre sus resultados. `profile` (fast | balanced | accurate, por defecto
+    SEARCH_PROFILE) fija el ef_search del índice HNSW para este request.
+    Búsquedas idénticas en curso se comparten (single-flight).
+    """
+    filters = {key: value for key, value in (filters or {}).items() if value}
+    ef_search = search_ef(profile)
+    key = (normalize_text(query), match_threshold, match_count, tuple(sorted(filters.items())), ef_search)
+    return await _search_flight.do(
+        key, _search_knowledge_matches, query, match_threshold, match_count, filters, ef_search
+    )
+
+def search_ef(profile: str = None) -> int:
+    """ef_search del perfil pedido (o del perfil por defecto si no existe)."""
+    profile = profile or SEARCH_PROFILE
+    if profile not in SEARCH_PROFILES:
+        logger.warning(f"Perfil de búsqueda desconocido '{profile}', se usa '{SEARCH_PROFILE}'")
+        profile = SEARCH_PROFILE
+    return SEARCH_PROFILES.get(profile)
+
+def _filter_params(filters: dict) -> dict:
+    # Solo los filtros usados (filter_source_type, filter_device_brand, ...; migración 007)
+    return {f"filter_{key}": value for key, value in filters.items()}
+
+async def _search_rpc(client, name: str, params: dict):
+    """RPC de búsqueda; si la base no tiene la firma con ef_search lo dice en el error."""
+    try:
+        return await run_blocking(client.rpc(name, params).execute)
+    except Exception as e:
+        # PGRST202: PostgREST no encontró una función con esos parámetros
+        if "ef_search" in params and getattr(e, "code", None) == "PGRST202":
+            raise RuntimeError(
+                f"La RPC {name} no acepta ef_search: aplicar la migración 008_hnsw_ef_search.sql "
+                f"o poner HNSW_EF_SEARCH_FAST/BALANCED/ACCURATE en {HNSW_DEFAULT_EF_SEARCH}"
+            ) from e
+        raise
+
+def _ef_search_params(ef_search: int) -> dict:
+    # Con el default de pgvector no se envía: las RPC anteriores a la migración 008 no tienen
+    # el parámetro y PostgREST rechazaría la llamada
+    if not ef_search or ef_search == HNSW_DEFAULT_EF_SEARCH:
+        return {}
+    return {"ef_search": ef_search}
+
+async def _search_knowledge_matches(
+    query: str,
+    match_threshold: float,
+    match_count: int,
+    filters: dict,
+    ef_search: int
+) -> list[dict]:
     client = get_supabase_client()
     if not client:
         logger.warning("Supabase no configurado, retornando lista vacía.")
         return []
 
     try:
-        # Check Cache
-        if query in query_cache:
-            logger.info(f"Query embedding found in cache: {query[:30]}...")
-            query_vector = query_cache[query]
-        else:
-            try:
-                # Embedding de la consulta (task_type retrieval_query es mejor para preguntas)
-                query_embedding_result = genai.embed_content(
-                    model=EMBEDDING_MODEL,
-                    content=query,
-                    task_type="retrieval_query"
-                )
-                query_vector = query_embedding_result['embedding']
-                query_cache[query] = query_vector
-            except Exception as e:
-                if "429" in str(e):
-                    logger.warning(f"Google API Quota exceeded (RAG Skipped): {e}")
-                    return [] # Fallback: No rag context
-                raise e
-        
-        # Llamar a la función RPC de Postgres (definida en Fase 1)
-        params = {
-            "query_embedding": query_vector,
-            "match_threshold": match_threshold,
-            "match_count": match_count
-        }
-        
-        response = client.rpc("match_knowledge", params).execute()
-        
-        # Devolver una lista de textos encontrados
-        matches = []
-        if response.data:
-            for item in response.data:
-                matches.append(item['content_chunk'])
-                
-        return matches
+        try:
+            query_vector = await embed_query(query)
+        except Exception as e:
+            # Cuota local agotada, 429 de Google o cualquier otra falla del embedder:
+            # la búsqueda léxica no depende de Gemini y sigue dando contexto
+            if isinstance(e, QuotaExceededError) or metrics.is_upstream_rate_limit(e):
+                reason = "Google API Quota exceeded"
+            else:
+                reason = "Error generando el embedding de la consulta"
+            if not HYBRID_SEARCH_ENABLED:
+                logger.warning(f"{reason} (RAG Skipped): {e}")
+                return [] # Fallback: No rag context
+            logger.warning(f"{reason}, búsqueda solo léxica: {e}")
+            query_vector = None
+
+        with metrics.stage_seconds.time(stage="knowledge_search"):
+            if vindex.index_available():
+                # Índice en memoria: sin round trip a Supabase
+                semantic = []
+                if query_vector is not None:
+                    semantic = vindex.vector_index.search(query_vector, match_threshold, match_count * 2, filters)
+                if not HYBRID_SEARCH_ENABLED:
+                    return semantic[:match_count]
+                lexical = vindex.vector_index.lexical_search(query, match_count * 2, filters)
+                return vindex.rrf_fuse([semantic, lexical], match_count)
+
+            if HYBRID_SEARCH_ENABLED:
+                params = {
+                    "query_text": query,
+                    "query_embedding": query_vector,
+                    "match_count": match_count,
+                    "match_threshold": match_threshold
+                }
+                if QUANTIZED_SEARCH:
+                    params["use_quantized"] = True
+                params.update(_filter_params(filters))
+                params.update(_ef_search_params(ef_search))
+                response = await _search_rpc(client, "hybrid_search_knowledge", params)
+            else:
+                # Llamar a la función RPC de Postgres (definida en Fase 1)
+                params = {
+                    "query_embedding": query_vector,
+                    "match_threshold": match_threshold,
+                    "match_count": match_count,
+                    **_filter_params(filters),
+                    **_ef_search_params(ef_search)
+                }
+                rpc_name = "match_knowledge_quantized" if QUANTIZED_SEARCH else "match_knowledge"
+                response = await _search_rpc(client, rpc_name, params)
+
+        return response.data or []
 
     except Exception as e:
         logger.error(f"Error buscando en knowledge base: {e}")
         return []
+
+async def init_vector_index():
+    """
+    Carga el espejo en memoria de knowledge_base (si VECTOR_INDEX_ENABLED y NumPy está disponible)
+    y arranca la sincronización incremental en segundo plano.
+    """
+    if not vindex.VECTOR_INDEX_ENABLED:
+        return
+    if vindex.np is None:
+        logger.warning("VECTOR_INDEX_ENABLED pero NumPy no está instalado; se usará la RPC match_knowledge")
+        return
+    client = get_supabase_client()
+    if not client:
+        logger.warning("Supabase no configurado, índice en memoria deshabilitado")
+        return
+
+    try:
+        rows = await run_blocking(vindex.fetch_rows, client)
+        vindex.vector_index.replace(rows)
+        logger.info(f"Vector index loaded with {len(vindex.vector_index)} chunks")
+    except Exception as e:
+        logger.error(f"Error cargando el índice en memoria (se usará la RPC): {e}")
+        return
+
+    asyncio.create_task(_sync_vector_index(client))
+
+async def _sync_vector_index(client):
+    # Trae solo lo insertado por otros workers; cada cierto tiempo recarga todo para reflejar borrados
+    last_full_reload = time.monotonic()
+    while True:
+        await asyncio.sleep(vindex.VECTOR_INDEX_SYNC_SECONDS)
+        try:
+            if time.monotonic() - last_full_reload >= vindex.VECTOR_INDEX_FULL_RELOAD_SECONDS:
+                rows = await run_blocking(vindex.fetch_rows, client)
+                vindex.vector_index.replace(rows)
+                last_full_reload = time.monotonic()
+                invalidate_answer_cache()
+            else:
+                rows = await run_blocking(vindex.fetch_rows, client, vindex.vector_index.last_created_at)
+                if vindex.vector_index.add_rows(rows, advance_cursor=True):
+                    # Otro worker agregó conocimiento: las respuestas cacheadas pueden estar obsoletas
+                    invalidate_answer_cache()
+        except Exception as e:
+            logger.error(f"Error sincronizando el índice en memoria: {e}")
@@ -0,0 +1,275 @@
+import os
+import time
+import heapq
+import sqlite3
+import asyncio
+import logging
+import itertools
+import threading
+from app.services import metrics
+from app.services.executor import run_blocking
+from datetime import datetime, timedelta, timezone
+try:
+    from zoneinfo import ZoneInfo
+    # Las cuotas diarias de Gemini se reinician a medianoche hora del Pacífico
+    QUOTA_TZ = ZoneInfo("America/Los_Angeles")
+except Exception:
+    QUOTA_TZ = timezone.utc
+
+logger = logging.getLogger(__name__)
+
+# Prioridades del scheduler (menor = antes): el chat de los técnicos va primero,
+# la ingesta usa la capacidad que sobra
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+# Uso diario persistido: sobrevive reinicios y se suma entre todos los workers de la máquina
+QUOTA_DB_PATH = os.getenv("QUOTA_DB_PATH", ".cache/quota.sqlite3")
+
+
+class QuotaExceededError(Exception):
+    """Se agotó la cuota diaria (RPD) de un modelo; esperar no sirve hasta el reinicio."""
+
+
+class QuotaUsageStore:
+    """Requests usadas por (limitador, día de cuota) en SQLite."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS quota_usage ("
+                " limiter TEXT NOT NULL,"
+                " day TEXT NOT NULL,"
+                " used INTEGER NOT NULL,"
+                " PRIMARY KEY (limiter, day))"
+            )
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def used(self, limiter: str, day) -> int:
+        row = self._conn().execute(
+            "SELECT used FROM quota_usage WHERE limiter = ? AND day = ?", (limiter, day.isoformat())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def add(self, limiter: str, day, cost: int) -> int:
+        """Suma `cost` al uso del día y devuelve el total (incluye lo usado por otros workers)."""
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO quota_usage (limiter, day, used) VALUES (?, ?, ?) "
+            "ON CONFLICT (limiter, day) DO UPDATE SET used = used + excluded.used",
+            (limiter, day.isoformat(), cost)
+        )
+        conn.commit()
+        return self.used(limiter, day)
+
+
+_usage_store = None
+
+
+def get_usage_store():
+    global _usage_store
+    if _usage_store is None and QUOTA_DB_PATH:
+        _usage_store = QuotaUsageStore(QUOTA_DB_PATH)
+    return _usage_store
+
+
+class AsyncRateLimiter:
+    """
+    Token bucket async compartido por todas las corrutinas del proceso.
+    - RPM: el bucket se rellena a rpm/60 tokens por segundo (capacidad = burst).
+    - RPD: contador diario persistido; al agotarse se lanza QuotaExceededError.
+    Los llamadores hacen cola en acquire() en lugar de recibir un 429. La cola se
+    atiende por prioridad (FIFO dentro de cada prioridad): una request interactiva
+    pasa delante de toda la ingesta en espera. Además el trabajo bulk no puede usar
+    las últimas `interactive_reserve` requests del día.
+    """
+
+    def __init__(self, name: str, rpm: int, rpd: int = None, burst: int = 1, interactive_reserve: int = 0):
+        self.name = name
+        self.rpm = rpm
+        self.rpd = rpd
+        self.interactive_reserve = interactive_reserve
+        self.capacity = max(1, burst)
+        self._rate = rpm / 60.0
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._day = self._today()
+        self._day_used = 0
+        self._day_loaded = False
+        self._load_lock = asyncio.Lock()
+        # (prioridad, orden de llegada, costo, future)
+        self._waiters = []
+        self._seq = itertools.count()
+        self._dispatcher = None
+
+    @staticmethod
+    def _today():
+        return datetime.now(QUOTA_TZ).date()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def _roll_day(self):
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            self._day_used = 0
+            self._day_loaded = False
+
+    async def _load_day(self):
+        self._roll_day()
+        store = get_usage_store()
+        if self._day_loaded or not store:
+            return
+        # Una sola lectura aunque lleguen muchas requests juntas (y sin alterar su orden de llegada)
+        async with self._load_lock:
+            if self._day_loaded:
+                return
+            try:
+                self._day_used = max(self._day_used, await run_blocking(store.used, self.name, self._day))
+            except Exception as e:
+                logger.warning(f"[{self.name}] No se pudo leer el uso diario persistido: {e}")
+            self._day_loaded = True
+
+    async def _record_usage(self, cost: int):
+        store = get_usage_store()
+        if not store:
+            return
+        try:
+            total = await run_blocking(store.add, self.name, self._day, cost)
+            self._day_used = max(self._day_used, total)
+        except Exception as e:
+            logger.warning(f"[{self.name}] No se pudo persistir el uso diario: {e}")
+
+    def used_today(self) -> int:
+        self._roll_day()
+        return self._day_used
+
+    def remaining_today(self):
+        """Requests restantes hoy (None si no hay límite diario)."""
+        self._roll_day()
+        if self.rpd is None:
+            return None
+        return max(0, self.rpd - self._day_used)
+
+    def seconds_until_reset(self) -> float:
+        now = datetime.now(QUOTA_TZ)
+        tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=QUOTA_TZ)
+        return (tomorrow - now).total_seconds()
+
+    def waiting(self) -> dict:
+        """Requests en cola por tipo de prioridad."""
+        pending = [priority for priority, _, _, future in self._waiters if not future.done()]
+        return {
+            "interactive": sum(1 for p in pending if p <= PRIORITY_INTERACTIVE),
+            "bulk": sum(1 for p in pending if p > PRIORITY_INTERACTIVE),
+        }
+
+    def _check_daily(self, cost: int, priority: int):
+        if self.rpd is None:
+            return
+        limit = self.rpd if priority <= PRIORITY_INTERACTIVE else self.rpd - self.interactive_reserve
+        if self._day_used + cost > limit:
+            metrics.rate_limited.inc(limiter=self.name, reason="daily_quota")
+            reserved = " (el resto está reservado para el chat)" if limit < self.rpd else ""
+            raise QuotaExceededError(
+                f"Cuota diaria agotada para {self.name} ({self.rpd} RPD){reserved}. "
+                f"Se reinicia en {int(self.seconds_until_reset())}s"
+            )
+
+    async def acquire(self, cost: int = 1, priority: int = PRIORITY_INTERACTIVE):
+        """Espera turno (por prioridad) hasta que haya `cost` tokens disponibles y los consume."""
+        await self._load_day()
+        self._check_daily(cost, priority)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), cost, future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self):
+        """Entrega tokens al primero de la cola de prioridad a medida que se rellena el bucket."""
+        while self._waiters:
+            priority, _, cost, future = self._waiters[0]
+            if future.done():
+                # El request se canceló mientras esperaba
+                heapq.heappop(self._waiters)
+                continue
+
+            self._refill()
+            if self._tokens < cost:
+                wait = (cost - self._tokens) / self._rate
+                logger.debug(f"[{self.name}] Esperando {wait:.2f}s por cuota RPM")
+                metrics.rate_limit_wait.inc(wait, limiter=self.name)
+                # Al despertar se vuelve a mirar la cabeza: pudo llegar algo más prioritario
+                await asyncio.sleep(wait)
+                continue
+
+            heapq.heappop(self._waiters)
+            self._roll_day()
+            try:
+                # Otro worker pudo consumir la cuota mientras esperaba en la cola
+                self._check_daily(cost, priority)
+            except QuotaExceededError as e:
+                future.set_exception(e)
+                continue
+            self._tokens -= cost
+            self._day_used += cost
+            future.set_result(None)
+            await self._record_usage(cost)
+
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "rpm": self.rpm,
+            "rpd": self.rpd,
+            "used_today": self.used_today(),
+            "remaining_today": self.remaining_today(),
+            "interactive_reserve": self.interactive_reserve,
+            "seconds_until_reset": int(self.seconds_until_reset()),
+            "waiting": self.waiting(),
+        }
+
+
+def _env_int(name: str, default):
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return int(value)
+
+
+_embed_rpd = _env_int("GEMINI_EMBED_RPD", 1500)
+
+# Limitadores compartidos (un bucket por modelo, igual que las cuotas de Google)
+embedding_limiter = AsyncRateLimiter(
+    "gemini-embedding",
+    rpm=_env_int("GEMINI_EMBED_RPM", 15),
+    rpd=_embed_rpd,
+    # Por defecto el 10% del día queda para los embeddings de las preguntas del chat
+    interactive_reserve=_env_int("GEMINI_EMBED_INTERACTIVE_RESERVE", (_embed_rpd or 0) // 10),
+)
+generation_limiter = AsyncRateLimiter(
+    "gemini-generation",
+    rpm=_env_int("GEMINI_GENERATE_RPM", 10),
+    rpd=_env_int("GEMINI_GENERATE_RPD", 20),
+)
+
+metrics.quota_remaining.set_function(lambda: [
+    ({"limiter": limiter.name}, limiter.remaining_today())
+    for limiter in (embedding_limiter, generation_limiter)
+])
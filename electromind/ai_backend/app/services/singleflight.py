@@ -0,0 +1,32 @@
+import asyncio
+import logging
+
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalescencia de llamadas concurrentes idénticas dentro del proceso:
+    mientras una llamada con la misma clave está en curso, las siguientes
+    esperan su resultado (o su excepción) en lugar de repetir el trabajo.
+    No cachea nada: al terminar, la siguiente llamada vuelve a ejecutarse.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight = {}
+
+    async def do(self, key, func, *args, **kwargs):
+        """Ejecuta `await func(*args, **kwargs)` una sola vez por clave en vuelo."""
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _, key=key: self._in_flight.pop(key, None))
+        else:
+            metrics.coalesced_calls.inc(flight=self.name)
+            logger.debug(f"[{self.name}] Llamada coalescida con una en curso")
+        # shield: si se cancela un request (cliente desconectado) los demás siguen esperando el resultado
+        return await asyncio.shield(task)
@@ -0,0 +1,110 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime
+
+from app.services.rag_service import get_supabase_client
+from app.services.executor import run_blocking
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Resultados de list_tickets cacheados por pocos segundos. El caché es de cada proceso: el
+# webhook de tickets solo limpia el del worker que lo recibe, así que en los demás un cambio
+# tarda como mucho TICKETS_CACHE_TTL_SECONDS en verse. Ese es el límite de datos obsoletos.
+TICKETS_CACHE_TTL_SECONDS = int(os.getenv("TICKETS_CACHE_TTL_SECONDS", "15"))
+MAX_TICKETS_PAGE = 20
+
+TICKET_STATUSES = ("pendiente", "revision", "reparando", "terminado", "entregado", "cancelado")
+
+TICKET_COLUMNS = "id, human_id, device_type, brand, model, status, problem_description, created_at"
+
+_cache_lock = threading.Lock()
+# (status, client_name, limit, (created_at, id) del cursor) -> (expira_en, resultado)
+_tickets_cache = {}
+
+
+def encode_cursor(ticket: dict) -> str:
+    return f"{ticket['created_at']}|{ticket['id']}"
+
+
+def _decode_cursor(cursor: str):
+    """
+    (created_at, id) del cursor, validados y re-serializados: el cursor llega del cliente
+    (o del LLM) y termina dentro de un filtro or_() de PostgREST.
+    """
+    created_at, _, ticket_id = cursor.partition("|")
+    try:
+        created_at = datetime.fromisoformat(created_at).isoformat()
+        ticket_id = str(uuid.UUID(ticket_id))
+    except ValueError:
+        raise ValueError("Cursor inválido")
+    return created_at, ticket_id
+
+
+def _query_tickets(client, status, client_name, limit, cursor):
+    if client_name:
+        # !inner convierte el join en filtro: solo tickets cuyo cliente coincide.
+        # El ilike '%...%' usa el índice trigram idx_clients_full_name_trgm.
+        query = client.table("tickets").select(f"{TICKET_COLUMNS}, clients!inner(full_name)")
+        query = query.ilike("clients.full_name", f"%{client_name}%")
+    else:
+        query = client.table("tickets").select(f"{TICKET_COLUMNS}, clients(full_name)")
+
+    if status:
+        query = query.eq("status", status)
+
+    if cursor:
+        # Keyset pagination: tickets estrictamente más antiguos que el último mostrado
+        created_at, ticket_id = cursor
+        query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{ticket_id})')
+
+    # Ordenar por fecha de creación descendente (id desempata para un orden estable)
+    query = query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1)
+    rows = query.execute().data or []
+    return {
+        "tickets": rows[:limit],
+        "next_cursor": encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    }
+
+
+async def list_tickets(status: str = None, client_name: str = None, limit: int = 5, cursor: str = None) -> dict:
+    """
+    Tickets más recientes filtrados en la base de datos (estado, nombre de cliente parcial).
+    Devuelve {"tickets": [...], "next_cursor": str | None}.
+    ValueError si el estado o el cursor no son válidos.
+    """
+    if status and status not in TICKET_STATUSES:
+        raise ValueError(f"Estado inválido: {status}")
+    cursor = _decode_cursor(cursor) if cursor else None
+    limit = max(1, min(int(limit or 5), MAX_TICKETS_PAGE))
+    client_name = client_name.strip() if client_name else None
+
+    key = (status, client_name.lower() if client_name else None, limit, cursor)
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _tickets_cache.get(key)
+        if cached and cached[0] > now:
+            metrics.record_cache("tickets", hits=1)
+            return cached[1]
+    metrics.record_cache("tickets", misses=1)
+
+    client = get_supabase_client()
+    if not client:
+        raise Exception("Supabase no está configurado (Error de cliente o faltan keys)")
+
+    result = await run_blocking(_query_tickets, client, status, client_name, limit, cursor)
+    with _cache_lock:
+        # Limpiar vencidos para que el dict no crezca sin límite
+        for expired in [k for k, (expires, _) in _tickets_cache.items() if expires <= now]:
+            del _tickets_cache[expired]
+        _tickets_cache[key] = (now + TICKETS_CACHE_TTL_SECONDS, result)
+    return result
+
+
+def invalidate_tickets_cache():
+    """Limpia el caché de este proceso (los otros workers expiran por TTL)."""
+    with _cache_lock:
+        _tickets_cache.clear()
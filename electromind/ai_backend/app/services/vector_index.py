@@ -0,0 +1,262 @@
+import os
+import re
+import json
+import math
+import logging
+import threading
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# Espejo en memoria de knowledge_base para responder búsquedas sin ir a la red
+VECTOR_INDEX_ENABLED = os.getenv("VECTOR_INDEX_ENABLED", "false").lower() in ("1", "true", "yes")
+
+np = None
+if VECTOR_INDEX_ENABLED:
+    # Solo se importa si el índice está habilitado (acelera el arranque)
+    try:
+        import numpy as np
+    except ImportError:
+        # NumPy es opcional: sin él se usa siempre la RPC match_knowledge
+        np = None
+
+VECTOR_INDEX_SYNC_SECONDS = int(os.getenv("VECTOR_INDEX_SYNC_SECONDS", "60"))
+# Recarga completa periódica para reflejar borrados hechos fuera de este worker
+VECTOR_INDEX_FULL_RELOAD_SECONDS = int(os.getenv("VECTOR_INDEX_FULL_RELOAD_SECONDS", "3600"))
+# float16 guarda la mitad de RAM por vector; el error en la similitud (~1e-3) no cambia el ranking útil
+VECTOR_INDEX_PRECISION = os.getenv("VECTOR_INDEX_PRECISION", "float32").lower()
+# Filas por bloque al buscar en float16 (se convierten a float32 de a un bloque)
+SEARCH_BLOCK_ROWS = 8192
+PAGE_SIZE = 1000
+
+INDEX_COLUMNS = "id, content_chunk, source_type, metadata, source_id, embedding, created_at"
+# Constante de Reciprocal Rank Fusion (la misma que usa hybrid_search_knowledge)
+RRF_K = 60
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _parse_embedding(value):
+    # PostgREST devuelve vector(768) como texto "[0.1,0.2,...]"
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
+
+
+def lexical_terms(text: str) -> set:
+    """Términos en minúsculas y sin tildes ("Batería" y "bateria" coinciden)."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return set(_TERM_RE.findall(text))
+
+
+def matches_filters(row: dict, filters: dict) -> bool:
+    """Mismos filtros que las funciones SQL (marca y modelo sin distinguir mayúsculas)."""
+    if not filters:
+        return True
+    metadata = row.get("metadata") or {}
+    if filters.get("source_type") and row.get("source_type") != filters["source_type"]:
+        return False
+    for key in ("device_brand", "device_model"):
+        if filters.get(key) and str(metadata.get(key) or "").lower() != filters[key].lower():
+            return False
+    if filters.get("document_id") and str(row.get("source_id")) != str(filters["document_id"]):
+        return False
+    return True
+
+
+def rrf_fuse(rankings: list[list[dict]], match_count: int, k: int = RRF_K) -> list[dict]:
+    """
+    Reciprocal Rank Fusion de varias listas ordenadas de filas (por id).
+    El score queda normalizado: 1.0 = primer puesto en todas las listas.
+    """
+    scores = {}
+    rows = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            scores[row["id"]] = scores.get(row["id"], 0.0) + 1.0 / (k + rank)
+            # La fila vectorial (con similarity) tiene prioridad sobre la léxica
+            rows.setdefault(row["id"], row)
+    best = len(rankings) / (k + 1)
+    ordered = sorted(scores, key=scores.get, reverse=True)[:match_count]
+    return [{**rows[row_id], "score": scores[row_id] / best} for row_id in ordered]
+
+
+class VectorIndex:
+    """
+    Búsqueda por fuerza bruta (producto punto sobre vectores normalizados) con NumPy.
+    Para unos miles de vectores de 768 dimensiones responde en menos de 1 ms.
+    Con VECTOR_INDEX_PRECISION=float16 la matriz ocupa la mitad y se multiplica por bloques en float32.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.last_created_at = None
+        self._lock = threading.Lock()
+        self._ids = []
+        self._rows = []
+        self._terms = []
+        self._matrix = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _build(self, rows):
+        vectors = np.asarray([_parse_embedding(row["embedding"]) for row in rows], dtype=np.float32)
+        if len(vectors):
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+        if VECTOR_INDEX_PRECISION == "float16":
+            vectors = vectors.astype(np.float16)
+        entries = [
+            {
+                "id": row["id"],
+                "content_chunk": row["content_chunk"],
+                "source_type": row.get("source_type"),
+                "metadata": row.get("metadata") or {},
+                "source_id": row.get("source_id"),
+            }
+            for row in rows
+        ]
+        terms = [lexical_terms(row["content_chunk"] or "") for row in rows]
+        return vectors, entries, terms
+
+    def replace(self, rows):
+        """Reemplaza todo el contenido del índice."""
+        vectors, entries, terms = self._build(rows)
+        with self._lock:
+            self._ids = [entry["id"] for entry in entries]
+            self._rows = entries
+            self._terms = terms
+            self._matrix = vectors if len(vectors) else None
+            self.last_created_at = max((row["created_at"] for row in rows if row.get("created_at")), default=None)
+            self.ready = True
+
+    def add_rows(self, rows, advance_cursor: bool = False) -> int:
+        """
+        Agrega filas nuevas (ignora ids ya presentes). Devuelve cuántas se agregaron.
+        Solo las filas leídas con fetch_rows (advance_cursor=True) mueven last_created_at:
+        un insert local no prueba que ya se leyó lo que otros workers insertaron antes.
+        """
+        with self._lock:
+            if advance_cursor:
+                newest = max((row["created_at"] for row in rows if row.get("created_at")), default=None)
+                if newest and (self.last_created_at is None or newest > self.last_created_at):
+                    self.last_created_at = newest
+            known = set(self._ids)
+            rows = [row for row in rows if row.get("id") and row.get("embedding") is not None and row["id"] not in known]
+            if not rows:
+                return 0
+            vectors, entries, terms = self._build(rows)
+            self._matrix = vectors if self._matrix is None else np.vstack([self._matrix, vectors])
+            self._ids = self._ids + [entry["id"] for entry in entries]
+            self._rows = self._rows + entries
+            self._terms = self._terms + terms
+        return len(rows)
+
+    def remove_ids(self, ids):
+        ids = set(ids)
+        with self._lock:
+            keep = [i for i, row_id in enumerate(self._ids) if row_id not in ids]
+            if len(keep) == len(self._ids):
+                return
+            self._ids = [self._ids[i] for i in keep]
+            self._rows = [self._rows[i] for i in keep]
+            self._terms = [self._terms[i] for i in keep]
+            self._matrix = self._matrix[keep] if keep else None
+
+    def search(self, query_vector, match_threshold: float, match_count: int, filters: dict = None) -> list[dict]:
+        """Top-k por similitud coseno, con el mismo contrato que la RPC match_knowledge."""
+        with self._lock:
+            matrix, rows = self._matrix, self._rows
+        if matrix is None:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        if filters:
+            # Solo se puntúa la porción filtrada
+            keep = np.asarray([i for i, row in enumerate(rows) if matches_filters(row, filters)], dtype=np.intp)
+            if not len(keep):
+                return []
+            matrix = matrix[keep]
+            rows = [rows[i] for i in keep]
+        scores = _scores(matrix, query)
+
+        k = min(match_count, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for i in top:
+            similarity = float(scores[i])
+            if similarity <= match_threshold:
+                break
+            results.append({**rows[i], "similarity": similarity})
+        return results
+
+    def lexical_search(self, query: str, match_count: int, filters: dict = None) -> list[dict]:
+        """
+        Top-k por coincidencia de términos ponderada por IDF (los términos raros como "C402" pesan más).
+        No necesita embedding de la query.
+        """
+        query_terms = lexical_terms(query)
+        with self._lock:
+            rows, terms = self._rows, self._terms
+        if not query_terms or not rows:
+            return []
+
+        doc_freq = dict.fromkeys(query_terms, 0)
+        matched = []
+        for i, row_terms in enumerate(terms):
+            common = query_terms & row_terms
+            if common and matches_filters(rows[i], filters):
+                matched.append((i, common))
+                for term in common:
+                    doc_freq[term] += 1
+        if not matched:
+            return []
+
+        total = len(rows)
+        idf = {term: math.log(1 + total / df) for term, df in doc_freq.items() if df}
+        scored = sorted(
+            ((sum(idf[t] for t in common), i) for i, common in matched),
+            key=lambda item: item[0],
+            reverse=True
+        )[:match_count]
+        return [rows[i] for _, i in scored]
+
+
+def _scores(matrix, query):
+    if matrix.dtype == np.float32:
+        return matrix @ query
+    # float16 @ float32 promovería toda la matriz de una vez: se convierte por bloques
+    scores = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), SEARCH_BLOCK_ROWS):
+        block = matrix[start:start + SEARCH_BLOCK_ROWS]
+        scores[start:start + len(block)] = block.astype(np.float32) @ query
+    return scores
+
+
+vector_index = VectorIndex()
+
+
+def index_available() -> bool:
+    return VECTOR_INDEX_ENABLED and np is not None and vector_index.ready
+
+
+def fetch_rows(client, newer_than=None) -> list[dict]:
+    """Lee knowledge_base paginando (todo, o solo lo creado después de `newer_than`)."""
+    rows = []
+    start = 0
+    while True:
+        query = client.table("knowledge_base").select(INDEX_COLUMNS)
+        if newer_than:
+            # gte + dedup por id en add_rows: no perder filas con el mismo timestamp
+            query = query.gte("created_at", newer_than)
+        # Orden total (created_at, id): con timestamps repetidos las páginas no se solapan ni saltean filas
+        page = query.order("created_at").order("id").range(start, start + PAGE_SIZE - 1).execute()
+        rows.extend(page.data or [])
+        if not page.data or len(page.data) < PAGE_SIZE:
+            return rows
+        start += PAGE_SIZE
@@ -0,0 +1,358 @@
+"""
+Dobles locales de Gemini y Supabase para medir el backend sin red ni cuota.
+
+Cada llamada "remota" duerme la latencia configurada (en el hilo que la ejecuta,
+igual que las llamadas bloqueantes reales que hace run_blocking).
+"""
+import re
+import time
+import uuid
+import hashlib
+import threading
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import numpy as np
+
+EMBEDDING_DIM = 768
+
+
+class Latency:
+    """Latencias simuladas en segundos (se pueden cambiar entre escenarios)."""
+
+    def __init__(self, embed: float = 0.08, generate: float = 0.6, db: float = 0.02):
+        self.embed = embed
+        self.generate = generate
+        self.db = db
+
+
+def fake_embedding(text: str) -> list[float]:
+    """Vector determinista por texto: mismos textos, mismo vector (el caché de embeddings sigue funcionando)."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIM).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+# ---------------------------------------------------------------------------
+# Gemini
+# ---------------------------------------------------------------------------
+
+class FakeGenAI:
+    """Reemplaza genai.embed_content y genai.GenerativeModel."""
+
+    def __init__(self, latency: Latency, answer: str = "Revise el conector de carga y mida el voltaje de la batería."):
+        self.latency = latency
+        self.answer = answer
+        self.embed_calls = 0
+        self.generate_calls = 0
+        self._lock = threading.Lock()
+
+    def embed_content(self, model, content, task_type=None, title=None, **kwargs):
+        with self._lock:
+            self.embed_calls += 1
+        time.sleep(self.latency.embed)
+        if isinstance(content, str):
+            return {"embedding": fake_embedding(content)}
+        return {"embedding": [fake_embedding(text) for text in content]}
+
+    def generative_model(self, *args, **kwargs):
+        return FakeGenerativeModel(self)
+
+    def install(self, genai_module):
+        genai_module.embed_content = self.embed_content
+        genai_module.GenerativeModel = self.generative_model
+
+
+def _fake_response(text: str):
+    part = SimpleNamespace(text=text, function_call=None)
+    return SimpleNamespace(
+        prompt_feedback=SimpleNamespace(block_reason=None),
+        candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))],
+        parts=[part],
+        text=text,
+    )
+
+
+class FakeGenerativeModel:
+    def __init__(self, genai: FakeGenAI):
+        self._genai = genai
+
+    def generate_content(self, prompt, stream: bool = False, **kwargs):
+        with self._genai._lock:
+            self._genai.generate_calls += 1
+        words = self._genai.answer.split(" ")
+        if not stream:
+            time.sleep(self._genai.latency.generate)
+            return _fake_response(self._genai.answer)
+
+        def chunks():
+            # Tiempo hasta el primer token ~1/3 del total, el resto repartido entre fragmentos
+            time.sleep(self._genai.latency.generate / 3)
+            for i in range(0, len(words), 4):
+                time.sleep(self._genai.latency.generate * 2 / 3 / max(1, len(words) // 4))
+                yield _fake_response(" ".join(words[i:i + 4]) + " ")
+        return chunks()
+
+
+# ---------------------------------------------------------------------------
+# Supabase
+# ---------------------------------------------------------------------------
+
+def _parse_vector(value):
+    if isinstance(value, str):
+        value = [float(x) for x in value.strip("[]").split(",")]
+    return np.asarray(value, dtype=np.float32)
+
+
+def _matches(row, filter_source_type=None, filter_device_brand=None, filter_device_model=None,
+             filter_document_id=None) -> bool:
+    metadata = row.get("metadata") or {}
+    return (
+        (filter_source_type is None or row.get("source_type") == filter_source_type)
+        and (filter_device_brand is None or str(metadata.get("device_brand", "")).lower() == filter_device_brand.lower())
+        and (filter_device_model is None or str(metadata.get("device_model", "")).lower() == filter_device_model.lower())
+        and (filter_document_id is None or row.get("source_id") == filter_document_id)
+    )
+
+
+def _cosine(matrix, vector):
+    vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+    norms = np.maximum(np.linalg.norm(matrix, axis=1), 1e-12)
+    return (matrix @ vector) / norms
+
+
+class FakeQuery:
+    """Subconjunto del query builder de postgrest-py usado por el backend."""
+
+    def __init__(self, db, table: str):
+        self._db = db
+        self._table = table
+        self._filters = []
+        self._insert = None
+        self._order = []
+        self._limit = None
+        self._range = None
+
+    def select(self, columns: str = "*"):
+        return self
+
+    def insert(self, rows):
+        self._insert = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def eq(self, column, value):
+        self._filters.append(lambda row: str(row.get(column)) == str(value))
+        return self
+
+    def is_(self, column, value):
+        # Solo se usa con "null"
+        self._filters.append(lambda row: row.get(column) is None)
+        return self
+
+    def gte(self, column, value):
+        self._filters.append(lambda row: row.get(column) is not None and row[column] >= value)
+        return self
+
+    def ilike(self, column, pattern):
+        needle = pattern.strip("%").lower()
+        key = column.split(".")[-1]
+        self._filters.append(lambda row: needle in str(row.get(key, "")).lower())
+        return self
+
+    def or_(self, expression):
+        # Solo se usa para la paginación por cursor: no afecta a los benchmarks
+        return self
+
+    def order(self, column, desc: bool = False):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def range(self, start, end):
+        self._range = (start, end)
+        return self
+
+    def execute(self):
+        time.sleep(self._db.latency.db)
+        if self._insert is not None:
+            return SimpleNamespace(data=self._db.insert(self._table, self._insert))
+
+        rows = [row for row in self._db.rows(self._table) if all(f(row) for f in self._filters)]
+        for column, desc in reversed(self._order):
+            rows.sort(key=lambda row: str(row.get(column, "")), reverse=desc)
+        if self._range:
+            rows = rows[self._range[0]:self._range[1] + 1]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        return SimpleNamespace(data=[dict(row) for row in rows])
+
+
+class FakeRPC:
+    def __init__(self, db, name: str, params: dict):
+        self._db = db
+        self._name = name
+        self._params = params
+
+    def execute(self):
+        time.sleep(self._db.latency.db)
+        handler = getattr(self._db, f"rpc_{self._name}", None)
+        if handler is None:
+            raise Exception(f"Could not find the function public.{self._name}")
+        return SimpleNamespace(data=handler(**self._params))
+
+
+class FakeSupabase:
+    """
+    Supabase en memoria: tablas como listas de dicts y las funciones RPC de
+    knowledge_base (match_knowledge, match_knowledge_quantized, match_knowledge_batch,
+    hybrid_search_knowledge, document_chunk_hashes, sync_document_chunks) calculadas con
+    NumPy por fuerza bruta (la variante cuantizada y cualquier ef_search dan el resultado exacto).
+    """
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._tables = {}
+        # Matriz de embeddings de knowledge_base; se invalida en cada insert
+        self._matrix_cache = None
+
+    def table(self, name: str):
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: dict = None):
+        return FakeRPC(self, name, params or {})
+
+    def rows(self, table: str) -> list[dict]:
+        with self._lock:
+            return list(self._tables.get(table, []))
+
+    def insert(self, table: str, rows: list[dict]) -> list[dict]:
+        now = datetime.now(timezone.utc).isoformat()
+        stored = [{"id": str(uuid.uuid4()), "created_at": now, **row} for row in rows]
+        with self._lock:
+            self._tables.setdefault(table, []).extend(stored)
+            if table == "knowledge_base":
+                self._matrix_cache = None
+        return [dict(row) for row in stored]
+
+    def seed_knowledge(self, chunks: list[str], source: str = "seed.pdf", source_type: str = "manual"):
+        self.insert("knowledge_base", [
+            {
+                "content_chunk": chunk,
+                "source_type": source_type,
+                "metadata": {"source": source, "chunk_index": i},
+                "embedding": fake_embedding(chunk),
+            }
+            for i, chunk in enumerate(chunks)
+        ])
+
+    def _knowledge_matrix(self):
+        with self._lock:
+            if self._matrix_cache is not None:
+                return self._matrix_cache
+        rows = [row for row in self.rows("knowledge_base") if row.get("embedding") is not None]
+        matrix = np.stack([_parse_vector(row["embedding"]) for row in rows]) if rows else None
+        with self._lock:
+            self._matrix_cache = (rows, matrix)
+        return rows, matrix
+
+    @staticmethod
+    def _result(row, similarity, **extra):
+        return {
+            "id": row["id"],
+            "content_chunk": row["content_chunk"],
+            "source_type": row.get("source_type"),
+            "metadata": row.get("metadata"),
+            "similarity": similarity,
+            **extra,
+        }
+
+    def rpc_match_knowledge(self, query_embedding, match_threshold, match_count, ef_search=None, **filters):
+        rows, matrix = self._knowledge_matrix()
+        if matrix is None:
+            return []
+        scores = _cosine(matrix, _parse_vector(query_embedding))
+        if filters:
+            scores = np.where([_matches(row, **filters) for row in rows], scores, -1.0)
+        order = np.argsort(-scores)[:match_count]
+        return [self._result(rows[i], float(scores[i])) for i in order if scores[i] > match_threshold]
+
+    def rpc_match_knowledge_quantized(self, query_embedding, match_threshold, match_count, rerank_multiplier=10,
+                                      ef_search=None, **filters):
+        return self.rpc_match_knowledge(query_embedding, match_threshold, match_count, **filters)
+
+    def rpc_match_knowledge_batch(self, query_embeddings, match_threshold, exclude_source_id=None,
+                                  use_quantized=False, ef_search=None):
+        rows, matrix = self._knowledge_matrix()
+        if matrix is None:
+            return []
+        excluded = np.asarray([exclude_source_id is not None and row.get("source_id") == exclude_source_id for row in rows])
+        results = []
+        for idx, embedding in enumerate(query_embeddings):
+            scores = np.where(excluded, -1.0, _cosine(matrix, _parse_vector(embedding)))
+            best = int(np.argmax(scores))
+            if scores[best] > match_threshold:
+                results.append({"idx": idx, "id": rows[best]["id"], "similarity": float(scores[best])})
+        return results
+
+    def rpc_document_chunk_hashes(self, p_document_id, p_source, p_device_brand=None, p_device_model=None):
+        with self._lock:
+            for row in self._tables.get("knowledge_base", []):
+                metadata = row.get("metadata") or {}
+                if (row.get("source_id") is None and metadata.get("source") == p_source
+                        and metadata.get("device_brand") == p_device_brand
+                        and metadata.get("device_model") == p_device_model):
+                    row["source_id"] = p_document_id
+        return sorted({
+            row["content_hash"] for row in self.rows("knowledge_base")
+            if row.get("source_id") == p_document_id and row.get("content_hash")
+        })
+
+    def rpc_sync_document_chunks(self, p_document_id, p_hashes):
+        positions = {}
+        for i, chunk_hash in enumerate(p_hashes):
+            positions.setdefault(chunk_hash, i)
+        with self._lock:
+            rows = self._tables.get("knowledge_base", [])
+            deleted = [
+                row["id"] for row in rows
+                if row.get("source_id") == p_document_id and row.get("content_hash") not in positions
+            ]
+            self._tables["knowledge_base"] = [row for row in rows if row["id"] not in set(deleted)]
+            for row in self._tables["knowledge_base"]:
+                if row.get("source_id") == p_document_id:
+                    row["metadata"] = {**(row.get("metadata") or {}), "chunk_index": positions[row["content_hash"]]}
+            self._matrix_cache = None
+        return deleted
+
+    def rpc_hybrid_search_knowledge(self, query_text, query_embedding=None, match_count=5,
+                                    match_threshold=0.7, full_text_weight=1.0, semantic_weight=1.0, rrf_k=60,
+                                    use_quantized=False, ef_search=None, **filters):
+        rows = [row for row in self.rows("knowledge_base") if _matches(row, **filters)]
+        terms = set(re.findall(r"\w+", query_text.lower()))
+        lexical = sorted(
+            ((len(terms & set(re.findall(r"\w+", row["content_chunk"].lower()))), row["id"]) for row in rows),
+            reverse=True
+        )
+        full_text = [row_id for hits, row_id in lexical if hits][:match_count * 2]
+        semantic = []
+        similarities = {}
+        if query_embedding is not None:
+            for match in self.rpc_match_knowledge(query_embedding, match_threshold, match_count * 2, **filters):
+                semantic.append(match["id"])
+                similarities[match["id"]] = match["similarity"]
+
+        scores = {}
+        for ranking, weight in ((full_text, full_text_weight), (semantic, semantic_weight)):
+            for rank, row_id in enumerate(ranking, start=1):
+                scores[row_id] = scores.get(row_id, 0.0) + weight / (rrf_k + rank)
+        best = (full_text_weight + semantic_weight) / (rrf_k + 1)
+        by_id = {row["id"]: row for row in rows}
+        ordered = sorted(scores, key=scores.get, reverse=True)[:match_count]
+        return [
+            self._result(by_id[row_id], similarities.get(row_id), score=scores[row_id] / best)
+            for row_id in ordered
+        ]
@@ -0,0 +1,199 @@
+"""
+Ajuste del índice HNSW de knowledge_base: recall@k contra latencia.
+
+1. Copia id + embedding de knowledge_base a una tabla UNLOGGED de trabajo (el índice de
+   producción no se toca).
+2. Toma un conjunto de consultas (embeddings de chunks al azar, o un archivo JSON con
+   vectores de preguntas reales) y calcula sus k vecinos exactos por fuerza bruta.
+3. Para cada combinación de índice (m, ef_construction) construye el HNSW y, para cada
+   ef_search, mide recall@k y latencia p50/p99 de las consultas.
+4. Sugiere el ef_search más rápido que alcanza cada recall objetivo, para los perfiles
+   HNSW_EF_SEARCH_FAST / BALANCED / ACCURATE del backend.
+
+Necesita conexión directa a Postgres (la API de Supabase no permite crear índices) y
+psycopg 3, que no es dependencia del backend:
+    pip install "psycopg[binary]"
+
+Uso (desde ai_backend/):
+    DATABASE_URL=postgresql://... python -m benchmarks.hnsw_tuning
+    python -m benchmarks.hnsw_tuning --dsn postgresql://... --queries 200 --k 10 \\
+        --m 8 16 32 --ef-construction 64 128 --ef-search 20 40 80 160 320
+"""
+import os
+import json
+import time
+import argparse
+
+from benchmarks.stats import percentile
+
+WORK_TABLE = "hnsw_tuning_vectors"
+WORK_INDEX = "hnsw_tuning_idx"
+# Recall objetivo de cada perfil de búsqueda del backend (rag_service.SEARCH_PROFILES)
+PROFILE_TARGETS = {"fast": 0.90, "balanced": 0.95, "accurate": 0.99}
+
+
+def connect(dsn: str):
+    try:
+        import psycopg
+    except ImportError:
+        raise SystemExit('Falta psycopg: pip install "psycopg[binary]"')
+    return psycopg.connect(dsn, autocommit=True)
+
+
+def prepare_work_table(conn, limit: int = None) -> int:
+    """Copia los embeddings a la tabla de trabajo. Devuelve cuántas filas tiene."""
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {WORK_TABLE}")
+        query = (
+            f"CREATE UNLOGGED TABLE {WORK_TABLE} AS "
+            "SELECT id, embedding FROM public.knowledge_base WHERE embedding IS NOT NULL"
+        )
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        cur.execute(query)
+        cur.execute(f"ANALYZE {WORK_TABLE}")
+        cur.execute(f"SELECT count(*) FROM {WORK_TABLE}")
+        return cur.fetchone()[0]
+
+
+def load_queries(conn, count: int, queries_file: str = None, seed: float = 0.42) -> list[tuple]:
+    """
+    Lista de (id del chunk o None, vector como texto de pgvector).
+    Con queries_file (JSON: lista de vectores) se usan preguntas reales ya embebidas.
+    """
+    if queries_file:
+        with open(queries_file, encoding="utf-8") as f:
+            vectors = json.load(f)
+        return [(None, "[" + ",".join(str(x) for x in vector) + "]") for vector in vectors[:count]]
+    with conn.cursor() as cur:
+        cur.execute("SELECT setseed(%s)", (seed,))
+        cur.execute(f"SELECT id, embedding::text FROM {WORK_TABLE} ORDER BY random() LIMIT %s", (count,))
+        return cur.fetchall()
+
+
+def _search(cur, vector: str, k: int, exclude_id=None) -> list:
+    # k + 1: si la consulta es un chunk guardado, él mismo no cuenta como vecino
+    cur.execute(
+        f"SELECT id FROM {WORK_TABLE} ORDER BY embedding <=> %s::vector LIMIT %s",
+        (vector, k + 1)
+    )
+    return [row[0] for row in cur.fetchall() if row[0] != exclude_id][:k]
+
+
+def ground_truth(conn, queries: list[tuple], k: int) -> list[set]:
+    """Vecinos exactos (recorrido secuencial, sin índice)."""
+    with conn.transaction(), conn.cursor() as cur:
+        cur.execute("SET LOCAL enable_indexscan = off")
+        cur.execute("SET LOCAL enable_bitmapscan = off")
+        return [set(_search(cur, vector, k, query_id)) for query_id, vector in queries]
+
+
+def build_index(conn, m: int, ef_construction: int) -> dict:
+    with conn.cursor() as cur:
+        cur.execute(f"DROP INDEX IF EXISTS {WORK_INDEX}")
+        started = time.perf_counter()
+        cur.execute(
+            f"CREATE INDEX {WORK_INDEX} ON {WORK_TABLE} USING hnsw (embedding vector_cosine_ops) "
+            f"WITH (m = {int(m)}, ef_construction = {int(ef_construction)})"
+        )
+        build_seconds = time.perf_counter() - started
+        cur.execute("SELECT pg_relation_size(%s)", (WORK_INDEX,))
+        size = cur.fetchone()[0]
+    return {"build_seconds": round(build_seconds, 2), "index_mb": round(size / 1024 / 1024, 1)}
+
+
+def measure(conn, queries: list[tuple], truth: list[set], k: int, ef_search: int) -> dict:
+    """recall@k y latencia (ida y vuelta desde el cliente) con un ef_search dado."""
+    latencies = []
+    hits = 0
+    with conn.transaction(), conn.cursor() as cur:
+        cur.execute(f"SET LOCAL hnsw.ef_search = {int(ef_search)}")
+        # Calentamiento: páginas del índice en caché antes de medir
+        for query_id, vector in queries[:10]:
+            _search(cur, vector, k, query_id)
+        for (query_id, vector), expected in zip(queries, truth):
+            started = time.perf_counter()
+            found = _search(cur, vector, k, query_id)
+            latencies.append(time.perf_counter() - started)
+            hits += len(expected & set(found))
+    latencies.sort()
+    expected_total = sum(len(expected) for expected in truth) or 1
+    return {
+        "ef_search": ef_search,
+        "recall": round(hits / expected_total, 4),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def recommend(results: list[dict]) -> dict:
+    """Por perfil: la configuración de menor p50 que alcanza su recall objetivo."""
+    suggestions = {}
+    for profile, target in PROFILE_TARGETS.items():
+        candidates = [r for r in results if r["recall"] >= target]
+        if candidates:
+            suggestions[profile] = min(candidates, key=lambda r: (r["p50_ms"], r["ef_search"]))
+    return suggestions
+
+
+def main(args) -> dict:
+    dsn = args.dsn or os.getenv("DATABASE_URL")
+    if not dsn:
+        raise SystemExit("Indicar --dsn o DATABASE_URL (conexión directa a Postgres)")
+
+    conn = connect(dsn)
+    try:
+        rows = prepare_work_table(conn, args.limit_rows)
+        queries = load_queries(conn, args.queries, args.queries_file)
+        print(f"{rows} vectores, {len(queries)} consultas, k={args.k}")
+        started = time.perf_counter()
+        truth = ground_truth(conn, queries, args.k)
+        print(f"Vecinos exactos calculados en {time.perf_counter() - started:.1f}s")
+
+        results = []
+        for m in args.m:
+            for ef_construction in args.ef_construction:
+                index = build_index(conn, m, ef_construction)
+                print(f"m={m} ef_construction={ef_construction}: build {index['build_seconds']}s, "
+                      f"{index['index_mb']} MB")
+                for ef_search in args.ef_search:
+                    result = {"m": m, "ef_construction": ef_construction, **index,
+                              **measure(conn, queries, truth, args.k, ef_search)}
+                    results.append(result)
+                    print(f"    ef_search={ef_search:<4} recall@{args.k}={result['recall']:.3f} "
+                          f"p50={result['p50_ms']}ms p99={result['p99_ms']}ms")
+    finally:
+        if not args.keep:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {WORK_TABLE}")
+        conn.close()
+
+    suggestions = recommend(results)
+    for profile, result in suggestions.items():
+        print(f"{profile:<9} (recall >= {PROFILE_TARGETS[profile]}): HNSW_EF_SEARCH_{profile.upper()}="
+              f"{result['ef_search']} con m={result['m']} ef_construction={result['ef_construction']} "
+              f"(recall {result['recall']}, p50 {result['p50_ms']}ms)")
+    return {"rows": rows, "queries": len(queries), "k": args.k, "results": results, "suggestions": suggestions}
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Barrido de parámetros HNSW: recall@k vs. latencia")
+    parser.add_argument("--dsn", help="conexión a Postgres (por defecto DATABASE_URL)")
+    parser.add_argument("--queries", type=int, default=200, help="consultas del barrido")
+    parser.add_argument("--queries-file", help="JSON con vectores de preguntas reales (en lugar de chunks al azar)")
+    parser.add_argument("--k", type=int, default=10, help="vecinos para recall@k")
+    parser.add_argument("--limit-rows", type=int, help="usar solo las primeras N filas de knowledge_base")
+    parser.add_argument("--m", type=int, nargs="+", default=[16])
+    parser.add_argument("--ef-construction", type=int, nargs="+", default=[64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[20, 40, 80, 100, 200, 400])
+    parser.add_argument("--keep", action="store_true", help="no borrar la tabla de trabajo al terminar")
+    parser.add_argument("--json", help="guardar los resultados en este archivo")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    report = main(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False, default=str)
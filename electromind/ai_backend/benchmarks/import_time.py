@@ -0,0 +1,81 @@
+"""
+Presupuesto de tiempo de importación de app.main (arranque en frío de una réplica).
+
+Importa la app en un intérprete nuevo con `python -X importtime`, informa el total y
+los módulos más caros, y falla (código 1) si se pasa del presupuesto o si se cargan al
+importar SDKs que deben ser perezosos (Gemini, Supabase, pypdf).
+
+Uso (desde ai_backend/):
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget-ms 600 --runs 5 --top 15
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+# Módulos que solo se importan al primer uso (model_registry.get_genai, get_supabase_client, pdf_parser)
+LAZY_MODULES = ("google.generativeai", "supabase", "pypdf")
+DEFAULT_BUDGET_MS = 600
+
+
+def measure_once() -> tuple[float, dict]:
+    """Devuelve (ms totales de import app.main, {módulo: ms acumulados})."""
+    env = dict(os.environ)
+    # Sin índice en memoria (NumPy): se mide lo que paga toda réplica
+    env["VECTOR_INDEX_ENABLED"] = "false"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        capture_output=True, text=True, env=env, check=True
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            modules[name.strip()] = int(cumulative) / 1000
+        except ValueError:
+            # Encabezado de la tabla
+            continue
+    return modules.get("app.main", 0.0), modules
+
+
+def main(args) -> int:
+    totals = []
+    modules = {}
+    for _ in range(args.runs):
+        total, modules = measure_once()
+        totals.append(total)
+    median = statistics.median(totals)
+
+    print(f"import app.main: mediana {median:.0f}ms en {args.runs} corridas (presupuesto {args.budget_ms}ms)")
+    top = sorted(
+        ((name, ms) for name, ms in modules.items() if name != "app.main"),
+        key=lambda item: item[1], reverse=True
+    )
+    for name, ms in top[:args.top]:
+        print(f"  {ms:8.1f}ms  {name}")
+
+    failed = False
+    eager = [name for name in LAZY_MODULES if any(m == name or m.startswith(name + ".") for m in modules)]
+    if eager:
+        print(f"ERROR: se importan al arrancar módulos que deben ser perezosos: {', '.join(eager)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"ERROR: import app.main tarda {median:.0f}ms (> {args.budget_ms}ms)")
+        failed = True
+    return 1 if failed else 0
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Presupuesto de tiempo de importación de app.main")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=3, help="corridas (se usa la mediana)")
+    parser.add_argument("--top", type=int, default=10, help="módulos más lentos a mostrar")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main(_parse_args()))
@@ -0,0 +1,238 @@
+"""
+Benchmark offline del backend: /api/v1/chat (latencia p50/p99 y requests/s)
+y /api/v1/ingest/pdf (chunks/s), con Gemini y Supabase reemplazados por dobles locales.
+
+Uso (desde ai_backend/):
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --requests 400 --concurrency 32 --generate-ms 300
+    python -m benchmarks.run_benchmarks --only chat --json
+
+No usa red ni cuota: sirve para comparar versiones y detectar regresiones de rendimiento.
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+
+from benchmarks.stats import percentile
+
+# Configuración de la app ANTES de importarla (los módulos leen el entorno al cargar)
+_WORKDIR = tempfile.mkdtemp(prefix="electromind-bench-")
+_BENCH_ENV = {
+    "SUPABASE_URL": "http://benchmark.invalid",
+    "SUPABASE_KEY": "benchmark",
+    "GOOGLE_API_KEY": "benchmark",
+    # Sin límites de cuota: se mide el backend, no el rate limiter
+    "GEMINI_EMBED_RPM": "1000000",
+    "GEMINI_EMBED_RPD": "100000000",
+    "GEMINI_GENERATE_RPM": "1000000",
+    "GEMINI_GENERATE_RPD": "100000000",
+    "GEMINI_CONTEXT_CACHE": "false",
+    "ANSWER_CACHE_ENABLED": "false",
+    "EMBEDDING_CACHE_PATH": os.path.join(_WORKDIR, "embeddings.sqlite3"),
+    "INGEST_JOBS_DB": os.path.join(_WORKDIR, "ingest_jobs.sqlite3"),
+    "INGEST_JOBS_DIR": os.path.join(_WORKDIR, "ingest_jobs"),
+    "QUOTA_DB_PATH": os.path.join(_WORKDIR, "quota.sqlite3"),
+}
+
+QUESTIONS = [
+    "El celular no carga, ¿qué reviso primero?",
+    "Error C402 en la placa de carga",
+    "La laptop enciende pero no da video",
+    "¿Cómo reemplazo la batería de un Samsung Galaxy S21?",
+    "La consola se apaga sola después de unos minutos",
+    "Pantalla con líneas verdes después de una caída",
+]
+
+SECTIONS = [
+    ("CARGA Y ALIMENTACION", "Si el equipo no carga revise el puerto de carga, el flex y el condensador C402. "
+                             "Mida el consumo con un amperimetro USB: un valor menor a 0.3A indica falla en el IC de carga."),
+    ("PANTALLA", "Las lineas verdes suelen venir del flex de pantalla o del conector en la placa. "
+                 "Pruebe con una pantalla conocida antes de reemplazar la placa."),
+    ("BATERIA", "Desconecte siempre la bateria antes de trabajar en la placa. "
+                "Una bateria inflada debe reemplazarse y desecharse en un contenedor adecuado."),
+    ("TEMPERATURA", "Los apagados por temperatura se corrigen limpiando el disipador y cambiando la pasta termica. "
+                    "Revise que el ventilador gire a la velocidad indicada por el fabricante."),
+]
+
+
+def _install_env():
+    for key, value in _BENCH_ENV.items():
+        os.environ[key] = value
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages: list[list[str]]) -> bytes:
+    """PDF mínimo (Helvetica, una línea por string) sin dependencias externas."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        body = "BT /F1 10 Tf 14 TL 50 800 Td " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(body)} >>\nstream\n{body}\nendstream")
+        content_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return bytes(out)
+
+
+def manual_pages(page_count: int) -> list[list[str]]:
+    pages = []
+    for page in range(page_count):
+        title, text = SECTIONS[page % len(SECTIONS)]
+        lines = [f"{page + 1}.1 {title} (pagina {page + 1})", ""]
+        # Texto distinto por página para que la deduplicación no descarte los chunks
+        for paragraph in range(6):
+            sentence = f"Caso {page}-{paragraph}: {text}"
+            lines += [sentence[i:i + 90] for i in range(0, len(sentence), 90)] + [""]
+        pages.append(lines)
+    return pages
+
+
+async def bench_chat(client, requests: int, concurrency: int, stream: bool = False) -> dict:
+    path = "/api/v1/chat/stream" if stream else "/api/v1/chat"
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            # Preguntas únicas: cada request paga embedding + búsqueda + generación
+            payload = {"message": f"{QUESTIONS[i % len(QUESTIONS)]} (#{i})"}
+            start = time.perf_counter()
+            response = await client.post(path, json=payload)
+            if stream:
+                await response.aread()
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200 or (stream and b"event: error" in response.content):
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "endpoint": path,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "requests_per_sec": round(requests / elapsed, 1),
+    }
+
+
+async def bench_ingest(client, pages: int) -> dict:
+    pdf = make_pdf(manual_pages(pages))
+    started = time.perf_counter()
+    response = await client.post(
+        "/api/v1/ingest/pdf",
+        files={"file": ("benchmark_manual.pdf", pdf, "application/pdf")}
+    )
+    if response.status_code != 202:
+        raise RuntimeError(f"Ingest rechazado ({response.status_code}): {response.text}")
+    job = response.json()
+    while job["status"] in ("queued", "running"):
+        await asyncio.sleep(0.05)
+        job = (await client.get(f"/api/v1/ingest/jobs/{job['id']}")).json()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "endpoint": "/api/v1/ingest/pdf",
+        "pages": pages,
+        "status": job["status"],
+        "chunks": job["chunks_done"],
+        "chunks_stored": job["chunks_stored"],
+        "seconds": round(elapsed, 2),
+        "chunks_per_sec": round(job["chunks_done"] / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+async def main(args) -> list[dict]:
+    _install_env()
+    import httpx
+    import google.generativeai as genai
+    from benchmarks.fakes import FakeGenAI, FakeSupabase, Latency
+
+    latency = Latency(embed=args.embed_ms / 1000, generate=args.generate_ms / 1000, db=args.db_ms / 1000)
+    fake_genai = FakeGenAI(latency)
+    fake_genai.install(genai)
+    fake_db = FakeSupabase(latency)
+
+    from app.main import app
+    from app.services import rag_service
+    rag_service.supabase = fake_db
+
+    fake_db.seed_knowledge([
+        f"{title}\nCaso base {i}: {text}"
+        for i in range(args.seed_chunks)
+        for title, text in [SECTIONS[i % len(SECTIONS)]]
+    ])
+
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        if args.only in (None, "chat"):
+            # Calentamiento: construye el modelo y abre las conexiones SQLite
+            await client.post("/api/v1/chat", json={"message": "warmup"})
+            results.append(await bench_chat(client, args.requests, args.concurrency))
+            results.append(await bench_chat(client, args.requests, args.concurrency, stream=True))
+        if args.only in (None, "ingest"):
+            results.append(await bench_ingest(client, args.pages))
+
+    results.append({"gemini_calls": {"embed": fake_genai.embed_calls, "generate": fake_genai.generate_calls}})
+    return results
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline de chat e ingesta")
+    parser.add_argument("--requests", type=int, default=200, help="requests de chat por escenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--pages", type=int, default=60, help="páginas del PDF de ingesta")
+    parser.add_argument("--seed-chunks", type=int, default=2000, help="chunks precargados en knowledge_base")
+    parser.add_argument("--embed-ms", type=float, default=80, help="latencia simulada de embed_content")
+    parser.add_argument("--generate-ms", type=float, default=600, help="latencia simulada de generate_content")
+    parser.add_argument("--db-ms", type=float, default=20, help="latencia simulada de cada llamada a Supabase")
+    parser.add_argument("--only", choices=("chat", "ingest"))
+    parser.add_argument("--json", action="store_true", help="imprimir resultados como JSON")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    results = asyncio.run(main(args))
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        for result in results:
+            if "gemini_calls" in result:
+                print(f"Llamadas a Gemini (fake): {result['gemini_calls']}")
+            elif "chunks_per_sec" in result:
+                print(f"{result['endpoint']:<24} {result['chunks']} chunks ({result['pages']} páginas) "
+                      f"en {result['seconds']}s -> {result['chunks_per_sec']} chunks/s [{result['status']}]")
+            else:
+                print(f"{result['endpoint']:<24} p50={result['p50_ms']}ms p99={result['p99_ms']}ms "
+                      f"{result['requests_per_sec']} req/s ({result['errors']} errores, "
+                      f"concurrencia {result['concurrency']})")
@@ -0,0 +1,12 @@
+"""
+Estadísticas comunes de los benchmarks. Sin efectos al importar (run_benchmarks crea su
+directorio de trabajo al cargarse, así que las demás herramientas importan de acá).
+"""
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Percentil p (0-100) por rango más cercano de una lista ya ordenada (0.0 si está vacía)."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
@@ -2,9 +2,11 @@ import requests
 from reportlab.pdfgen import canvas
 import os
 import sys
+import time
 
 # Configuration
 API_URL = "http://localhost:8000/api/v1/ingest/pdf"
+JOBS_URL = "http://localhost:8000/api/v1/ingest/jobs"
 TEST_PDF_NAME = "test_manual.pdf"
 
 def create_dummy_pdf():
@@ -31,9 +33,20 @@ def test_ingestion():
             response = requests.post(API_URL, files=files)
             
         print(f"Status Code: {response.status_code}")
-        if response.status_code == 200:
-            print("Response:", response.json())
-            print("\n✅ SUCCESS: PDF ingested successfully!")
+        if response.status_code == 202:
+            job = response.json()
+            print(f"Job queued: {job['id']}")
+            # La ingesta corre en segundo plano: consultar el progreso
+            while job["status"] in ("queued", "running"):
+                time.sleep(2)
+                job = requests.get(f"{JOBS_URL}/{job['id']}").json()
+                print(f"  {job['status']}: {job['chunks_done']} done, {job['chunks_skipped']} skipped, {job['chunks_failed']} failed")
+
+            print("Final job:", job)
+            if job["status"] == "completed":
+                print("\n✅ SUCCESS: PDF ingested successfully!")
+            else:
+                print("\n❌ FAILED: Ingest job did not complete.")
         else:
             print("Response:", response.text)
             print("\n❌ FAILED: Server returned an error.")
@@ -0,0 +1,47 @@
+"""
+Configuración común de los tests: entorno aislado (SQLite en un directorio temporal, sin
+límites de cuota) y Gemini/Supabase reemplazados por los dobles de benchmarks.fakes.
+"""
+import os
+import tempfile
+
+import pytest
+
+# Antes de importar la app: los módulos leen su configuración del entorno al cargarse
+_WORKDIR = tempfile.mkdtemp(prefix="electromind-tests-")
+os.environ.update({
+    "SUPABASE_URL": "http://tests.invalid",
+    "SUPABASE_KEY": "tests",
+    "GOOGLE_API_KEY": "tests",
+    "GEMINI_EMBED_RPM": "1000000",
+    "GEMINI_EMBED_RPD": "100000000",
+    "GEMINI_GENERATE_RPM": "1000000",
+    "GEMINI_GENERATE_RPD": "100000000",
+    "GEMINI_CONTEXT_CACHE": "false",
+    "ANSWER_CACHE_ENABLED": "false",
+    "VECTOR_INDEX_ENABLED": "false",
+    "EMBEDDING_CACHE_PATH": os.path.join(_WORKDIR, "embeddings.sqlite3"),
+    "INGEST_JOBS_DB": os.path.join(_WORKDIR, "ingest_jobs.sqlite3"),
+    "INGEST_JOBS_DIR": os.path.join(_WORKDIR, "ingest_jobs"),
+    "QUOTA_DB_PATH": os.path.join(_WORKDIR, "quota.sqlite3"),
+})
+
+from benchmarks.fakes import FakeGenAI, FakeSupabase, Latency  # noqa: E402
+
+
+@pytest.fixture
+def fake_genai():
+    import google.generativeai as genai
+    fake = FakeGenAI(Latency(embed=0, generate=0, db=0))
+    originals = (genai.embed_content, genai.GenerativeModel)
+    fake.install(genai)
+    yield fake
+    genai.embed_content, genai.GenerativeModel = originals
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    from app.services import rag_service
+    fake = FakeSupabase(Latency(embed=0, generate=0, db=0))
+    monkeypatch.setattr(rag_service, "supabase", fake)
+    return fake
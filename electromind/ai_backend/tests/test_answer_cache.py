@@ -0,0 +1,54 @@
+import asyncio
+
+from app.services import answer_cache as cache_module
+from app.services import rag_service
+from app.services.answer_cache import AnswerCache, context_hash
+
+
+def _cache(**kwargs) -> AnswerCache:
+    options = {"ttl": 60, "similarity": 0.95, "max_entries": 10}
+    options.update(kwargs)
+    return AnswerCache(**options)
+
+
+def test_similar_question_with_same_context_hits():
+    cache = _cache()
+    ctx = context_hash("[Fuente: manual.pdf]\nRevise el C402.")
+    cache.put([1.0, 0.0, 0.0], ctx, {"text": "Cambie el C402.", "action": None})
+    assert cache.get([0.99, 0.05, 0.0], ctx) == {"text": "Cambie el C402.", "action": None}
+
+
+def test_dissimilar_question_or_other_context_misses():
+    cache = _cache()
+    ctx = context_hash("contexto A")
+    cache.put([1.0, 0.0, 0.0], ctx, {"text": "respuesta"})
+    # cos = 0.8 < 0.95
+    assert cache.get([0.8, 0.6, 0.0], ctx) is None
+    assert cache.get([1.0, 0.0, 0.0], context_hash("contexto B")) is None
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    cache = _cache(ttl=60)
+    ctx = context_hash("contexto")
+    cache.put([1.0, 0.0], ctx, {"text": "respuesta"})
+    now[0] += 61
+    assert cache.get([1.0, 0.0], ctx) is None
+    assert len(cache) == 0
+
+
+def test_oldest_entry_is_evicted_beyond_max_entries():
+    cache = _cache(max_entries=2)
+    ctx = context_hash("contexto")
+    for i, vector in enumerate(([1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0])):
+        cache.put(vector, ctx, {"text": f"respuesta {i}"})
+    assert len(cache) == 2
+    assert cache.get([1.0, 0.0, 0.0], ctx) is None
+    assert cache.get([0.0, 0.0, 1.0], ctx) == {"text": "respuesta 2"}
+
+
+def test_storing_knowledge_invalidates_the_cache(fake_db, fake_genai):
+    cache_module.answer_cache.put([1.0, 0.0], context_hash("contexto"), {"text": "vieja"})
+    asyncio.run(rag_service.store_knowledge_batch(["Nuevo chunk sobre el C402."], [{"source": "a.pdf"}]))
+    assert len(cache_module.answer_cache) == 0
@@ -0,0 +1,51 @@
+import json
+import asyncio
+
+import httpx
+
+from app.main import app
+
+
+def _events(body: str) -> list[tuple]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def _stream(payload: dict) -> httpx.Response:
+    async def post():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://tests") as client:
+            return await client.post("/api/v1/chat/stream", json=payload)
+    return asyncio.run(post())
+
+
+def test_stream_emits_retrieval_tokens_and_done(fake_db, fake_genai):
+    fake_db.seed_knowledge(["CARGA: si el equipo no carga revise el condensador C402."])
+    response = _stream({"message": "El equipo no carga, ¿qué reviso?"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _events(response.text)
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == "retrieval"
+    assert kinds[-1] == "done"
+    assert set(kinds[1:-1]) == {"token"}
+    tokens = "".join(data["text"] for kind, data in events if kind == "token")
+    done = events[-1][1]
+    assert done["reply"] == tokens
+    assert done["reply"].strip() == fake_genai.answer
+    assert done["conversation_id"]
+
+
+def test_stream_reports_errors_as_an_event(fake_db, fake_genai, monkeypatch):
+    from app.api.endpoints import chat
+
+    async def broken_context(request):
+        raise RuntimeError("búsqueda caída")
+    monkeypatch.setattr(chat, "_build_context", broken_context)
+
+    events = _events(_stream({"message": "hola"}).text)
+    assert events == [("error", {"text": "búsqueda caída"})]
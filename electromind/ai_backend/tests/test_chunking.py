@@ -0,0 +1,54 @@
+from app.services.pdf_parser import iter_chunks, estimate_tokens
+
+
+def _sentences(count: int) -> list[str]:
+    return [f"Paso {i}: verifique el componente número {i} con el multímetro." for i in range(count)]
+
+
+def test_heading_starts_a_new_chunk_and_prefixes_it():
+    page = "CARGA Y ALIMENTACION\nRevise el puerto de carga.\n\nPANTALLA\nRevise el flex de video."
+    chunks = list(iter_chunks([page], max_tokens=200, overlap_tokens=0))
+    assert chunks == [
+        "CARGA Y ALIMENTACION\nRevise el puerto de carga.",
+        "PANTALLA\nRevise el flex de video.",
+    ]
+
+
+def test_nested_headings_keep_the_parent():
+    page = "DIAGNOSTICO\n3.1 Sin carga\nMida el consumo con un amperímetro USB."
+    chunks = list(iter_chunks([page], max_tokens=200, overlap_tokens=0))
+    assert chunks == [page]
+
+
+def test_long_paragraph_splits_on_sentences_within_budget():
+    sentences = _sentences(12)
+    chunks = list(iter_chunks(["BATERIA\n" + " ".join(sentences)], max_tokens=60, overlap_tokens=0))
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.startswith("BATERIA\n")
+        assert estimate_tokens(chunk) <= 60
+        # Nunca se corta una oración a la mitad
+        assert all(line.endswith(".") for line in chunk.split("\n")[1:])
+    body = " ".join(chunk.split("\n", 1)[1] for chunk in chunks)
+    assert body == " ".join(sentences)
+
+
+def test_overlap_carries_whole_trailing_sentences():
+    sentences = _sentences(12)
+    chunks = list(iter_chunks([" ".join(sentences)], max_tokens=60, overlap_tokens=20))
+    assert len(chunks) > 1
+    for previous, current in zip(chunks, chunks[1:]):
+        last_sentence = "Paso" + previous.rsplit("Paso", 1)[-1]
+        assert current.startswith(last_sentence)
+        assert estimate_tokens(current) <= 60
+
+
+def test_hyphenated_line_breaks_are_repaired_and_pages_close_paragraphs():
+    chunks = list(iter_chunks(["Revise el conec-\ntor de carga", "Segunda página"], max_tokens=200, overlap_tokens=0))
+    assert chunks == ["Revise el conector de carga\n\nSegunda página"]
+
+
+def test_table_rows_stay_on_their_own_lines():
+    page = "Código   Falla   Acción\nC402   Sin carga   Cambiar condensador\nU3100   Calienta   Reballing"
+    chunks = list(iter_chunks([page], max_tokens=200, overlap_tokens=0))
+    assert chunks == [page]
@@ -0,0 +1,82 @@
+from app.services import context_builder
+from app.services.context_builder import build_context
+from app.services.pdf_parser import estimate_tokens
+
+
+def _match(content: str, source: str, chunk_index: int, score: float, **metadata) -> dict:
+    return {
+        "content_chunk": content,
+        "score": score,
+        "metadata": {"source": source, "chunk_index": chunk_index, **metadata},
+    }
+
+
+def test_same_filename_different_devices_are_separate_blocks():
+    context = build_context([
+        _match("CARGA\nSamsung: el IC de carga es U3100 y alimenta la bateria.", "manual.pdf", 0, 1.0,
+               device_brand="Samsung", device_model="A52"),
+        _match("PANTALLA\nMotorola: revisar el flex de pantalla y su conector.", "manual.pdf", 1, 0.9,
+               device_brand="Motorola", device_model="G8"),
+    ])
+    blocks = context.split("\n\n")
+    assert len(blocks) == 2
+    assert blocks[0].startswith("[Fuente: manual.pdf (Samsung A52)]")
+    assert "Motorola" not in blocks[0]
+    assert blocks[1].startswith("[Fuente: manual.pdf (Motorola G8)]")
+
+
+def test_consecutive_chunks_of_one_document_are_merged():
+    first = "CARGA\nSi el equipo no carga revise el puerto de carga y el flex inferior del equipo."
+    second = "CARGA\nel flex inferior del equipo. Luego mida el consumo con un amperimetro USB."
+    context = build_context([
+        _match(second, "manual.pdf", 4, 0.8),
+        _match(first, "manual.pdf", 3, 1.0),
+    ])
+    assert context == (
+        "[Fuente: manual.pdf]\nCARGA\nSi el equipo no carga revise el puerto de carga y el flex inferior "
+        "del equipo. Luego mida el consumo con un amperimetro USB."
+    )
+
+
+def test_near_duplicates_are_dropped():
+    text = "Desconecte siempre la bateria antes de trabajar en la placa del equipo."
+    context = build_context([
+        _match(text, "a.pdf", 0, 1.0),
+        _match(text + " ", "b.pdf", 0, 0.9),
+    ])
+    assert "b.pdf" not in context
+
+
+def test_token_budget_skips_chunks_that_do_not_fit():
+    long_text = "palabra " * 400
+    context = build_context([
+        _match(long_text, "largo.pdf", 0, 1.0),
+        _match("Chunk corto sobre el condensador C402.", "corto.pdf", 0, 0.5),
+    ], token_budget=50)
+    assert "largo.pdf" not in context
+    assert "C402" in context
+
+
+def test_mmr_prefers_diverse_chunk_over_redundant_one(monkeypatch):
+    monkeypatch.setattr(context_builder, "MMR_LAMBDA", 0.5)
+    base = "el puerto de carga tiene suciedad y el flex de carga esta cortado en el conector inferior"
+    redundant = "el puerto de carga tiene suciedad y el flex de carga esta roto, cambie el conector lateral"
+    diverse = "la pantalla muestra lineas verdes por el flex de video o por el conector de la placa"
+    # Entran exactamente dos chunks: por relevancia pura el segundo sería el redundante
+    budget = estimate_tokens(base) + max(estimate_tokens(redundant), estimate_tokens(diverse))
+    context = build_context([
+        _match(base, "a.pdf", 0, 1.0),
+        _match(redundant, "b.pdf", 0, 0.95),
+        _match(diverse, "c.pdf", 0, 0.9),
+    ], token_budget=budget)
+    assert "a.pdf" in context
+    assert "c.pdf" in context
+    assert "b.pdf" not in context
+
+    monkeypatch.setattr(context_builder, "MMR_LAMBDA", 1.0)
+    context = build_context([
+        _match(base, "a.pdf", 0, 1.0),
+        _match(redundant, "b.pdf", 0, 0.95),
+        _match(diverse, "c.pdf", 0, 0.9),
+    ], token_budget=budget)
+    assert "b.pdf" in context
@@ -0,0 +1,64 @@
+from app.services import conversation_store as store_module
+from app.services.conversation_store import ConversationStore
+from app.services.pdf_parser import estimate_tokens
+
+
+def _store(**kwargs) -> ConversationStore:
+    options = {"max_sessions": 10, "ttl": 3600, "token_budget": 120, "summary_tokens": 50}
+    options.update(kwargs)
+    return ConversationStore(**options)
+
+
+def test_history_is_compacted_to_the_token_budget():
+    store = _store()
+    for i in range(20):
+        store.append("c1", f"Pregunta {i}: el equipo {i} no enciende. Ya revisé la batería.",
+                     f"Respuesta {i}: mida el consumo en la placa {i}. Luego revise el fusible.")
+    history = store.history("c1")
+    assert estimate_tokens(history) <= 120
+    assert history.startswith("Resumen de lo anterior:")
+    # La primera línea del resumen (equipo y falla iniciales) se conserva
+    assert "- Técnico: Pregunta 0:" in history
+    # El último turno queda completo
+    assert "Respuesta 19: mida el consumo en la placa 19. Luego revise el fusible." in history
+
+
+def test_single_oversized_turn_keeps_its_end():
+    store = _store(token_budget=30)
+    store.append("c1", "x " * 200 + "FINAL", "")
+    history = store.history("c1")
+    assert history.endswith("FINAL")
+    assert estimate_tokens(history) <= 40
+
+
+def test_unknown_conversation_is_rebuilt_from_client_history():
+    store = _store()
+    history = store.history("nueva", fallback=[
+        {"role": "user", "content": "El Samsung A52 no carga."},
+        {"role": "model", "content": "Revise el conector de carga."},
+    ])
+    assert history == "Últimos mensajes:\nTécnico: El Samsung A52 no carga.\nAsistente: Revise el conector de carga."
+    assert len(store) == 1
+
+
+def test_least_recently_used_conversation_is_evicted():
+    store = _store(max_sessions=2)
+    store.append("a", "hola", "hola")
+    store.append("b", "hola", "hola")
+    store.history("a")  # "a" pasa a ser la más reciente
+    store.append("c", "hola", "hola")
+    assert store.history("a")
+    assert store.history("b") == ""
+    assert store.history("c")
+
+
+def test_idle_conversation_expires(monkeypatch):
+    store = _store(ttl=60)
+    now = [1000.0]
+    monkeypatch.setattr(store_module.time, "time", lambda: now[0])
+    store.append("a", "hola", "hola")
+    now[0] += 59
+    assert store.history("a")
+    now[0] += 61
+    assert store.history("a") == ""
+    assert len(store) == 0
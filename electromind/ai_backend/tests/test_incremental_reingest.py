@@ -0,0 +1,38 @@
+import io
+import asyncio
+
+from benchmarks.run_benchmarks import make_pdf
+from app.services import ingest_jobs
+
+
+def _ingest(filename: str, lines: list[str], device_brand: str = None, device_model: str = None) -> dict:
+    job_id = ingest_jobs._create_job(io.BytesIO(make_pdf([lines])), filename, device_brand, device_model)
+    asyncio.run(ingest_jobs.run_job(job_id))
+    with ingest_jobs._conn() as conn:
+        return dict(conn.execute("SELECT * FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def _chunks(fake_db, document_id: str) -> list[dict]:
+    return [row for row in fake_db.rows("knowledge_base") if row.get("source_id") == document_id]
+
+
+def test_same_filename_different_devices_keep_their_chunks(fake_db, fake_genai):
+    samsung = _ingest("manual.pdf", ["Samsung A52: el IC de carga es U3100."], "Samsung", "A52")
+    motorola = _ingest("manual.pdf", ["Motorola G8: revisar el flex de pantalla."], "Motorola", "G8")
+
+    assert samsung["status"] == motorola["status"] == "completed"
+    assert samsung["document_id"] != motorola["document_id"]
+    assert any("U3100" in row["content_chunk"] for row in _chunks(fake_db, samsung["document_id"]))
+    assert any("flex" in row["content_chunk"] for row in _chunks(fake_db, motorola["document_id"]))
+
+
+def test_reingest_same_device_replaces_its_chunks(fake_db, fake_genai):
+    first = _ingest("manual.pdf", ["Samsung A52: el IC de carga es U3100."], "Samsung", "A52")
+    other = _ingest("manual.pdf", ["Motorola G8: revisar el flex de pantalla."], "Motorola", "G8")
+    second = _ingest("manual.pdf", ["Samsung A52: el IC de carga es U3200."], "Samsung", "A52")
+
+    assert second["document_id"] == first["document_id"]
+    contents = [row["content_chunk"] for row in _chunks(fake_db, first["document_id"])]
+    assert any("U3200" in content for content in contents)
+    assert not any("U3100" in content for content in contents)
+    assert _chunks(fake_db, other["document_id"])
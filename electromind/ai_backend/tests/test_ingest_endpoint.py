@@ -0,0 +1,23 @@
+import asyncio
+
+import httpx
+
+from app.main import app
+
+
+def _post(data: dict) -> httpx.Response:
+    async def post():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://tests") as client:
+            return await client.post(
+                "/api/v1/ingest/pdf",
+                files={"file": ("manual.pdf", b"%PDF-1.4", "application/pdf")},
+                data=data
+            )
+    return asyncio.run(post())
+
+
+def test_invalid_document_id_is_a_400(fake_db):
+    response = _post({"document_id": "no-es-un-uuid"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid document_id"
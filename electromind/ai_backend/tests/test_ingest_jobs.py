@@ -0,0 +1,71 @@
+import io
+import os
+import asyncio
+
+from benchmarks.run_benchmarks import make_pdf, manual_pages
+from app.services import ingest_jobs
+from app.services.rate_limiter import QuotaExceededError
+
+
+def _job_row(job_id: str) -> dict:
+    return dict(ingest_jobs._conn().execute("SELECT * FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def test_failed_batch_keeps_pdf_and_resumes_from_it(fake_db, fake_genai, monkeypatch):
+    monkeypatch.setattr(ingest_jobs, "EMBED_BATCH_SIZE", 2)
+    original = ingest_jobs.store_knowledge_batch
+    calls = []
+
+    async def flaky_store(*args, **kwargs):
+        calls.append(len(args[0]))
+        if len(calls) == 2:
+            raise RuntimeError("Supabase 503")
+        return await original(*args, **kwargs)
+    monkeypatch.setattr(ingest_jobs, "store_knowledge_batch", flaky_store)
+
+    job_id = ingest_jobs._create_job(io.BytesIO(make_pdf(manual_pages(6))), "fallas.pdf")
+    asyncio.run(ingest_jobs.run_job(job_id))
+    job = _job_row(job_id)
+    assert job["status"] == "failed"
+    assert job["chunks_done"] == 2
+    assert job["chunks_failed"] > 0
+    assert os.path.exists(job["pdf_path"])
+
+    assert ingest_jobs._requeue_job(job_id)
+    asyncio.run(ingest_jobs.run_job(job_id))
+    job = _job_row(job_id)
+    assert job["status"] == "completed"
+    assert job["chunks_failed"] == 0
+    assert job["chunks_stored"] == job["chunks_done"] > 2
+    assert not os.path.exists(job["pdf_path"])
+    assert len(fake_db.rows("knowledge_base")) == job["chunks_done"]
+
+
+def test_paused_job_resumes_without_reembedding_stored_chunks(fake_db, fake_genai, monkeypatch):
+    monkeypatch.setattr(ingest_jobs, "EMBED_BATCH_SIZE", 2)
+    original = ingest_jobs.store_knowledge_batch
+    embedded = []
+
+    async def quota_then_ok(contents, *args, **kwargs):
+        if len(embedded) == 2 and not getattr(quota_then_ok, "paused", False):
+            quota_then_ok.paused = True
+            raise QuotaExceededError("Cuota diaria agotada para gemini-embedding")
+        embedded.extend(contents)
+        return await original(contents, *args, **kwargs)
+    monkeypatch.setattr(ingest_jobs, "store_knowledge_batch", quota_then_ok)
+
+    job_id = ingest_jobs._create_job(io.BytesIO(make_pdf(manual_pages(6))), "pausa.pdf")
+    asyncio.run(ingest_jobs.run_job(job_id))
+    job = _job_row(job_id)
+    assert job["status"] == "paused"
+    assert job["chunks_done"] == 2
+    assert "Cuota" in job["error"]
+    assert os.path.exists(job["pdf_path"])
+
+    assert ingest_jobs._requeue_job(job_id)
+    asyncio.run(ingest_jobs.run_job(job_id))
+    job = _job_row(job_id)
+    assert job["status"] == "completed"
+    # Cada chunk se embebió una sola vez: lo anterior a la pausa no se repite
+    assert len(embedded) == len(set(embedded)) == job["chunks_done"]
+    assert len(fake_db.rows("knowledge_base")) == job["chunks_done"]
@@ -0,0 +1,60 @@
+import uuid
+import asyncio
+
+import pytest
+
+from app.services.rate_limiter import AsyncRateLimiter, QuotaExceededError, PRIORITY_INTERACTIVE, PRIORITY_BULK
+
+
+def _limiter(**kwargs) -> AsyncRateLimiter:
+    # Nombre único: el uso diario se persiste en el SQLite compartido de los tests
+    return AsyncRateLimiter(f"test-{uuid.uuid4().hex[:8]}", **kwargs)
+
+
+def test_interactive_request_jumps_the_bulk_queue():
+    async def scenario():
+        limiter = _limiter(rpm=1200)
+        order = []
+
+        async def call(label, priority):
+            await limiter.acquire(priority=priority)
+            order.append(label)
+
+        # El bucket arranca con 1 token: el resto hace cola
+        await limiter.acquire(priority=PRIORITY_BULK)
+        bulk = [asyncio.create_task(call(f"bulk-{i}", PRIORITY_BULK)) for i in range(3)]
+        await asyncio.sleep(0)
+        chat = asyncio.create_task(call("chat", PRIORITY_INTERACTIVE))
+        await asyncio.gather(*bulk, chat)
+        return order
+
+    assert asyncio.run(scenario()) == ["chat", "bulk-0", "bulk-1", "bulk-2"]
+
+
+def test_bulk_cannot_use_the_interactive_reserve():
+    async def scenario():
+        limiter = _limiter(rpm=60000, rpd=10, burst=10, interactive_reserve=3)
+        for _ in range(7):
+            await limiter.acquire(priority=PRIORITY_BULK)
+        with pytest.raises(QuotaExceededError, match="reservado para el chat"):
+            await limiter.acquire(priority=PRIORITY_BULK)
+        for _ in range(3):
+            await limiter.acquire(priority=PRIORITY_INTERACTIVE)
+        with pytest.raises(QuotaExceededError):
+            await limiter.acquire(priority=PRIORITY_INTERACTIVE)
+        return limiter.remaining_today()
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_cancelled_waiter_does_not_consume_a_token():
+    async def scenario():
+        limiter = _limiter(rpm=1200, rpd=100)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire(priority=PRIORITY_BULK))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await limiter.acquire()
+        return limiter.used_today()
+
+    assert asyncio.run(scenario()) == 2
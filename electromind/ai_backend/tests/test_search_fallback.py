@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+from google.api_core.exceptions import ResourceExhausted
+
+from app.services import rag_service
+
+
+@pytest.fixture
+def failing_embedder(fake_genai, monkeypatch):
+    def embed_content(*args, **kwargs):
+        raise ResourceExhausted("429 Resource has been exhausted (e.g. check quota).")
+    monkeypatch.setattr(rag_service, "_embed_content", embed_content)
+    return fake_genai
+
+
+@pytest.mark.parametrize("use_vector_index", [False, True])
+def test_upstream_429_falls_back_to_lexical_search(fake_db, failing_embedder, monkeypatch, use_vector_index):
+    fake_db.seed_knowledge([
+        "CARGA: si el equipo no carga revise el condensador C402 y el IC de carga.",
+        "PANTALLA: las lineas verdes suelen venir del flex de pantalla.",
+    ])
+    if use_vector_index:
+        import numpy
+        from app.services import vector_index as vindex
+        monkeypatch.setattr(vindex, "np", numpy)
+        monkeypatch.setattr(vindex, "VECTOR_INDEX_ENABLED", True)
+        monkeypatch.setattr(vindex, "vector_index", vindex.VectorIndex())
+        vindex.vector_index.replace(fake_db.rows("knowledge_base"))
+
+    matches = asyncio.run(rag_service.search_knowledge_matches("condensador C402 no carga", match_threshold=0.5))
+
+    assert matches
+    assert "C402" in matches[0]["content_chunk"]
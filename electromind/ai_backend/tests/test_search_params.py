@@ -0,0 +1,26 @@
+import asyncio
+
+import pytest
+from postgrest.exceptions import APIError
+
+from app.services import rag_service
+
+
+def test_default_ef_search_is_not_sent():
+    # Las RPC anteriores a la migración 008 no aceptan ef_search
+    assert rag_service._ef_search_params(rag_service.HNSW_DEFAULT_EF_SEARCH) == {}
+    assert rag_service._ef_search_params(None) == {}
+
+
+def test_custom_ef_search_is_sent():
+    assert rag_service._ef_search_params(200) == {"ef_search": 200}
+
+
+def _missing_ef_search_signature(*args, **kwargs):
+    raise APIError({"code": "PGRST202", "message": "Could not find the function in the schema cache"})
+
+
+def test_pre_008_database_raises_a_clear_error(fake_db, fake_genai, monkeypatch):
+    monkeypatch.setattr(fake_db, "rpc_match_knowledge_batch", _missing_ef_search_signature)
+    with pytest.raises(RuntimeError, match="008_hnsw_ef_search"):
+        asyncio.run(rag_service.store_knowledge_batch(["Chunk de prueba"], [{"source": "a.pdf"}]))
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from app.services.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight("test")
+        calls = []
+
+        async def work(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return value * 2
+
+        results = await asyncio.gather(*(flight.do("k", work, 21) for _ in range(5)))
+        # Terminada la llamada no queda nada cacheado: la siguiente vuelve a ejecutarse
+        again = await flight.do("k", work, 21)
+        return results, again, calls
+
+    results, again, calls = asyncio.run(scenario())
+    assert results == [42] * 5
+    assert again == 42
+    assert calls == [21, 21]
+
+
+def test_different_keys_run_separately():
+    async def scenario():
+        flight = SingleFlight("test")
+        calls = []
+
+        async def work(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return value
+
+        return await asyncio.gather(flight.do("a", work, 1), flight.do("b", work, 2)), calls
+
+    results, calls = asyncio.run(scenario())
+    assert results == [1, 2]
+    assert sorted(calls) == [1, 2]
+
+
+def test_exception_is_shared_by_all_waiters():
+    async def scenario():
+        flight = SingleFlight("test")
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("falló")
+
+        return await asyncio.gather(*(flight.do("k", fail) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_cancelling_one_caller_does_not_cancel_the_others():
+    async def scenario():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return "ok"
+
+        first = asyncio.create_task(flight.do("k", work))
+        second = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == "ok"
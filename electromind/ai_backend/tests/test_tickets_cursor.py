@@ -0,0 +1,23 @@
+import asyncio
+
+import pytest
+
+from app.services import tickets_service
+
+
+def test_cursor_round_trip():
+    ticket = {"created_at": "2024-05-01T10:20:30.123456+00:00", "id": "0b7c4f52-8f3e-4d0a-9a57-3c1f0c2a9e11"}
+    assert tickets_service._decode_cursor(tickets_service.encode_cursor(ticket)) == (
+        ticket["created_at"], ticket["id"]
+    )
+
+
+@pytest.mark.parametrize("cursor", [
+    "sin-separador",
+    "ayer|0b7c4f52-8f3e-4d0a-9a57-3c1f0c2a9e11",
+    '2024-05-01T10:20:30+00:00|1),status.neq.(x',
+    '2024-05-01T10:20:30+00:00",id.gt.0)|0b7c4f52-8f3e-4d0a-9a57-3c1f0c2a9e11',
+])
+def test_invalid_cursor_is_rejected_before_querying(fake_db, cursor):
+    with pytest.raises(ValueError, match="Cursor inválido"):
+        asyncio.run(tickets_service.list_tickets(cursor=cursor))
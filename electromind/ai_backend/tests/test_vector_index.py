@@ -0,0 +1,47 @@
+import numpy
+import pytest
+
+from app.services import vector_index as vindex
+from benchmarks.fakes import fake_embedding
+
+
+@pytest.fixture
+def index(monkeypatch):
+    # Los tests corren con VECTOR_INDEX_ENABLED=false: NumPy no se importó en el módulo
+    monkeypatch.setattr(vindex, "np", numpy)
+    index = vindex.VectorIndex()
+    index.replace([])
+    return index
+
+
+def _row(content: str, created_at: str, row_id: str = None) -> dict:
+    return {
+        "id": row_id or content,
+        "content_chunk": content,
+        "embedding": fake_embedding(content),
+        "source_type": "manual",
+        "metadata": {},
+        "source_id": None,
+        "created_at": created_at,
+    }
+
+
+def test_local_insert_does_not_advance_sync_cursor(fake_db, index):
+    # Otro worker insertó antes (created_at menor) pero este todavía no lo leyó
+    fake_db.insert("knowledge_base", [_row("otro worker", "2024-01-01T00:00:01+00:00")])
+    index.add_rows([_row("local", "2024-01-01T00:00:02+00:00")])
+    assert index.last_created_at is None
+
+    rows = vindex.fetch_rows(fake_db, index.last_created_at)
+    assert index.add_rows(rows, advance_cursor=True) == 1
+    assert len(index) == 2
+    assert index.last_created_at == "2024-01-01T00:00:01+00:00"
+
+
+def test_fetch_rows_pages_rows_with_equal_timestamps(fake_db, monkeypatch):
+    monkeypatch.setattr(vindex, "PAGE_SIZE", 2)
+    fake_db.insert("knowledge_base", [
+        _row(f"chunk {i}", "2024-01-01T00:00:00+00:00", row_id=f"id-{4 - i}") for i in range(5)
+    ])
+    rows = vindex.fetch_rows(fake_db, "2024-01-01T00:00:00+00:00")
+    assert [row["id"] for row in rows] == sorted(f"id-{i}" for i in range(5))
@@ -0,0 +1,35 @@
+-- BULK DEDUP PARA INGESTA
+-- Verifica duplicados de un lote completo de embeddings en una sola llamada RPC,
+-- en lugar de un match_knowledge por chunk.
+-- Los embeddings llegan como JSONB ([[...768 floats], ...]) porque PostgREST
+-- no convierte arrays JSON anidados a vector(768)[].
+
+CREATE OR REPLACE FUNCTION match_knowledge_batch (
+  query_embeddings jsonb,
+  match_threshold float
+)
+RETURNS TABLE (
+  idx int,
+  id UUID,
+  similarity float
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  RETURN QUERY
+  SELECT
+    (q.ordinality - 1)::int AS idx,
+    m.id,
+    m.similarity
+  FROM jsonb_array_elements(query_embeddings) WITH ORDINALITY AS q(embedding, ordinality)
+  CROSS JOIN LATERAL (
+    SELECT
+      kb.id,
+      1 - (kb.embedding <=> (q.embedding::text)::vector(768)) AS similarity
+    FROM public.knowledge_base kb
+    ORDER BY kb.embedding <=> (q.embedding::text)::vector(768)
+    LIMIT 1
+  ) m
+  WHERE m.similarity > match_threshold;
+END;
+$$;
@@ -0,0 +1,20 @@
+-- ÍNDICES PARA LA HERRAMIENTA list_tickets DEL BACKEND IA
+-- Búsqueda parcial por nombre de cliente (ILIKE '%texto%') y paginación keyset
+-- ordenada por (created_at DESC, id DESC), con o sin filtro de estado.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_clients_full_name_trgm
+  ON public.clients USING gin (full_name gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_tickets_created_keyset
+  ON public.tickets (created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_tickets_status_created_keyset
+  ON public.tickets (status, created_at DESC, id DESC);
+
+-- Invalidación del caché de list_tickets:
+-- crear en Supabase (Database > Webhooks) un webhook para INSERT/UPDATE/DELETE
+-- sobre public.tickets y public.clients que haga POST a
+--   {BACKEND_URL}/api/v1/webhooks/tickets
+-- con el header X-Webhook-Secret igual a WEBHOOK_SECRET del backend.
@@ -0,0 +1,34 @@
+-- match_knowledge DEVUELVE TAMBIÉN metadata
+-- El backend la usa para unir chunks contiguos del mismo manual (source + chunk_index)
+-- al armar el contexto del chat. Cambia el tipo de retorno, así que hay que recrearla.
+
+DROP FUNCTION IF EXISTS match_knowledge(vector, float, int);
+
+CREATE OR REPLACE FUNCTION match_knowledge (
+  query_embedding vector(768),
+  match_threshold float,
+  match_count int
+)
+RETURNS TABLE (
+  id UUID,
+  content_chunk TEXT,
+  source_type TEXT,
+  metadata JSONB,
+  similarity float
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  RETURN QUERY
+  SELECT
+    kb.id,
+    kb.content_chunk,
+    kb.source_type,
+    kb.metadata,
+    1 - (kb.embedding <=> query_embedding) as similarity
+  FROM public.knowledge_base kb
+  WHERE 1 - (kb.embedding <=> query_embedding) > match_threshold
+  ORDER BY kb.embedding <=> query_embedding
+  LIMIT match_count;
+END;
+$$;
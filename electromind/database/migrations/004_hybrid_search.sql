@@ -0,0 +1,72 @@
+-- BÚSQUEDA HÍBRIDA (texto completo + vectores)
+-- Códigos de error, números de parte ("C402") y modelos se encuentran mal solo con embeddings.
+-- hybrid_search_knowledge fusiona el ranking léxico y el vectorial con Reciprocal Rank Fusion.
+-- query_embedding puede ser NULL: el backend la llama así cuando se agota la cuota de embeddings.
+
+ALTER TABLE public.knowledge_base
+  ADD COLUMN IF NOT EXISTS fts tsvector
+  GENERATED ALWAYS AS (to_tsvector('spanish', content_chunk)) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_knowledge_base_fts ON public.knowledge_base USING gin (fts);
+
+CREATE OR REPLACE FUNCTION hybrid_search_knowledge (
+  query_text text,
+  query_embedding vector(768) DEFAULT NULL,
+  match_count int DEFAULT 5,
+  match_threshold float DEFAULT 0.7,
+  full_text_weight float DEFAULT 1.0,
+  semantic_weight float DEFAULT 1.0,
+  rrf_k int DEFAULT 60
+)
+RETURNS TABLE (
+  id UUID,
+  content_chunk TEXT,
+  source_type TEXT,
+  metadata JSONB,
+  similarity float,
+  score float
+)
+LANGUAGE sql
+AS $$
+  WITH ts_query AS (
+    -- Términos unidos con OR: una pregunta en lenguaje natural no contiene todas las palabras del chunk
+    SELECT NULLIF(replace(plainto_tsquery('spanish', query_text)::text, ' & ', ' | '), '')::tsquery AS q
+  ),
+  full_text AS (
+    SELECT
+      kb.id,
+      row_number() OVER (ORDER BY ts_rank_cd(kb.fts, ts_query.q) DESC) AS rank_ix
+    FROM public.knowledge_base kb, ts_query
+    WHERE ts_query.q IS NOT NULL AND kb.fts @@ ts_query.q
+    ORDER BY rank_ix
+    LIMIT least(match_count, 30) * 2
+  ),
+  semantic AS (
+    -- Primero los vecinos del índice HNSW y después el umbral (si no, el filtro deja menos de match_count)
+    SELECT nn.id, row_number() OVER (ORDER BY nn.distance) AS rank_ix, 1 - nn.distance AS similarity
+    FROM (
+      SELECT kb.id, kb.embedding <=> query_embedding AS distance
+      FROM public.knowledge_base kb
+      WHERE query_embedding IS NOT NULL
+      ORDER BY kb.embedding <=> query_embedding
+      LIMIT least(match_count, 30) * 2
+    ) nn
+    WHERE 1 - nn.distance > match_threshold
+  )
+  SELECT
+    kb.id,
+    kb.content_chunk,
+    kb.source_type,
+    kb.metadata,
+    semantic.similarity,
+    -- Normalizado: 1.0 = primer puesto en ambos rankings
+    (
+      coalesce(1.0 / (rrf_k + full_text.rank_ix), 0.0) * full_text_weight +
+      coalesce(1.0 / (rrf_k + semantic.rank_ix), 0.0) * semantic_weight
+    ) / ((full_text_weight + semantic_weight) / (rrf_k + 1)) AS score
+  FROM full_text
+  FULL OUTER JOIN semantic ON full_text.id = semantic.id
+  JOIN public.knowledge_base kb ON kb.id = coalesce(full_text.id, semantic.id)
+  ORDER BY score DESC
+  LIMIT match_count;
+$$;
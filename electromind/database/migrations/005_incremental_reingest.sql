@@ -0,0 +1,123 @@
+-- RE-INGESTA INCREMENTAL DE MANUALES
+-- Cada chunk guarda el hash de su texto normalizado y queda vinculado a su documento (source_id).
+-- Al volver a subir un manual solo se embeben los chunks nuevos o editados; al terminar el job
+-- se borran los que ya no existen y se renumera chunk_index.
+
+ALTER TABLE public.documents
+  ADD COLUMN IF NOT EXISTS version INT NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+CREATE INDEX IF NOT EXISTS idx_documents_file_path ON public.documents (file_path);
+
+ALTER TABLE public.knowledge_base ADD COLUMN IF NOT EXISTS content_hash TEXT;
+ALTER TABLE public.knowledge_base
+  ADD CONSTRAINT knowledge_base_source_id_fkey
+  FOREIGN KEY (source_id) REFERENCES public.documents(id) ON DELETE CASCADE;
+CREATE INDEX IF NOT EXISTS idx_knowledge_base_source_hash ON public.knowledge_base (source_id, content_hash);
+
+-- Backfill: mismo hash que el backend (sha256 del texto con espacios colapsados).
+-- Primero se colapsan los espacios y después se recorta, como " ".join(text.split()):
+-- btrim solo quita espacios, no saltos de línea ni tabs
+UPDATE public.knowledge_base
+SET content_hash = encode(sha256(convert_to(btrim(regexp_replace(content_chunk, '\s+', ' ', 'g')), 'UTF8')), 'hex')
+WHERE content_hash IS NULL;
+
+-- Hashes de los chunks ya guardados de un documento.
+-- Adopta los chunks anteriores a esta migración (sin source_id) por metadata.source.
+CREATE OR REPLACE FUNCTION document_chunk_hashes (
+  p_document_id uuid,
+  p_source text
+)
+RETURNS text[]
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  UPDATE public.knowledge_base
+  SET source_id = p_document_id
+  WHERE source_id IS NULL
+    AND source_type = 'manual'
+    AND metadata->>'source' = p_source;
+
+  RETURN coalesce(
+    (SELECT array_agg(DISTINCT kb.content_hash)
+     FROM public.knowledge_base kb
+     WHERE kb.source_id = p_document_id AND kb.content_hash IS NOT NULL),
+    '{}'
+  );
+END;
+$$;
+
+-- Cierra una versión del documento: borra los chunks cuyo hash ya no está,
+-- renumera chunk_index según la nueva posición e incrementa la versión.
+-- Devuelve los ids borrados (para sacarlos del índice en memoria).
+CREATE OR REPLACE FUNCTION sync_document_chunks (
+  p_document_id uuid,
+  p_hashes text[]
+)
+RETURNS uuid[]
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  deleted uuid[];
+BEGIN
+  WITH removed AS (
+    DELETE FROM public.knowledge_base kb
+    WHERE kb.source_id = p_document_id
+      AND (kb.content_hash IS NULL OR NOT (kb.content_hash = ANY (p_hashes)))
+    RETURNING kb.id
+  )
+  SELECT coalesce(array_agg(id), '{}') INTO deleted FROM removed;
+
+  UPDATE public.knowledge_base kb
+  SET metadata = jsonb_set(coalesce(kb.metadata, '{}'::jsonb), '{chunk_index}', to_jsonb(pos.idx - 1))
+  FROM (
+    SELECT h.hash, min(h.idx) AS idx
+    FROM unnest(p_hashes) WITH ORDINALITY AS h(hash, idx)
+    GROUP BY h.hash
+  ) pos
+  WHERE kb.source_id = p_document_id
+    AND kb.content_hash = pos.hash
+    AND (kb.metadata->>'chunk_index') IS DISTINCT FROM (pos.idx - 1)::text;
+
+  UPDATE public.documents
+  SET version = version + 1, updated_at = NOW()
+  WHERE id = p_document_id;
+
+  RETURN deleted;
+END;
+$$;
+
+-- El dedup por similitud ignora los chunks del mismo documento: dentro de un documento
+-- manda el hash (si no, un chunk igual a su versión anterior se descartaría y luego se borraría).
+DROP FUNCTION IF EXISTS match_knowledge_batch(jsonb, float);
+
+CREATE OR REPLACE FUNCTION match_knowledge_batch (
+  query_embeddings jsonb,
+  match_threshold float,
+  exclude_source_id uuid DEFAULT NULL
+)
+RETURNS TABLE (
+  idx int,
+  id UUID,
+  similarity float
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  RETURN QUERY
+  SELECT
+    (q.ordinality - 1)::int AS idx,
+    m.id,
+    m.similarity
+  FROM jsonb_array_elements(query_embeddings) WITH ORDINALITY AS q(embedding, ordinality)
+  CROSS JOIN LATERAL (
+    SELECT
+      kb.id,
+      1 - (kb.embedding <=> (q.embedding::text)::vector(768)) AS similarity
+    FROM public.knowledge_base kb
+    WHERE exclude_source_id IS NULL OR kb.source_id IS DISTINCT FROM exclude_source_id
+    ORDER BY kb.embedding <=> (q.embedding::text)::vector(768)
+    LIMIT 1
+  ) m
+  WHERE m.similarity > match_threshold;
+END;
+$$;
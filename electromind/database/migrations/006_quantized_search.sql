@@ -0,0 +1,171 @@
+-- BÚSQUEDA EN DOS ETAPAS CON EMBEDDINGS CUANTIZADOS (pgvector >= 0.7)
+-- Un índice HNSW sobre binary_quantize(embedding) guarda 96 bytes por vector en lugar de 3 KB.
+-- La búsqueda toma candidatos por distancia de Hamming y los re-ordena con el coseno exacto
+-- sobre el embedding completo (en el heap, fuera de la RAM del índice), así el recall no cae.
+-- Con QUANTIZED_SEARCH=true el backend usa solo este índice. El ahorro de RAM recién llega
+-- al borrar el HNSW de precisión completa: ver el paso opcional al final de este archivo.
+
+CREATE INDEX IF NOT EXISTS idx_knowledge_base_embedding_bq ON public.knowledge_base
+  USING hnsw ((binary_quantize(embedding)::bit(768)) bit_hamming_ops);
+
+-- Vecinos más cercanos (id, distancia coseno exacta), con o sin etapa cuantizada
+CREATE OR REPLACE FUNCTION knowledge_semantic_candidates (
+  query_embedding vector(768),
+  candidate_count int,
+  use_quantized boolean DEFAULT false,
+  exclude_source_id uuid DEFAULT NULL,
+  rerank_multiplier int DEFAULT 10
+)
+RETURNS TABLE (
+  id UUID,
+  distance float
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF query_embedding IS NULL THEN
+    RETURN;
+  END IF;
+
+  IF use_quantized THEN
+    -- HNSW devuelve como mucho ef_search filas: alcanzar para todos los candidatos a re-ordenar
+    PERFORM set_config('hnsw.ef_search', greatest(40, candidate_count * rerank_multiplier)::text, true);
+    RETURN QUERY
+    SELECT c.id, (c.embedding <=> query_embedding)::float AS distance
+    FROM (
+      SELECT kb.id, kb.embedding
+      FROM public.knowledge_base kb
+      WHERE exclude_source_id IS NULL OR kb.source_id IS DISTINCT FROM exclude_source_id
+      ORDER BY binary_quantize(kb.embedding)::bit(768) <~> binary_quantize(query_embedding)
+      LIMIT candidate_count * rerank_multiplier
+    ) c
+    ORDER BY distance
+    LIMIT candidate_count;
+  ELSE
+    RETURN QUERY
+    SELECT kb.id, (kb.embedding <=> query_embedding)::float AS distance
+    FROM public.knowledge_base kb
+    WHERE exclude_source_id IS NULL OR kb.source_id IS DISTINCT FROM exclude_source_id
+    ORDER BY kb.embedding <=> query_embedding
+    LIMIT candidate_count;
+  END IF;
+END;
+$$;
+
+-- Igual que match_knowledge pero en dos etapas (candidatos cuantizados + re-ranking exacto)
+CREATE OR REPLACE FUNCTION match_knowledge_quantized (
+  query_embedding vector(768),
+  match_threshold float,
+  match_count int,
+  rerank_multiplier int DEFAULT 10
+)
+RETURNS TABLE (
+  id UUID,
+  content_chunk TEXT,
+  source_type TEXT,
+  metadata JSONB,
+  similarity float
+)
+LANGUAGE sql
+AS $$
+  SELECT kb.id, kb.content_chunk, kb.source_type, kb.metadata, 1 - c.distance AS similarity
+  FROM knowledge_semantic_candidates(query_embedding, match_count, true, NULL, rerank_multiplier) c
+  JOIN public.knowledge_base kb ON kb.id = c.id
+  WHERE 1 - c.distance > match_threshold
+  ORDER BY c.distance;
+$$;
+
+-- Dedup de la ingesta y búsqueda híbrida: mismo resultado, con etapa cuantizada opcional
+DROP FUNCTION IF EXISTS match_knowledge_batch(jsonb, float, uuid);
+
+CREATE OR REPLACE FUNCTION match_knowledge_batch (
+  query_embeddings jsonb,
+  match_threshold float,
+  exclude_source_id uuid DEFAULT NULL,
+  use_quantized boolean DEFAULT false
+)
+RETURNS TABLE (
+  idx int,
+  id UUID,
+  similarity float
+)
+LANGUAGE sql
+AS $$
+  SELECT
+    (q.ordinality - 1)::int AS idx,
+    m.id,
+    1 - m.distance AS similarity
+  FROM jsonb_array_elements(query_embeddings) WITH ORDINALITY AS q(embedding, ordinality)
+  CROSS JOIN LATERAL knowledge_semantic_candidates(
+    (q.embedding::text)::vector(768), 1, use_quantized, exclude_source_id
+  ) m
+  WHERE 1 - m.distance > match_threshold;
+$$;
+
+DROP FUNCTION IF EXISTS hybrid_search_knowledge(text, vector, int, float, float, float, int);
+
+CREATE OR REPLACE FUNCTION hybrid_search_knowledge (
+  query_text text,
+  query_embedding vector(768) DEFAULT NULL,
+  match_count int DEFAULT 5,
+  match_threshold float DEFAULT 0.7,
+  full_text_weight float DEFAULT 1.0,
+  semantic_weight float DEFAULT 1.0,
+  rrf_k int DEFAULT 60,
+  use_quantized boolean DEFAULT false
+)
+RETURNS TABLE (
+  id UUID,
+  content_chunk TEXT,
+  source_type TEXT,
+  metadata JSONB,
+  similarity float,
+  score float
+)
+LANGUAGE sql
+AS $$
+  WITH ts_query AS (
+    -- Términos unidos con OR: una pregunta en lenguaje natural no contiene todas las palabras del chunk
+    SELECT NULLIF(replace(plainto_tsquery('spanish', query_text)::text, ' & ', ' | '), '')::tsquery AS q
+  ),
+  full_text AS (
+    SELECT
+      kb.id,
+      row_number() OVER (ORDER BY ts_rank_cd(kb.fts, ts_query.q) DESC) AS rank_ix
+    FROM public.knowledge_base kb, ts_query
+    WHERE ts_query.q IS NOT NULL AND kb.fts @@ ts_query.q
+    ORDER BY rank_ix
+    LIMIT least(match_count, 30) * 2
+  ),
+  semantic AS (
+    -- Primero los vecinos del índice y después el umbral (si no, el filtro deja menos de match_count)
+    SELECT nn.id, row_number() OVER (ORDER BY nn.distance) AS rank_ix, 1 - nn.distance AS similarity
+    FROM knowledge_semantic_candidates(query_embedding, least(match_count, 30) * 2, use_quantized) nn
+    WHERE 1 - nn.distance > match_threshold
+  )
+  SELECT
+    kb.id,
+    kb.content_chunk,
+    kb.source_type,
+    kb.metadata,
+    semantic.similarity,
+    -- Normalizado: 1.0 = primer puesto en ambos rankings
+    (
+      coalesce(1.0 / (rrf_k + full_text.rank_ix), 0.0) * full_text_weight +
+      coalesce(1.0 / (rrf_k + semantic.rank_ix), 0.0) * semantic_weight
+    ) / ((full_text_weight + semantic_weight) / (rrf_k + 1)) AS score
+  FROM full_text
+  FULL OUTER JOIN semantic ON full_text.id = semantic.id
+  JOIN public.knowledge_base kb ON kb.id = coalesce(full_text.id, semantic.id)
+  ORDER BY score DESC
+  LIMIT match_count;
+$$;
+
+-- PASO OPCIONAL (solo con QUANTIZED_SEARCH=true en todos los workers del backend)
+-- Mientras exista, knowledge_base_embedding_idx sigue ocupando ~3 KB por vector en
+-- shared_buffers / RAM aunque ninguna búsqueda lo use. Para liberar esa memoria:
+--   DROP INDEX IF EXISTS knowledge_base_embedding_idx;
+-- Para volver a QUANTIZED_SEARCH=false hay que recrearlo antes de cambiar la variable
+-- (sin él las búsquedas sin cuantizar recorren toda la tabla):
+--   CREATE INDEX knowledge_base_embedding_idx ON public.knowledge_base
+--     USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
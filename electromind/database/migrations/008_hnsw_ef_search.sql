@@ -0,0 +1,242 @@
+-- AJUSTE DE HNSW POR REQUEST (ef_search)
+-- Las funciones de búsqueda aceptan ef_search (tamaño de la lista de candidatos del recorrido
+-- HNSW): más alto = mejor recall y más latencia. El backend lo elige por perfil de búsqueda
+-- (SEARCH_PROFILE / HNSW_EF_SEARCH_*) y benchmarks/hnsw_tuning.py mide recall@k vs. latencia.
+-- Además ef_search nunca queda por debajo de los candidatos pedidos: con el default (40)
+-- una búsqueda de 60 candidatos devolvía 40 filas sin avisar.
+--
+-- Para reconstruir el índice con los m / ef_construction elegidos por el harness:
+--   DROP INDEX IF EXISTS knowledge_base_embedding_idx;
+--   CREATE INDEX knowledge_base_embedding_idx ON public.knowledge_base
+--     USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+
+DROP FUNCTION IF EXISTS match_knowledge(vector, float, int, text, text, text, uuid);
+DROP FUNCTION IF EXISTS match_knowledge_quantized(vector, float, int, int, text, text, text, uuid);
+DROP FUNCTION IF EXISTS match_knowledge_batch(jsonb, float, uuid, boolean);
+DROP FUNCTION IF EXISTS hybrid_search_knowledge(text, vector, int, float, float, float, int, boolean, text, text, text, uuid);
+DROP FUNCTION IF EXISTS knowledge_semantic_candidates(vector, int, boolean, uuid, int, text, text, text, uuid);
+
+CREATE OR REPLACE FUNCTION knowledge_semantic_candidates (
+  query_embedding vector(768),
+  candidate_count int,
+  use_quantized boolean DEFAULT false,
+  exclude_source_id uuid DEFAULT NULL,
+  rerank_multiplier int DEFAULT 10,
+  filter_source_type text DEFAULT NULL,
+  filter_device_brand text DEFAULT NULL,
+  filter_device_model text DEFAULT NULL,
+  filter_document_id uuid DEFAULT NULL,
+  ef_search int DEFAULT NULL
+)
+RETURNS TABLE (
+  id UUID,
+  distance float
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF query_embedding IS NULL THEN
+    RETURN;
+  END IF;
+
+  IF filter_source_type IS NOT NULL OR filter_device_brand IS NOT NULL
+     OR filter_device_model IS NOT NULL OR filter_document_id IS NOT NULL THEN
+    -- MATERIALIZED: primero la porción filtrada (índices btree), después la distancia exacta
+    RETURN QUERY
+    WITH slice AS MATERIALIZED (
+      SELECT kb.id, kb.embedding
+      FROM public.knowledge_base kb
+      WHERE (exclude_source_id IS NULL OR kb.source_id IS DISTINCT FROM exclude_source_id)
+        AND (filter_source_type IS NULL OR kb.source_type = filter_source_type)
+        AND (filter_device_brand IS NULL OR lower(kb.metadata->>'device_brand') = lower(filter_device_brand))
+        AND (filter_device_model IS NULL OR lower(kb.metadata->>'device_model') = lower(filter_device_model))
+        AND (filter_document_id IS NULL OR kb.source_id = filter_document_id)
+    )
+    SELECT s.id, (s.embedding <=> query_embedding)::float AS distance
+    FROM slice s
+    ORDER BY distance
+    LIMIT candidate_count;
+  ELSIF use_quantized THEN
+    -- HNSW devuelve como mucho ef_search filas: alcanzar para todos los candidatos a re-ordenar
+    PERFORM set_config(
+      'hnsw.ef_search', greatest(coalesce(ef_search, 40), candidate_count * rerank_multiplier)::text, true
+    );
+    RETURN QUERY
+    SELECT c.id, (c.embedding <=> query_embedding)::float AS distance
+    FROM (
+      SELECT kb.id, kb.embedding
+      FROM public.knowledge_base kb
+      WHERE exclude_source_id IS NULL OR kb.source_id IS DISTINCT FROM exclude_source_id
+      ORDER BY binary_quantize(kb.embedding)::bit(768) <~> binary_quantize(query_embedding)
+      LIMIT candidate_count * rerank_multiplier
+    ) c
+    ORDER BY distance
+    LIMIT candidate_count;
+  ELSE
+    -- ef_search por request (perfil de búsqueda); nunca menos que los candidatos pedidos,
+    -- o el índice devolvería menos filas sin avisar
+    PERFORM set_config('hnsw.ef_search', greatest(coalesce(ef_search, 40), candidate_count)::text, true);
+    RETURN QUERY
+    SELECT kb.id, (kb.embedding <=> query_embedding)::float AS distance
+    FROM public.knowledge_base kb
+    WHERE exclude_source_id IS NULL OR kb.source_id IS DISTINCT FROM exclude_source_id
+    ORDER BY kb.embedding <=> query_embedding
+    LIMIT candidate_count;
+  END IF;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION match_knowledge (
+  query_embedding vector(768),
+  match_threshold float,
+  match_count int,
+  filter_source_type text DEFAULT NULL,
+  filter_device_brand text DEFAULT NULL,
+  filter_device_model text DEFAULT NULL,
+  filter_document_id uuid DEFAULT NULL,
+  ef_search int DEFAULT NULL
+)
+RETURNS TABLE (
+  id UUID,
+  content_chunk TEXT,
+  source_type TEXT,
+  metadata JSONB,
+  similarity float
+)
+LANGUAGE sql
+AS $$
+  -- El umbral se aplica a los vecinos ya encontrados, no dentro del recorrido del índice
+  SELECT kb.id, kb.content_chunk, kb.source_type, kb.metadata, 1 - c.distance AS similarity
+  FROM knowledge_semantic_candidates(
+    query_embedding, match_count, false, NULL, 10,
+    filter_source_type, filter_device_brand, filter_device_model, filter_document_id, ef_search
+  ) c
+  JOIN public.knowledge_base kb ON kb.id = c.id
+  WHERE 1 - c.distance > match_threshold
+  ORDER BY c.distance;
+$$;
+
+CREATE OR REPLACE FUNCTION match_knowledge_quantized (
+  query_embedding vector(768),
+  match_threshold float,
+  match_count int,
+  rerank_multiplier int DEFAULT 10,
+  filter_source_type text DEFAULT NULL,
+  filter_device_brand text DEFAULT NULL,
+  filter_device_model text DEFAULT NULL,
+  filter_document_id uuid DEFAULT NULL,
+  ef_search int DEFAULT NULL
+)
+RETURNS TABLE (
+  id UUID,
+  content_chunk TEXT,
+  source_type TEXT,
+  metadata JSONB,
+  similarity float
+)
+LANGUAGE sql
+AS $$
+  SELECT kb.id, kb.content_chunk, kb.source_type, kb.metadata, 1 - c.distance AS similarity
+  FROM knowledge_semantic_candidates(
+    query_embedding, match_count, true, NULL, rerank_multiplier,
+    filter_source_type, filter_device_brand, filter_device_model, filter_document_id, ef_search
+  ) c
+  JOIN public.knowledge_base kb ON kb.id = c.id
+  WHERE 1 - c.distance > match_threshold
+  ORDER BY c.distance;
+$$;
+
+CREATE OR REPLACE FUNCTION match_knowledge_batch (
+  query_embeddings jsonb,
+  match_threshold float,
+  exclude_source_id uuid DEFAULT NULL,
+  use_quantized boolean DEFAULT false,
+  ef_search int DEFAULT NULL
+)
+RETURNS TABLE (
+  idx int,
+  id UUID,
+  similarity float
+)
+LANGUAGE sql
+AS $$
+  SELECT
+    (q.ordinality - 1)::int AS idx,
+    m.id,
+    1 - m.distance AS similarity
+  FROM jsonb_array_elements(query_embeddings) WITH ORDINALITY AS q(embedding, ordinality)
+  CROSS JOIN LATERAL knowledge_semantic_candidates(
+    (q.embedding::text)::vector(768), 1, use_quantized, exclude_source_id, 10,
+    NULL, NULL, NULL, NULL, ef_search
+  ) m
+  WHERE 1 - m.distance > match_threshold;
+$$;
+
+CREATE OR REPLACE FUNCTION hybrid_search_knowledge (
+  query_text text,
+  query_embedding vector(768) DEFAULT NULL,
+  match_count int DEFAULT 5,
+  match_threshold float DEFAULT 0.7,
+  full_text_weight float DEFAULT 1.0,
+  semantic_weight float DEFAULT 1.0,
+  rrf_k int DEFAULT 60,
+  use_quantized boolean DEFAULT false,
+  filter_source_type text DEFAULT NULL,
+  filter_device_brand text DEFAULT NULL,
+  filter_device_model text DEFAULT NULL,
+  filter_document_id uuid DEFAULT NULL,
+  ef_search int DEFAULT NULL
+)
+RETURNS TABLE (
+  id UUID,
+  content_chunk TEXT,
+  source_type TEXT,
+  metadata JSONB,
+  similarity float,
+  score float
+)
+LANGUAGE sql
+AS $$
+  WITH ts_query AS (
+    -- Términos unidos con OR: una pregunta en lenguaje natural no contiene todas las palabras del chunk
+    SELECT NULLIF(replace(plainto_tsquery('spanish', query_text)::text, ' & ', ' | '), '')::tsquery AS q
+  ),
+  full_text AS (
+    SELECT
+      kb.id,
+      row_number() OVER (ORDER BY ts_rank_cd(kb.fts, ts_query.q) DESC) AS rank_ix
+    FROM public.knowledge_base kb, ts_query
+    WHERE ts_query.q IS NOT NULL AND kb.fts @@ ts_query.q
+      AND (filter_source_type IS NULL OR kb.source_type = filter_source_type)
+      AND (filter_device_brand IS NULL OR lower(kb.metadata->>'device_brand') = lower(filter_device_brand))
+      AND (filter_device_model IS NULL OR lower(kb.metadata->>'device_model') = lower(filter_device_model))
+      AND (filter_document_id IS NULL OR kb.source_id = filter_document_id)
+    ORDER BY rank_ix
+    LIMIT least(match_count, 30) * 2
+  ),
+  semantic AS (
+    -- Primero los vecinos del índice y después el umbral (si no, el filtro deja menos de match_count)
+    SELECT nn.id, row_number() OVER (ORDER BY nn.distance) AS rank_ix, 1 - nn.distance AS similarity
+    FROM knowledge_semantic_candidates(
+      query_embedding, least(match_count, 30) * 2, use_quantized, NULL, 10,
+      filter_source_type, filter_device_brand, filter_device_model, filter_document_id, ef_search
+    ) nn
+    WHERE 1 - nn.distance > match_threshold
+  )
+  SELECT
+    kb.id,
+    kb.content_chunk,
+    kb.source_type,
+    kb.metadata,
+    semantic.similarity,
+    -- Normalizado: 1.0 = primer puesto en ambos rankings
+    (
+      coalesce(1.0 / (rrf_k + full_text.rank_ix), 0.0) * full_text_weight +
+      coalesce(1.0 / (rrf_k + semantic.rank_ix), 0.0) * semantic_weight
+    ) / ((full_text_weight + semantic_weight) / (rrf_k + 1)) AS score
+  FROM full_text
+  FULL OUTER JOIN semantic ON full_text.id = semantic.id
+  JOIN public.knowledge_base kb ON kb.id = coalesce(full_text.id, semantic.id)
+  ORDER BY score DESC
+  LIMIT match_count;
+$$;
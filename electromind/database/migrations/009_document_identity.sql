@@ -0,0 +1,42 @@
+-- IDENTIDAD DEL DOCUMENTO = archivo + dispositivo
+-- Dos manuales distintos pueden llamarse igual ("manual.pdf" de dos equipos). Si el documento
+-- se identifica solo por file_path, re-ingestar uno borra los chunks del otro. La marca y el
+-- modelo forman parte de la identidad (el cliente también puede mandar el document_id).
+
+ALTER TABLE public.documents ADD COLUMN IF NOT EXISTS device_brand TEXT;
+ALTER TABLE public.documents ADD COLUMN IF NOT EXISTS device_model TEXT;
+
+DROP INDEX IF EXISTS idx_documents_file_path;
+CREATE INDEX IF NOT EXISTS idx_documents_identity ON public.documents (file_path, device_brand, device_model);
+
+DROP FUNCTION IF EXISTS document_chunk_hashes(uuid, text);
+
+-- Re-ingesta incremental: hashes de los chunks ya guardados de un documento.
+-- Adopta los chunks anteriores a la migración 005 (sin source_id) por metadata.source,
+-- solo si coincide también el dispositivo (así no se adoptan los de otro manual homónimo).
+CREATE OR REPLACE FUNCTION document_chunk_hashes (
+  p_document_id uuid,
+  p_source text,
+  p_device_brand text DEFAULT NULL,
+  p_device_model text DEFAULT NULL
+)
+RETURNS text[]
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  UPDATE public.knowledge_base
+  SET source_id = p_document_id
+  WHERE source_id IS NULL
+    AND source_type = 'manual'
+    AND metadata->>'source' = p_source
+    AND metadata->>'device_brand' IS NOT DISTINCT FROM p_device_brand
+    AND metadata->>'device_model' IS NOT DISTINCT FROM p_device_model;
+
+  RETURN coalesce(
+    (SELECT array_agg(DISTINCT kb.content_hash)
+     FROM public.knowledge_base kb
+     WHERE kb.source_id = p_document_id AND kb.content_hash IS NOT NULL),
+    '{}'
+  );
+END;
+$$;
@@ -0,0 +1,12 @@
+-- CORRECCIÓN DEL BACKFILL DE content_hash (migración 005)
+-- La versión anterior de 005 recortaba con btrim antes de colapsar los espacios: un chunk que
+-- empezaba o terminaba con salto de línea o tab quedaba hasheado como " texto " y no
+-- coincidía con el hash del backend (" ".join(text.split())). En la siguiente re-ingesta ese
+-- chunk se volvía a embeber y el original se borraba.
+-- Solo se tocan las filas cuyo hash es exactamente el del cálculo viejo y difiere del nuevo;
+-- los chunks guardados por el backend ya tienen el hash correcto.
+UPDATE public.knowledge_base
+SET content_hash = encode(sha256(convert_to(btrim(regexp_replace(content_chunk, '\s+', ' ', 'g')), 'UTF8')), 'hex')
+WHERE content_hash = encode(sha256(convert_to(regexp_replace(btrim(content_chunk), '\s+', ' ', 'g'), 'UTF8')), 'hex')
+  AND content_hash IS DISTINCT FROM
+      encode(sha256(convert_to(btrim(regexp_replace(content_chunk, '\s+', ' ', 'g')), 'UTF8')), 'hex');
@@ -0,0 +1,118 @@
+-- DEDUP DE RE-INGESTA: exclude_source_id CON SOBREMUESTREO
+-- match_knowledge_batch pide el vecino más cercano (candidate_count = 1) excluyendo el
+-- documento que se re-ingesta. El recorrido HNSW devolvía los vecinos del índice y recién
+-- después descartaba los del propio documento: en una re-ingesta el más cercano suele ser la
+-- versión anterior del mismo chunk, y al descartarlo podía no quedar nada, así que los
+-- duplicados reales en otros documentos no se detectaban.
+-- Ahora exclude_source_id se trata como el filtro de source_type (migración 010): recorrido
+-- iterativo de pgvector 0.8 si está disponible, y la subconsulta de candidatos pide
+-- candidate_count * 4 filas ya filtradas antes de quedarse con las candidate_count mejores.
+-- La firma no cambia.
+
+CREATE OR REPLACE FUNCTION knowledge_semantic_candidates (
+  query_embedding vector(768),
+  candidate_count int,
+  use_quantized boolean DEFAULT false,
+  exclude_source_id uuid DEFAULT NULL,
+  rerank_multiplier int DEFAULT 10,
+  filter_source_type text DEFAULT NULL,
+  filter_device_brand text DEFAULT NULL,
+  filter_device_model text DEFAULT NULL,
+  filter_document_id uuid DEFAULT NULL,
+  ef_search int DEFAULT NULL
+)
+RETURNS TABLE (
+  id UUID,
+  distance float
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  -- Con filtro de source_type o exclude_source_id el índice recorre de más: parte de lo que
+  -- devuelve se descarta
+  oversampling int := 1;
+BEGIN
+  IF query_embedding IS NULL THEN
+    RETURN;
+  END IF;
+
+  -- Filtros selectivos (un documento, una marca o un modelo): unos cientos o pocos miles de
+  -- chunks. Recorrer esa porción con distancia exacta es más barato que el HNSW y no pierde
+  -- recall. source_type solo divide la tabla en dos: la porción es casi toda la tabla y el
+  -- recorrido exacto crecería con ella, así que ese filtro va por el índice (rama de abajo).
+  IF filter_device_brand IS NOT NULL OR filter_device_model IS NOT NULL OR filter_document_id IS NOT NULL THEN
+    -- MATERIALIZED: primero la porción filtrada (índices btree), después la distancia exacta
+    RETURN QUERY
+    WITH slice AS MATERIALIZED (
+      SELECT kb.id, kb.embedding
+      FROM public.knowledge_base kb
+      WHERE (exclude_source_id IS NULL OR kb.source_id IS DISTINCT FROM exclude_source_id)
+        AND (filter_source_type IS NULL OR kb.source_type = filter_source_type)
+        AND (filter_device_brand IS NULL OR lower(kb.metadata->>'device_brand') = lower(filter_device_brand))
+        AND (filter_device_model IS NULL OR lower(kb.metadata->>'device_model') = lower(filter_device_model))
+        AND (filter_document_id IS NULL OR kb.source_id = filter_document_id)
+    )
+    SELECT s.id, (s.embedding <=> query_embedding)::float AS distance
+    FROM slice s
+    ORDER BY distance
+    LIMIT candidate_count;
+    RETURN;
+  END IF;
+
+  IF filter_source_type IS NOT NULL OR exclude_source_id IS NOT NULL THEN
+    -- El filtro se aplica después del recorrido del índice: con pgvector >= 0.8 el recorrido
+    -- iterativo sigue buscando hasta juntar las filas pedidas; antes de 0.8 solo queda
+    -- agrandar la lista de candidatos (oversampling) para no devolver menos filas.
+    -- exclude_source_id lo usa la dedup de una re-ingesta: los vecinos más cercanos suelen ser
+    -- la versión anterior del mismo chunk, que se descarta, y el duplicado real en otro
+    -- documento tiene que seguir en la lista
+    oversampling := 4;
+    BEGIN
+      PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    EXCEPTION WHEN OTHERS THEN
+      NULL;
+    END;
+  END IF;
+
+  IF use_quantized THEN
+    -- HNSW devuelve como mucho ef_search filas: alcanzar para todos los candidatos a re-ordenar
+    -- (1000 es el máximo que acepta pgvector)
+    PERFORM set_config(
+      'hnsw.ef_search',
+      least(1000, greatest(coalesce(ef_search, 40), candidate_count * rerank_multiplier * oversampling))::text,
+      true
+    );
+    RETURN QUERY
+    SELECT c.id, (c.embedding <=> query_embedding)::float AS distance
+    FROM (
+      SELECT kb.id, kb.embedding
+      FROM public.knowledge_base kb
+      WHERE (exclude_source_id IS NULL OR kb.source_id IS DISTINCT FROM exclude_source_id)
+        AND (filter_source_type IS NULL OR kb.source_type = filter_source_type)
+      ORDER BY binary_quantize(kb.embedding)::bit(768) <~> binary_quantize(query_embedding)
+      LIMIT candidate_count * rerank_multiplier * oversampling
+    ) c
+    ORDER BY distance
+    LIMIT candidate_count;
+  ELSE
+    -- ef_search por request (perfil de búsqueda); nunca menos que los candidatos pedidos,
+    -- o el índice devolvería menos filas sin avisar
+    PERFORM set_config(
+      'hnsw.ef_search', least(1000, greatest(coalesce(ef_search, 40), candidate_count * oversampling))::text, true
+    );
+    -- relaxed_order puede devolver el recorrido levemente desordenado: se re-ordena afuera
+    RETURN QUERY
+    SELECT c.id, c.distance
+    FROM (
+      SELECT kb.id, (kb.embedding <=> query_embedding)::float AS distance
+      FROM public.knowledge_base kb
+      WHERE (exclude_source_id IS NULL OR kb.source_id IS DISTINCT FROM exclude_source_id)
+        AND (filter_source_type IS NULL OR kb.source_type = filter_source_type)
+      ORDER BY kb.embedding <=> query_embedding
+      LIMIT candidate_count * oversampling
+    ) c
+    ORDER BY c.distance
+    LIMIT candidate_count;
+  END IF;
+END;
+$$;
@@ -1,6 +1,7 @@
 -- 1. EXTENSIONES
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 CREATE EXTENSION IF NOT EXISTS "vector"; 
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- 2. ENUMS
 CREATE TYPE user_role AS ENUM ('admin', 'technician', 'receptionist');
@@ -29,6 +30,7 @@ CREATE TABLE public.clients (
     notes TEXT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
+CREATE INDEX idx_clients_full_name_trgm ON public.clients USING gin (full_name gin_trgm_ops);
 
 -- 5. INVENTORY
 CREATE TABLE public.inventory (
@@ -68,6 +70,8 @@ CREATE TABLE public.tickets (
 );
 CREATE INDEX idx_tickets_status ON public.tickets(status);
 CREATE INDEX idx_tickets_client ON public.tickets(client_id);
+CREATE INDEX idx_tickets_created_keyset ON public.tickets(created_at DESC, id DESC);
+CREATE INDEX idx_tickets_status_created_keyset ON public.tickets(status, created_at DESC, id DESC);
 
 -- 7. TICKET HISTORY
 CREATE TABLE public.ticket_history (
@@ -88,45 +92,376 @@ CREATE TABLE public.documents (
     file_type TEXT, 
     description TEXT,
     uploaded_by UUID REFERENCES public.users(id),
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    version INT NOT NULL DEFAULT 0, -- se incrementa al completar cada (re)ingesta
+    -- Identidad del manual: file_path + dispositivo (dos "manual.pdf" distintos no se pisan)
+    device_brand TEXT,
+    device_model TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
+CREATE INDEX idx_documents_identity ON public.documents (file_path, device_brand, device_model);
 
 -- 9. KNOWLEDGE BASE (AI MEMORY)
 CREATE TABLE public.knowledge_base (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     source_type TEXT NOT NULL CHECK (source_type IN ('manual', 'ticket_solution')),
-    source_id UUID, 
+    source_id UUID REFERENCES public.documents(id) ON DELETE CASCADE,
     content_chunk TEXT NOT NULL,
+    content_hash TEXT, -- sha256 del texto normalizado (re-ingesta incremental)
     metadata JSONB, 
     embedding vector(768), 
+    fts tsvector GENERATED ALWAYS AS (to_tsvector('spanish', content_chunk)) STORED,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
-CREATE INDEX ON public.knowledge_base USING hnsw (embedding vector_cosine_ops);
+-- m / ef_construction: ver benchmarks/hnsw_tuning.py (los valores por defecto de pgvector).
+-- Con QUANTIZED_SEARCH=true no se usa y se puede omitir/borrar (paso opcional de la migración 006)
+CREATE INDEX knowledge_base_embedding_idx ON public.knowledge_base
+  USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+-- Índice cuantizado (1 bit por dimensión) para la búsqueda en dos etapas (QUANTIZED_SEARCH)
+CREATE INDEX idx_knowledge_base_embedding_bq ON public.knowledge_base
+  USING hnsw ((binary_quantize(embedding)::bit(768)) bit_hamming_ops);
+CREATE INDEX idx_knowledge_base_fts ON public.knowledge_base USING gin (fts);
+CREATE INDEX idx_knowledge_base_source_hash ON public.knowledge_base (source_id, content_hash);
+-- Filtros de la búsqueda (source_type, marca, modelo)
+CREATE INDEX idx_knowledge_base_source_type ON public.knowledge_base (source_type);
+CREATE INDEX idx_knowledge_base_device_brand ON public.knowledge_base (lower(metadata->>'device_brand'));
+CREATE INDEX idx_knowledge_base_device_model ON public.knowledge_base (lower(metadata->>'device_model'));
 
 -- FUNCTIONS
+-- Vecinos más cercanos (id, distancia coseno exacta), con o sin etapa cuantizada
+CREATE OR REPLACE FUNCTION knowledge_semantic_candidates (
+  query_embedding vector(768),
+  candidate_count int,
+  use_quantized boolean DEFAULT false,
+  exclude_source_id uuid DEFAULT NULL,
+  rerank_multiplier int DEFAULT 10,
+  filter_source_type text DEFAULT NULL,
+  filter_device_brand text DEFAULT NULL,
+  filter_device_model text DEFAULT NULL,
+  filter_document_id uuid DEFAULT NULL,
+  ef_search int DEFAULT NULL
+)
+RETURNS TABLE (
+  id UUID,
+  distance float
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  -- Con filtro de source_type o exclude_source_id el índice recorre de más: parte de lo que
+  -- devuelve se descarta
+  oversampling int := 1;
+BEGIN
+  IF query_embedding IS NULL THEN
+    RETURN;
+  END IF;
+
+  -- Filtros selectivos (un documento, una marca o un modelo): unos cientos o pocos miles de
+  -- chunks. Recorrer esa porción con distancia exacta es más barato que el HNSW y no pierde
+  -- recall. source_type solo divide la tabla en dos: la porción es casi toda la tabla y el
+  -- recorrido exacto crecería con ella, así que ese filtro va por el índice (rama de abajo).
+  IF filter_device_brand IS NOT NULL OR filter_device_model IS NOT NULL OR filter_document_id IS NOT NULL THEN
+    -- MATERIALIZED: primero la porción filtrada (índices btree), después la distancia exacta
+    RETURN QUERY
+    WITH slice AS MATERIALIZED (
+      SELECT kb.id, kb.embedding
+      FROM public.knowledge_base kb
+      WHERE (exclude_source_id IS NULL OR kb.source_id IS DISTINCT FROM exclude_source_id)
+        AND (filter_source_type IS NULL OR kb.source_type = filter_source_type)
+        AND (filter_device_brand IS NULL OR lower(kb.metadata->>'device_brand') = lower(filter_device_brand))
+        AND (filter_device_model IS NULL OR lower(kb.metadata->>'device_model') = lower(filter_device_model))
+        AND (filter_document_id IS NULL OR kb.source_id = filter_document_id)
+    )
+    SELECT s.id, (s.embedding <=> query_embedding)::float AS distance
+    FROM slice s
+    ORDER BY distance
+    LIMIT candidate_count;
+    RETURN;
+  END IF;
+
+  IF filter_source_type IS NOT NULL OR exclude_source_id IS NOT NULL THEN
+    -- El filtro se aplica después del recorrido del índice: con pgvector >= 0.8 el recorrido
+    -- iterativo sigue buscando hasta juntar las filas pedidas; antes de 0.8 solo queda
+    -- agrandar la lista de candidatos (oversampling) para no devolver menos filas.
+    -- exclude_source_id lo usa la dedup de una re-ingesta: los vecinos más cercanos suelen ser
+    -- la versión anterior del mismo chunk, que se descarta, y el duplicado real en otro
+    -- documento tiene que seguir en la lista
+    oversampling := 4;
+    BEGIN
+      PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    EXCEPTION WHEN OTHERS THEN
+      NULL;
+    END;
+  END IF;
+
+  IF use_quantized THEN
+    -- HNSW devuelve como mucho ef_search filas: alcanzar para todos los candidatos a re-ordenar
+    -- (1000 es el máximo que acepta pgvector)
+    PERFORM set_config(
+      'hnsw.ef_search',
+      least(1000, greatest(coalesce(ef_search, 40), candidate_count * rerank_multiplier * oversampling))::text,
+      true
+    );
+    RETURN QUERY
+    SELECT c.id, (c.embedding <=> query_embedding)::float AS distance
+    FROM (
+      SELECT kb.id, kb.embedding
+      FROM public.knowledge_base kb
+      WHERE (exclude_source_id IS NULL OR kb.source_id IS DISTINCT FROM exclude_source_id)
+        AND (filter_source_type IS NULL OR kb.source_type = filter_source_type)
+      ORDER BY binary_quantize(kb.embedding)::bit(768) <~> binary_quantize(query_embedding)
+      LIMIT candidate_count * rerank_multiplier * oversampling
+    ) c
+    ORDER BY distance
+    LIMIT candidate_count;
+  ELSE
+    -- ef_search por request (perfil de búsqueda); nunca menos que los candidatos pedidos,
+    -- o el índice devolvería menos filas sin avisar
+    PERFORM set_config(
+      'hnsw.ef_search', least(1000, greatest(coalesce(ef_search, 40), candidate_count * oversampling))::text, true
+    );
+    -- relaxed_order puede devolver el recorrido levemente desordenado: se re-ordena afuera
+    RETURN QUERY
+    SELECT c.id, c.distance
+    FROM (
+      SELECT kb.id, (kb.embedding <=> query_embedding)::float AS distance
+      FROM public.knowledge_base kb
+      WHERE (exclude_source_id IS NULL OR kb.source_id IS DISTINCT FROM exclude_source_id)
+        AND (filter_source_type IS NULL OR kb.source_type = filter_source_type)
+      ORDER BY kb.embedding <=> query_embedding
+      LIMIT candidate_count * oversampling
+    ) c
+    ORDER BY c.distance
+    LIMIT candidate_count;
+  END IF;
+END;
+$$;
+
 CREATE OR REPLACE FUNCTION match_knowledge (
   query_embedding vector(768),
   match_threshold float,
-  match_count int
+  match_count int,
+  filter_source_type text DEFAULT NULL,
+  filter_device_brand text DEFAULT NULL,
+  filter_device_model text DEFAULT NULL,
+  filter_document_id uuid DEFAULT NULL,
+  ef_search int DEFAULT NULL
 )
 RETURNS TABLE (
   id UUID,
   content_chunk TEXT,
   source_type TEXT,
+  metadata JSONB,
   similarity float
 )
-LANGUAGE plpgsql
+LANGUAGE sql
+AS $$
+  -- El umbral se aplica a los vecinos ya encontrados, no dentro del recorrido del índice
+  SELECT kb.id, kb.content_chunk, kb.source_type, kb.metadata, 1 - c.distance AS similarity
+  FROM knowledge_semantic_candidates(
+    query_embedding, match_count, false, NULL, 10,
+    filter_source_type, filter_device_brand, filter_device_model, filter_document_id, ef_search
+  ) c
+  JOIN public.knowledge_base kb ON kb.id = c.id
+  WHERE 1 - c.distance > match_threshold
+  ORDER BY c.distance;
+$$;
+
+-- Igual que match_knowledge pero en dos etapas (candidatos cuantizados + re-ranking exacto)
+CREATE OR REPLACE FUNCTION match_knowledge_quantized (
+  query_embedding vector(768),
+  match_threshold float,
+  match_count int,
+  rerank_multiplier int DEFAULT 10,
+  filter_source_type text DEFAULT NULL,
+  filter_device_brand text DEFAULT NULL,
+  filter_device_model text DEFAULT NULL,
+  filter_document_id uuid DEFAULT NULL,
+  ef_search int DEFAULT NULL
+)
+RETURNS TABLE (
+  id UUID,
+  content_chunk TEXT,
+  source_type TEXT,
+  metadata JSONB,
+  similarity float
+)
+LANGUAGE sql
+AS $$
+  SELECT kb.id, kb.content_chunk, kb.source_type, kb.metadata, 1 - c.distance AS similarity
+  FROM knowledge_semantic_candidates(
+    query_embedding, match_count, true, NULL, rerank_multiplier,
+    filter_source_type, filter_device_brand, filter_device_model, filter_document_id, ef_search
+  ) c
+  JOIN public.knowledge_base kb ON kb.id = c.id
+  WHERE 1 - c.distance > match_threshold
+  ORDER BY c.distance;
+$$;
+
+-- Dedup en lote para la ingesta (una llamada por lote de embeddings).
+-- Ignora los chunks del mismo documento: dentro de un documento manda el hash.
+CREATE OR REPLACE FUNCTION match_knowledge_batch (
+  query_embeddings jsonb,
+  match_threshold float,
+  exclude_source_id uuid DEFAULT NULL,
+  use_quantized boolean DEFAULT false,
+  ef_search int DEFAULT NULL
+)
+RETURNS TABLE (
+  idx int,
+  id UUID,
+  similarity float
+)
+LANGUAGE sql
 AS $$
-BEGIN
-  RETURN QUERY
+  SELECT
+    (q.ordinality - 1)::int AS idx,
+    m.id,
+    1 - m.distance AS similarity
+  FROM jsonb_array_elements(query_embeddings) WITH ORDINALITY AS q(embedding, ordinality)
+  CROSS JOIN LATERAL knowledge_semantic_candidates(
+    (q.embedding::text)::vector(768), 1, use_quantized, exclude_source_id, 10,
+    NULL, NULL, NULL, NULL, ef_search
+  ) m
+  WHERE 1 - m.distance > match_threshold;
+$$;
+
+-- Búsqueda híbrida (texto completo + vectores) fusionada con Reciprocal Rank Fusion
+CREATE OR REPLACE FUNCTION hybrid_search_knowledge (
+  query_text text,
+  query_embedding vector(768) DEFAULT NULL,
+  match_count int DEFAULT 5,
+  match_threshold float DEFAULT 0.7,
+  full_text_weight float DEFAULT 1.0,
+  semantic_weight float DEFAULT 1.0,
+  rrf_k int DEFAULT 60,
+  use_quantized boolean DEFAULT false,
+  filter_source_type text DEFAULT NULL,
+  filter_device_brand text DEFAULT NULL,
+  filter_device_model text DEFAULT NULL,
+  filter_document_id uuid DEFAULT NULL,
+  ef_search int DEFAULT NULL
+)
+RETURNS TABLE (
+  id UUID,
+  content_chunk TEXT,
+  source_type TEXT,
+  metadata JSONB,
+  similarity float,
+  score float
+)
+LANGUAGE sql
+AS $$
+  WITH ts_query AS (
+    -- Términos unidos con OR: una pregunta en lenguaje natural no contiene todas las palabras del chunk
+    SELECT NULLIF(replace(plainto_tsquery('spanish', query_text)::text, ' & ', ' | '), '')::tsquery AS q
+  ),
+  full_text AS (
+    SELECT
+      kb.id,
+      row_number() OVER (ORDER BY ts_rank_cd(kb.fts, ts_query.q) DESC) AS rank_ix
+    FROM public.knowledge_base kb, ts_query
+    WHERE ts_query.q IS NOT NULL AND kb.fts @@ ts_query.q
+      AND (filter_source_type IS NULL OR kb.source_type = filter_source_type)
+      AND (filter_device_brand IS NULL OR lower(kb.metadata->>'device_brand') = lower(filter_device_brand))
+      AND (filter_device_model IS NULL OR lower(kb.metadata->>'device_model') = lower(filter_device_model))
+      AND (filter_document_id IS NULL OR kb.source_id = filter_document_id)
+    ORDER BY rank_ix
+    LIMIT least(match_count, 30) * 2
+  ),
+  semantic AS (
+    -- Primero los vecinos del índice y después el umbral (si no, el filtro deja menos de match_count)
+    SELECT nn.id, row_number() OVER (ORDER BY nn.distance) AS rank_ix, 1 - nn.distance AS similarity
+    FROM knowledge_semantic_candidates(
+      query_embedding, least(match_count, 30) * 2, use_quantized, NULL, 10,
+      filter_source_type, filter_device_brand, filter_device_model, filter_document_id, ef_search
+    ) nn
+    WHERE 1 - nn.distance > match_threshold
+  )
   SELECT
     kb.id,
     kb.content_chunk,
     kb.source_type,
-    1 - (kb.embedding <=> query_embedding) as similarity
-  FROM public.knowledge_base kb
-  WHERE 1 - (kb.embedding <=> query_embedding) > match_threshold
-  ORDER BY kb.embedding <=> query_embedding
+    kb.metadata,
+    semantic.similarity,
+    -- Normalizado: 1.0 = primer puesto en ambos rankings
+    (
+      coalesce(1.0 / (rrf_k + full_text.rank_ix), 0.0) * full_text_weight +
+      coalesce(1.0 / (rrf_k + semantic.rank_ix), 0.0) * semantic_weight
+    ) / ((full_text_weight + semantic_weight) / (rrf_k + 1)) AS score
+  FROM full_text
+  FULL OUTER JOIN semantic ON full_text.id = semantic.id
+  JOIN public.knowledge_base kb ON kb.id = coalesce(full_text.id, semantic.id)
+  ORDER BY score DESC
   LIMIT match_count;
+$$;
+
+-- Re-ingesta incremental: hashes de los chunks ya guardados de un documento.
+-- Adopta los chunks anteriores a la migración 005 (sin source_id) por metadata.source,
+-- solo si coincide también el dispositivo (así no se adoptan los de otro manual homónimo).
+CREATE OR REPLACE FUNCTION document_chunk_hashes (
+  p_document_id uuid,
+  p_source text,
+  p_device_brand text DEFAULT NULL,
+  p_device_model text DEFAULT NULL
+)
+RETURNS text[]
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  UPDATE public.knowledge_base
+  SET source_id = p_document_id
+  WHERE source_id IS NULL
+    AND source_type = 'manual'
+    AND metadata->>'source' = p_source
+    AND metadata->>'device_brand' IS NOT DISTINCT FROM p_device_brand
+    AND metadata->>'device_model' IS NOT DISTINCT FROM p_device_model;
+
+  RETURN coalesce(
+    (SELECT array_agg(DISTINCT kb.content_hash)
+     FROM public.knowledge_base kb
+     WHERE kb.source_id = p_document_id AND kb.content_hash IS NOT NULL),
+    '{}'
+  );
+END;
+$$;
+
+-- Cierra una versión del documento: borra los chunks cuyo hash ya no está,
+-- renumera chunk_index según la nueva posición e incrementa la versión.
+-- Devuelve los ids borrados (para sacarlos del índice en memoria).
+CREATE OR REPLACE FUNCTION sync_document_chunks (
+  p_document_id uuid,
+  p_hashes text[]
+)
+RETURNS uuid[]
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  deleted uuid[];
+BEGIN
+  WITH removed AS (
+    DELETE FROM public.knowledge_base kb
+    WHERE kb.source_id = p_document_id
+      AND (kb.content_hash IS NULL OR NOT (kb.content_hash = ANY (p_hashes)))
+    RETURNING kb.id
+  )
+  SELECT coalesce(array_agg(id), '{}') INTO deleted FROM removed;
+
+  UPDATE public.knowledge_base kb
+  SET metadata = jsonb_set(coalesce(kb.metadata, '{}'::jsonb), '{chunk_index}', to_jsonb(pos.idx - 1))
+  FROM (
+    SELECT h.hash, min(h.idx) AS idx
+    FROM unnest(p_hashes) WITH ORDINALITY AS h(hash, idx)
+    GROUP BY h.hash
+  ) pos
+  WHERE kb.source_id = p_document_id
+    AND kb.content_hash = pos.hash
+    AND (kb.metadata->>'chunk_index') IS DISTINCT FROM (pos.idx - 1)::text;
+
+  UPDATE public.documents
+  SET version = version + 1, updated_at = NOW()
+  WHERE id = p_document_id;
+
+  RETURN deleted;
 END;
 $$;